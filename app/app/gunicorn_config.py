@@ -0,0 +1,60 @@
+"""
+Gunicorn config for app project.
+
+Run the app with ``python manage.py serve`` or directly with
+``gunicorn -c python:app.gunicorn_config app.wsgi:application``.
+Every setting can be changed with the environment variable next to it.
+
+For more information on this file, see
+https://docs.gunicorn.org/en/stable/settings.html
+"""
+
+import multiprocessing
+import os
+
+# Socket
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+backlog = int(os.getenv("GUNICORN_BACKLOG", "2048"))
+
+# Workers, sized to the CPUs of the host
+# sync workers run one request at a time and wait on the database, so run
+# two per CPU plus one. ASGI workers run an event loop each, so run one
+# per CPU.
+ASGI = os.getenv("GUNICORN_ASGI", "False") == "True"
+if ASGI:
+    worker_class = "uvicorn.workers.UvicornWorker"
+    default_workers = multiprocessing.cpu_count()
+else:
+    worker_class = "sync"
+    default_workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv("GUNICORN_WORKERS", default_workers))
+
+# Worker recycling
+# a worker is replaced after about max_requests requests, which bounds the
+# memory it can leak. The jitter keeps workers from restarting together.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Preloading
+# Django and the apps are imported once in the master before the workers
+# fork, so the workers share those pages copy-on-write and start at once.
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+# Logging
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def pre_fork(server, worker):
+    """Close the connections the master opened while loading the app
+
+    A forked worker would share the socket of an open connection with the
+    master and the other workers, so each has to open its own.
+    """
+    from django.db import connections
+
+    connections.close_all()
@@ -54,13 +54,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
-    "corsheaders.middleware.CorsMiddleware",
-    "django.middleware.common.CommonMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
-    "django.contrib.messages.middleware.MessageMiddleware",
-    "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.metrics.MetricsMiddleware",
+    "core.routers.ReplicaMiddleware",
+    "core.middleware.SecurityMiddleware",
+    "core.middleware.SessionMiddleware",
+    "core.middleware.CorsMiddleware",
+    "core.middleware.CommonMiddleware",
+    "core.middleware.AuthenticationMiddleware",
+    "core.middleware.MessageMiddleware",
+    "core.middleware.XFrameOptionsMiddleware",
 ]
 
 ROOT_URLCONF = "app.urls"
@@ -87,13 +89,57 @@ WSGI_APPLICATION = "app.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Connections are kept for DB_CONN_MAX_AGE seconds and checked before their
+# first query of each request. DB_POOL_MAX_SIZE > 0 shares a bounded pool
+# of connections between the threads of each process, with
+# DB_CONN_MAX_AGE=0 they go back to the pool after each request.
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "core.backends.postgresql",
         "NAME": os.environ.get("POSTGRES_DB"),
         "USER": os.environ.get("POSTGRES_USER"),
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": "db",
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "True")
+        == "True",
+        "POOL": {
+            "MAX_SIZE": int(os.getenv("DB_POOL_MAX_SIZE", "0")),
+            "TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        },
+    }
+}
+
+# Read replicas
+# DB_REPLICA_HOSTS lists the hosts of streaming replicas of the default
+# database, comma separated. The list, statement and summary endpoints read
+# from them, except for a client that wrote in the last REPLICA_PIN_SECONDS.
+
+DATABASE_REPLICAS = []
+for host in filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")):
+    alias = f"replica_{len(DATABASE_REPLICAS) + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.routers.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "5"))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Defaults to a per process cache, set CACHE_BACKEND and CACHE_LOCATION to a
+# memcached server to share it between workers
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND")
+        or "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
     }
 }
 
@@ -159,7 +205,7 @@ AUTHENTICATION_BACKENDS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "user.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -167,6 +213,126 @@ REST_FRAMEWORK = {
 }
 
 
+# Largest number of transfers accepted by one batch transfer request
+
+BATCH_TRANSFER_MAX_SIZE = int(os.getenv("BATCH_TRANSFER_MAX_SIZE", "10000"))
+
+
+# Serve the transfer and list endpoints with coroutine views, on by default
+# under app/asgi.py; under WSGI every async view would start an event loop
+
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False") == "True"
+
+
+# Rows the running totals of each bank are spread over, more rows let more
+# transfers of one bank commit concurrently
+
+BANK_TOTAL_SLOTS = int(os.getenv("BANK_TOTAL_SLOTS", "8"))
+
+
+# Idempotency keys of the fund and transfer endpoints, kept for TTL seconds
+
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_CACHE = os.getenv("IDEMPOTENCY_CACHE", "default")
+
+
+# Token to user cache of the token authentication, per process entries live
+# for TTL seconds, the shared cache alias is optional
+
+TOKEN_AUTH_CACHE_SIZE = int(os.getenv("TOKEN_AUTH_CACHE_SIZE", "10000"))
+TOKEN_AUTH_CACHE_TTL = int(os.getenv("TOKEN_AUTH_CACHE_TTL", "30"))
+TOKEN_AUTH_SHARED_CACHE = os.getenv("TOKEN_AUTH_SHARED_CACHE", "")
+TOKEN_AUTH_SHARED_CACHE_TTL = int(
+    os.getenv("TOKEN_AUTH_SHARED_CACHE_TTL", "300")
+)
+
+
+# Rate limits of the money moving endpoints per transfer type, per user and
+# per source account, as requests/period with the period in s, min, hour or
+# day, an empty limit turns it off. Buckets are kept per process, set
+# RATE_LIMIT_CACHE to a shared cache alias to count across workers as well
+
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "True") == "True"
+RATE_LIMITS = {
+    "intra_bank_transfer": {
+        "user": os.getenv("RATE_LIMIT_TRANSFER_USER", "120/min"),
+        "account": os.getenv("RATE_LIMIT_TRANSFER_ACCOUNT", "60/min"),
+    },
+    "inter_bank_transfer": {
+        "user": os.getenv("RATE_LIMIT_INTER_BANK_USER", "60/min"),
+        "account": os.getenv("RATE_LIMIT_INTER_BANK_ACCOUNT", "30/min"),
+    },
+    "add_fund": {
+        "user": os.getenv("RATE_LIMIT_ADD_FUND_USER", "60/min"),
+        "account": os.getenv("RATE_LIMIT_ADD_FUND_ACCOUNT", "30/min"),
+    },
+    "remove_fund": {
+        "user": os.getenv("RATE_LIMIT_REMOVE_FUND_USER", "60/min"),
+        "account": os.getenv("RATE_LIMIT_REMOVE_FUND_ACCOUNT", "30/min"),
+    },
+}
+RATE_LIMIT_BUCKETS = int(os.getenv("RATE_LIMIT_BUCKETS", "100000"))
+RATE_LIMIT_CACHE = os.getenv("RATE_LIMIT_CACHE", "")
+
+
+# Cache of the bank and account directory, entries are versioned so the TTL
+# only bounds how long unused generations take space
+
+DIRECTORY_CACHE = os.getenv("DIRECTORY_CACHE", "default")
+DIRECTORY_CACHE_TTL = int(os.getenv("DIRECTORY_CACHE_TTL", "3600"))
+
+
+# Transfers fetched per round trip by the server side cursors of statements
+
+STATEMENT_CHUNK_SIZE = int(os.getenv("STATEMENT_CHUNK_SIZE", "2000"))
+
+
+# Directory of the transfer months archived to files by archive_transfers
+
+TRANSFER_ARCHIVE_DIR = os.getenv("TRANSFER_ARCHIVE_DIR", "archive")
+
+
+# Uploaded files, the transfer files imported from the admin site are kept
+# under imports/
+
+MEDIA_ROOT = os.getenv("MEDIA_ROOT", "media")
+TRANSFER_IMPORT_CHUNK_SIZE = int(
+    os.getenv("TRANSFER_IMPORT_CHUNK_SIZE", "5000")
+)
+
+
+# Transactional outbox
+# relay_outbox publishes the pending events to OUTBOX_SINKS, comma separated
+# names of built in sinks (file, queue, webhook) or dotted paths of Sink
+# classes. Published events are deleted after OUTBOX_KEEP_HOURS.
+
+OUTBOX_SINKS = os.getenv("OUTBOX_SINKS", "file").split(",")
+OUTBOX_FILE_PATH = os.getenv("OUTBOX_FILE_PATH", "outbox.ndjson")
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL", "")
+OUTBOX_WEBHOOK_TIMEOUT = float(os.getenv("OUTBOX_WEBHOOK_TIMEOUT", "5"))
+OUTBOX_KEEP_HOURS = int(os.getenv("OUTBOX_KEEP_HOURS", "24"))
+
+
+# Inter-bank settlement
+# settle_transfers nets the queued inter-bank transfers every
+# SETTLEMENT_INTERVAL seconds, at most SETTLEMENT_MAX_TRANSFERS per cycle
+
+SETTLEMENT_INTERVAL = float(os.getenv("SETTLEMENT_INTERVAL", "60"))
+SETTLEMENT_MAX_TRANSFERS = int(
+    os.getenv("SETTLEMENT_MAX_TRANSFERS", "1000000")
+)
+
+
+# Request metrics exposed at /metrics, requests slower than the threshold
+# are logged with the SQL of their slowest queries, 0 turns the log off
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+METRICS_SLOW_REQUEST_MS = float(
+    os.getenv("METRICS_SLOW_REQUEST_MS", "500")
+)
+METRICS_SLOW_QUERY_COUNT = int(os.getenv("METRICS_SLOW_QUERY_COUNT", "3"))
+
+
 # YASG settings
 
 SWAGGER_SETTINGS = {
@@ -20,6 +20,9 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from core.metrics import metrics_view
+from core.views import readiness_view
+
 
 SchemaView = get_schema_view(
     openapi.Info(
@@ -61,6 +64,8 @@ urlpatterns = [
     path("redoc/", SchemaView.with_ui("redoc", cache_timeout=0), name="redoc"),
     path("admin/", admin.site.urls),
     path("api-auth/", include("rest_framework.urls")),
+    path("metrics", metrics_view, name="metrics"),
+    path("ready", readiness_view, name="ready"),
     path("", include("user.urls")),
     path("", include("bank.urls")),
 ]
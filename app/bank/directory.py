@@ -0,0 +1,169 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from bank.serializers import AccountSerializer, BankSerializer
+from core.models import Account, Bank
+
+
+BANKS_SCOPE = "banks"
+
+
+def get_cache():
+    return caches[settings.DIRECTORY_CACHE]
+
+
+def get_bank_scope(bank_uuid) -> str:
+    return f"bank:{bank_uuid}"
+
+
+def get_generation(scope: str) -> int:
+    """Return the current generation of a directory scope
+
+    A missing counter starts from the clock, so it never goes back to a
+    generation whose entries may still be cached.
+
+    Args:
+        scope (str): BANKS_SCOPE or a bank scope
+
+    Returns:
+        int: the generation
+    """
+    cache = get_cache()
+    key = f"directory:{scope}:generation"
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key, time.time_ns())
+    return generation
+
+
+def bump_generation(*scopes: str) -> None:
+    """Move directory scopes to a new generation
+
+    The scopes are bumped now and again on commit, so a reader that misses
+    the cache before the writer commits can not keep the old rows cached
+    under the new generation.
+
+    Args:
+        scopes (str): scopes whose cached listings are stale
+    """
+
+    def bump():
+        cache = get_cache()
+        for scope in scopes:
+            key = f"directory:{scope}:generation"
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_bank_list_cached():
+    """Return the generation and data of the bank list from the cache only
+
+    Returns:
+        tuple: the generation and serialized data, or None when the list
+        of the current generation is not cached
+    """
+    generation = get_generation(BANKS_SCOPE)
+    data = get_cache().get(f"directory:{BANKS_SCOPE}:{generation}")
+    if data is None:
+        return None
+    return generation, data
+
+
+def get_bank_list() -> tuple:
+    """Return the generation and serialized data of the bank list"""
+    cached = get_bank_list_cached()
+    if cached is not None:
+        return cached
+    generation = get_generation(BANKS_SCOPE)
+    data = list(BankSerializer(Bank.objects.all(), many=True).data)
+    get_cache().set(
+        f"directory:{BANKS_SCOPE}:{generation}",
+        data,
+        settings.DIRECTORY_CACHE_TTL,
+    )
+    return generation, data
+
+
+def get_account_list(bank_uuid) -> list:
+    """Return the serialized accounts of a bank with fresh balances
+
+    Names and uuids are read through the cache and merged with the
+    balances of a single query.
+
+    Args:
+        bank_uuid (UUID): uuid of the bank
+
+    Returns:
+        list: the serialized accounts
+    """
+    generation = get_generation(get_bank_scope(bank_uuid))
+    key = f"directory:{get_bank_scope(bank_uuid)}:{generation}"
+    cache = get_cache()
+    accounts = cache.get(key)
+    if accounts is None:
+        accounts = [
+            (account.id, dict(AccountSerializer(account).data))
+            for account in Account.objects.filter(bank__uuid=bank_uuid)
+            .select_related("bank")
+            .with_shard_balance()
+        ]
+        cache.set(key, accounts, settings.DIRECTORY_CACHE_TTL)
+
+    balances = {
+        pk: balance + shard_balance
+        for pk, balance, shard_balance in Account.objects.filter(
+            bank__uuid=bank_uuid
+        )
+        .with_shard_balance()
+        .values_list("id", "balance", "shard_balance")
+    }
+    balance_field = AccountSerializer().fields["balance"]
+    data = []
+    for pk, account in accounts:
+        if pk in balances:
+            data.append(
+                {
+                    **account,
+                    "balance": balance_field.to_representation(balances[pk]),
+                }
+            )
+    return data
+
+
+def etag_response(request, data, etag: str = None) -> Response:
+    """Return data with an ETag, or 304 when the client has it already
+
+    Args:
+        request (Request): the current request
+        data: the response data
+        etag (str): the entity tag, a digest of data when not given
+
+    Returns:
+        Response: the 200 or 304 response
+    """
+    if etag is None:
+        content = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+        etag = hashlib.sha256(content.encode()).hexdigest()
+    etag = quote_etag(etag)
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(
+            status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    return Response(data, headers={"ETag": etag})
@@ -0,0 +1,136 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from drf_yasg import openapi
+
+from core.models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+IDEMPOTENCY_KEY_PARAMETER = openapi.Parameter(
+    IDEMPOTENCY_HEADER,
+    openapi.IN_HEADER,
+    description="Unique client key, a retry with the same key returns the "
+    "first response without repeating the request",
+    type=openapi.TYPE_STRING,
+)
+
+
+def get_scoped_key(request, client_key: str) -> str:
+    """Return a digest of the client key scoped by user, method and path"""
+    user_id = request.user.pk if request.user.is_authenticated else ""
+    scope = f"{user_id}:{request.method}:{request.path}:{client_key}"
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+def get_fingerprint(request) -> str:
+    """Return a digest of the request data"""
+    data = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def replay(stored: tuple, fingerprint: str) -> Response:
+    """Return the stored response, unless the key was used for other data"""
+    stored_fingerprint, status_code, data = stored
+    if stored_fingerprint != fingerprint:
+        return Response(
+            {
+                "detail": f"{IDEMPOTENCY_HEADER} was already used for a "
+                "different request"
+            },
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        data, status=status_code, headers={REPLAYED_HEADER: "true"}
+    )
+
+
+def idempotent(view):
+    """
+    Make a DRF function view idempotent over the Idempotency-Key header
+    Successful responses are stored in the database and the idempotency
+    cache and replayed for the key until it expires, without running the
+    view again. The key row is inserted in the same transaction as the
+    view's writes, so a concurrent retry waits for it and then replays.
+    Failed responses are not stored and can be retried with the same key.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        client_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not client_key:
+            return view(request, *args, **kwargs)
+        if len(client_key) > 255:
+            return Response(
+                {"detail": f"{IDEMPOTENCY_HEADER} is longer than 255"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        key = get_scoped_key(request, client_key)
+        fingerprint = get_fingerprint(request)
+        cache = caches[settings.IDEMPOTENCY_CACHE]
+        cache_key = f"idempotency:{key}"
+        now = timezone.now()
+
+        stored = cache.get(cache_key)
+        if stored is None:
+            stored = (
+                IdempotencyKey.objects.filter(key=key, expires_at__gt=now)
+                .values_list("fingerprint", "status_code", "response")
+                .first()
+            )
+        if stored is not None:
+            return replay(stored, fingerprint)
+
+        with transaction.atomic():
+            # an expired key not purged yet would block the insert
+            IdempotencyKey.objects.filter(
+                key=key, expires_at__lte=now
+            ).delete()
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=now
+                        + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                    )
+            except IntegrityError:
+                # a concurrent request with the same key committed first
+                stored = (
+                    IdempotencyKey.objects.filter(key=key)
+                    .values_list("fingerprint", "status_code", "response")
+                    .get()
+                )
+                return replay(stored, fingerprint)
+
+            response = view(request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                transaction.set_rollback(True)
+                return response
+
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=["status_code", "response"])
+
+        cache.set(
+            cache_key,
+            (fingerprint, record.status_code, record.response),
+            settings.IDEMPOTENCY_KEY_TTL,
+        )
+        return response
+
+    return wrapper
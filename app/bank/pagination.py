@@ -0,0 +1,132 @@
+import heapq
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination on (created, id), newest first
+    The cursor holds the position of the last returned row, so every page
+    is an index range scan no matter how deep it is
+    """
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_querysets(self, querysets: list, request, view=None) -> list:
+        """Return one page of the merged querysets
+
+        Each queryset is range scanned separately and the results merged,
+        so an OR over two indexed columns runs as two index scans.
+
+        Args:
+            querysets (list): querysets of the same model
+            request (Request): the current request
+
+        Returns:
+            list: the page of model instances
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        arms = []
+        for queryset in querysets:
+            if position is not None:
+                created, pk = position
+                queryset = queryset.filter(
+                    Q(created__lte=created) & ~Q(created=created, id__gte=pk)
+                )
+            arms.append(
+                queryset.order_by("-created", "-id")[: self.page_size + 1]
+            )
+
+        page, seen = [], set()
+        for instance in heapq.merge(
+            *arms,
+            key=lambda instance: (instance.created, instance.id),
+            reverse=True,
+        ):
+            # a row can match more than one queryset
+            if instance.id in seen:
+                continue
+            seen.add(instance.id)
+            page.append(instance)
+            if len(page) > self.page_size:
+                break
+
+        self.has_next = len(page) > self.page_size
+        self.page = page[: self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        return self.paginate_querysets([queryset], request, view=view)
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
+
+    def get_paginated_response_schema(self, schema) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            self.encode_cursor(last.created, last.id),
+        )
+
+    def encode_cursor(self, created, pk: int) -> str:
+        """Encode a (created, id) position as an opaque cursor"""
+        position = f"{created.isoformat()}|{pk}".encode("ascii")
+        return urlsafe_b64encode(position).decode("ascii")
+
+    def decode_cursor(self, request):
+        """Decode the cursor query param to a (created, id) position"""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            created, pk = (
+                urlsafe_b64decode(cursor.encode("ascii"))
+                .decode("ascii")
+                .split("|")
+            )
+            created = parse_datetime(created)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created, pk
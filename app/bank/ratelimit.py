@@ -0,0 +1,230 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework import status
+from rest_framework.response import Response
+
+
+RETRY_AFTER_HEADER = "Retry-After"
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate: str):
+    """Return the (requests, seconds) of a requests/period rate, or None
+
+    The period is the first letter of s, min, hour or day, as in
+    "60/min". An empty rate is no limit.
+    """
+    if not rate:
+        return None
+    requests, period = rate.split("/")
+    return int(requests), PERIODS[period[0]]
+
+
+class LocalTokenBuckets:
+    """
+    Thread safe in process token buckets, the least recently used are
+    dropped past max_size
+    A bucket holds up to limit tokens and refills at limit per period, so
+    it allows bursts of limit requests and limit per period on average.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def refill(self, key: str, limit: int, period: float, now: float):
+        """Return the tokens of the bucket of key at now"""
+        tokens, updated_at = self.buckets.get(key, (limit, now))
+        return min(limit, tokens + (now - updated_at) * limit / period)
+
+    def peek(self, key: str, limit: int, period: float) -> float:
+        """Return 0 when the bucket of key has a token, else the seconds
+        until the next one, without taking it"""
+        now = time.monotonic()
+        with self.lock:
+            tokens = self.refill(key, limit, period, now)
+        return 0 if tokens >= 1 else (1 - tokens) * period / limit
+
+    def take(self, key: str, limit: int, period: float, max_size: int):
+        """Take a token from the bucket of key
+
+        Returns:
+            float: 0 when a token was taken, else the seconds until the
+            next one
+        """
+        now = time.monotonic()
+        with self.lock:
+            tokens = self.refill(key, limit, period, now)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) * period / limit
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > max_size:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        with self.lock:
+            self.buckets.clear()
+
+
+local_buckets = LocalTokenBuckets()
+
+
+def get_shared_cache():
+    """Return the shared rate limit cache, or None when it is turned off"""
+    alias = settings.RATE_LIMIT_CACHE
+    return caches[alias] if alias else None
+
+
+def get_window_keys(key: str, period: float):
+    """Return the keys of the current and previous windows of key, and the
+    part of the current window remaining"""
+    now = time.time() / period
+    window = int(now)
+    return (
+        f"ratelimit:{key}:{window}",
+        f"ratelimit:{key}:{window - 1}",
+        1 - (now - window),
+    )
+
+
+def get_shared_wait(cache, key: str, limit: int, period: float) -> float:
+    """Return the seconds until a request of key fits in its sliding window
+    in the shared cache, 0 when it fits now
+
+    The window is estimated from the counters of the current and the
+    previous fixed window, the previous one weighted by how much of it
+    the window still covers, so a check costs one get_many whatever the
+    rate.
+    """
+    current_key, previous_key, remaining = get_window_keys(key, period)
+    counts = cache.get_many([current_key, previous_key])
+    current = counts.get(current_key, 0)
+    previous = counts.get(previous_key, 0)
+    excess = previous * remaining + current + 1 - limit
+    if excess <= 0:
+        return 0
+    if current + 1 > limit or not previous:
+        # the counter of this window is spent, wait for the next one
+        return remaining * period
+    return min(excess / previous, remaining) * period
+
+
+def count_shared(cache, key: str, period: float) -> None:
+    """Count a request of key in the current window of the shared cache
+
+    Counters are incremented atomically, two workers racing for the last
+    request of a window may both get it.
+    """
+    current_key = get_window_keys(key, period)[0]
+    if not cache.add(current_key, 1, period * 2):
+        try:
+            cache.incr(current_key)
+        except ValueError:
+            # expired between the add and the incr
+            cache.set(current_key, 1, period * 2)
+
+
+def get_wait(key: str, rate: str) -> float:
+    """Return the seconds a request of key at rate has to wait, 0 when
+    allowed, without counting it
+
+    The local bucket is checked first, it turns away a client over its
+    limit without a round trip to the shared cache, which bounds the
+    requests of all workers.
+    """
+    limit = parse_rate(rate)
+    if limit is None:
+        return 0
+    requests, period = limit
+    wait = local_buckets.peek(key, requests, period)
+    if wait:
+        return wait
+    shared_cache = get_shared_cache()
+    if shared_cache is None:
+        return 0
+    return get_shared_wait(shared_cache, key, requests, period)
+
+
+def take(key: str, rate: str) -> None:
+    """Count an allowed request of key at rate, in the local bucket and in
+    the shared cache"""
+    limit = parse_rate(rate)
+    if limit is None:
+        return
+    requests, period = limit
+    local_buckets.take(key, requests, period, settings.RATE_LIMIT_BUCKETS)
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        count_shared(shared_cache, key, period)
+
+
+def get_client_key(request) -> str:
+    """Return the user of the request, or its address when anonymous"""
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"address:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def rate_limited(transfer_type: str, account: str):
+    """
+    Limit the requests of a DRF function view per user and per account
+    The limits of transfer_type in RATE_LIMITS are checked before the view
+    runs, so a client over a limit costs no query. It gets a 429 with a
+    Retry-After header. account names the URL argument or the request
+    field holding the uuid of the account the money leaves or reaches.
+    Put it under api_view and idempotent, so a replayed response is not
+    counted.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not settings.RATE_LIMITS_ENABLED:
+                return view(request, *args, **kwargs)
+            limits = settings.RATE_LIMITS.get(transfer_type, {})
+            account_id = kwargs.get(account)
+            if account_id is None and isinstance(request.data, dict):
+                account_id = request.data.get(account)
+            keys = {"user": get_client_key(request)}
+            if account_id:
+                # bounded, the field is not validated yet
+                keys["account"] = f"account:{str(account_id)[:64]}"
+            rates = {
+                f"{transfer_type}:{key}": (scope, limits.get(scope, ""))
+                for scope, key in keys.items()
+            }
+            # every limit is checked before any is counted, a request turned
+            # away by one does not use up the others
+            for key, (scope, rate) in rates.items():
+                wait = get_wait(key, rate)
+                if wait:
+                    retry_after = math.ceil(wait)
+                    return Response(
+                        {
+                            "detail": f"Too many requests for this {scope}, "
+                            f"retry in {retry_after} s"
+                        },
+                        status=status.HTTP_429_TOO_MANY_REQUESTS,
+                        headers={RETRY_AFTER_HEADER: str(retry_after)},
+                    )
+            for key, (scope, rate) in rates.items():
+                take(key, rate)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -1,10 +1,18 @@
 from decimal import Decimal
+from django.conf import settings
 from rest_framework import serializers
 
-from core.models import Bank, Account, Transfer
+from core.metrics import TimedSerializerMixin
+from core.models import (
+    Bank,
+    Account,
+    Transfer,
+    InsufficientFunds,
+    ScheduledTransfer,
+)
 
 
-class BankSerializer(serializers.ModelSerializer):
+class BankSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Bank serializer
     Returns all fields except id
@@ -14,19 +22,25 @@ class BankSerializer(serializers.ModelSerializer):
         exclude = ["id"]
 
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Account serializer
     Returns all fields except id
     """
     bank = BankSerializer()
+    balance = serializers.DecimalField(
+        source="total_balance",
+        decimal_places=2,
+        max_digits=18,
+        read_only=True,
+    )
 
     class Meta:
         model = Account
-        exclude = ["id"]
+        exclude = ["id", "shard_count"]
 
 
-class TransferSerializer(serializers.ModelSerializer):
+class TransferSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Transfer Serializer"""
 
     src_bank = BankSerializer(required=False)
@@ -44,8 +58,48 @@ class TransferSerializer(serializers.ModelSerializer):
         exclude = ["id"]
         depth = 2
 
+    def to_representation(self, instance):
+        # shard sums annotated by TransferQuerySet.with_shard_balances
+        for field in ("source", "destination"):
+            shard_balance = getattr(instance, f"{field}_shard_balance", None)
+            if shard_balance is not None and getattr(instance, field):
+                getattr(instance, field).shard_balance = shard_balance
+        return super().to_representation(instance)
+
     def create(self, validated_data):
-        return super().create(validated_data)
+        try:
+            return super().create(validated_data)
+        except InsufficientFunds:
+            # balance changed between validation and the atomic debit
+            raise serializers.ValidationError(
+                {"source": "Account does not have enough fund"}
+            )
+
+
+class FlatTransferSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    """
+    Read only transfer serializer
+    Related accounts and banks are returned as uuid and name, built
+    directly instead of field by field for large pages
+    """
+
+    amount_field = serializers.DecimalField(decimal_places=2, max_digits=18)
+    created_field = serializers.DateTimeField()
+
+    def to_representation(self, instance):
+        representation = {
+            "amount": self.amount_field.to_representation(instance.amount),
+            "info": instance.info,
+            "transfer_type": instance.transfer_type,
+            "created": self.created_field.to_representation(
+                instance.created
+            ),
+        }
+        for field in ("source", "destination", "src_bank", "dst_bank"):
+            related = getattr(instance, field)
+            representation[field] = related and str(related.uuid)
+            representation[f"{field}_name"] = related and related.name
+        return representation
 
 
 class FundSerializer(TransferSerializer):
@@ -115,3 +169,185 @@ class IntraBankTransferSerializer(TransferSerializer):
             )
 
         return attrs
+
+
+class InterBankTransferSerializer(TransferSerializer):
+    """
+    Transfer serializer for inter bank transfer type
+    The transfer is queued and its destination credited when it is
+    settled, see core.settlement
+    """
+
+    source = serializers.SlugRelatedField(
+        slug_field="uuid", queryset=Account.objects.all()
+    )
+
+    destination = serializers.SlugRelatedField(
+        slug_field="uuid", queryset=Account.objects.all()
+    )
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        source: Account = attrs.get("source")
+        destination: Account = attrs.get("destination")
+        amount: Decimal = attrs.get("amount")
+
+        # validates for inter-bank transfer
+        if source.is_intra_bank_account(destination):
+            raise serializers.ValidationError(
+                {"destination": "Destination is in the source bank"}
+            )
+
+        # validates that balance is sufficient
+        elif not source.is_balance_sufficient(amount):
+            raise serializers.ValidationError(
+                {"source": "Account does not have enough fund"}
+            )
+
+        return attrs
+
+    def create(self, validated_data):
+        try:
+            return Transfer.objects.create_inter_bank(
+                validated_data["source"],
+                validated_data["destination"],
+                validated_data["amount"],
+                validated_data["info"],
+            )
+        except InsufficientFunds:
+            # balance changed between validation and the atomic debit
+            raise serializers.ValidationError(
+                {"source": "Account does not have enough fund"}
+            )
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        # the transfer has no destination until it is settled
+        settlement = instance.settlement
+        representation["destination"] = str(settlement.destination.uuid)
+        representation["status"] = (
+            "settled" if settlement.cycle_id else "queued"
+        )
+        return representation
+
+
+class ScheduledTransferSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
+    """
+    Scheduled transfer serializer
+    The first occurrence is at starts_at, accounts are given by uuid
+    """
+
+    source = serializers.SlugRelatedField(
+        slug_field="uuid", queryset=Account.objects.all()
+    )
+
+    destination = serializers.SlugRelatedField(
+        slug_field="uuid", queryset=Account.objects.all()
+    )
+
+    # setting $1 to be min transfer
+    amount = serializers.DecimalField(
+        required=True, decimal_places=2, max_digits=18, min_value=1.00
+    )
+
+    class Meta:
+        model = ScheduledTransfer
+        exclude = ["id"]
+        read_only_fields = [
+            "next_run_at",
+            "occurrences",
+            "failures",
+            "last_run_at",
+            "last_error",
+        ]
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs["source"] == attrs["destination"]:
+            raise serializers.ValidationError(
+                {"destination": "Destination is the source account"}
+            )
+        ends_at = attrs.get("ends_at")
+        if ends_at is not None and ends_at < attrs["starts_at"]:
+            raise serializers.ValidationError(
+                {"ends_at": "Ends before the schedule starts"}
+            )
+        return attrs
+
+    def create(self, validated_data):
+        validated_data["next_run_at"] = validated_data["starts_at"]
+        return super().create(validated_data)
+
+
+class BatchTransferItemSerializer(
+    TimedSerializerMixin, serializers.Serializer
+):
+    """Input serializer for one transfer of a batch"""
+
+    source = serializers.UUIDField()
+    destination = serializers.UUIDField()
+    amount = serializers.DecimalField(
+        decimal_places=2, max_digits=18, min_value=1.00
+    )
+    info = serializers.CharField(max_length=255)
+
+
+class BatchTransferSerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Batch intra bank transfer serializer
+    Items are validated one by one, so an invalid item does not fail
+    the whole batch
+    """
+
+    transfers = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=settings.BATCH_TRANSFER_MAX_SIZE,
+    )
+
+    def create(self, validated_data):
+        """Create the valid transfers and return the per item results"""
+        item_serializer = BatchTransferItemSerializer()
+        created = serializers.DateTimeField()
+
+        results = []
+        items, indexes = [], []
+        for index, data in enumerate(validated_data["transfers"]):
+            try:
+                items.append(item_serializer.run_validation(data))
+                indexes.append(index)
+                results.append(None)
+            except serializers.ValidationError as error:
+                results.append(
+                    {
+                        "index": index,
+                        "status": "failed",
+                        "errors": error.detail,
+                    }
+                )
+
+        transfers = Transfer.objects.create_intra_bank_batch(items)
+        for index, item, transfer in zip(indexes, items, transfers):
+            if not isinstance(transfer, Transfer):
+                results[index] = {
+                    "index": index,
+                    "status": "failed",
+                    "errors": transfer,
+                }
+                continue
+            results[index] = {
+                "index": index,
+                "status": "created",
+                "transfer": {
+                    "source": str(item["source"]),
+                    "destination": str(item["destination"]),
+                    "amount": str(transfer.amount),
+                    "info": transfer.info,
+                    "transfer_type": transfer.transfer_type,
+                    "created": created.to_representation(transfer.created),
+                },
+            }
+
+        return results
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from bank.directory import BANKS_SCOPE, bump_generation, get_bank_scope
+from core.models import Account, Bank
+
+
+# saves that only move money leave the directory as it is
+BALANCE_FIELDS = {"balance", "shard_count"}
+
+
+@receiver(post_save, sender=Bank)
+@receiver(post_delete, sender=Bank)
+def bank_changed_receiver(sender, instance: Bank, **kwargs) -> None:
+    """
+    Drop the cached bank list and the accounts nesting the bank
+    """
+    bump_generation(BANKS_SCOPE, get_bank_scope(instance.uuid))
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def account_changed_receiver(
+    sender, instance: Account, update_fields=None, **kwargs
+) -> None:
+    """
+    Drop the cached accounts of the account's bank
+    """
+    if update_fields and set(update_fields) <= BALANCE_FIELDS:
+        return
+    try:
+        bank = instance.bank
+    except Bank.DoesNotExist:
+        # deleted along with its bank, which dropped the listing already
+        return
+    bump_generation(get_bank_scope(bank.uuid))
@@ -0,0 +1,243 @@
+import csv
+import heapq
+import json
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from rest_framework.exceptions import ValidationError
+
+from core.models import Account, Bank, Transfer
+from core.partitions import get_archived_before
+
+
+STATEMENT_COLUMNS = (
+    "created",
+    "transfer_type",
+    "info",
+    "counterparty",
+    "counterparty_name",
+    "amount",
+    "balance",
+)
+
+TRANSFER_FIELDS = (
+    "id",
+    "created",
+    "transfer_type",
+    "info",
+    "amount",
+    "source_id",
+    "destination_id",
+    "src_bank_id",
+    "dst_bank_id",
+)
+
+# rows joined into one chunk of the streamed response
+ROWS_PER_CHUNK = 100
+
+
+def parse_bound(value: str, name: str, end: bool = False):
+    """Parse a date or datetime query param
+
+    A date starts at midnight, or ends at the next midnight for the end
+    bound, in the current time zone.
+
+    Args:
+        value (str): the query param value
+        name (str): the query param name, for the error
+        end (bool): whether the value is the end of the range
+
+    Returns:
+        datetime: the aware bound, or None when not given
+    """
+    if not value:
+        return None
+    bound = parse_datetime(value)
+    if bound is None:
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: "Enter a valid date or datetime"})
+        if end:
+            day += timedelta(days=1)
+        bound = datetime.combine(day, time.min)
+    if timezone.is_naive(bound):
+        bound = timezone.make_aware(bound)
+    return bound
+
+
+def get_opening_balance(account: Account, start=None) -> Decimal:
+    """Return the balance of the account just before start
+
+    Without start it is the opening balance of the ledger, the balance
+    before its first entry, so the rows of every transfer add up to the
+    current balance.
+    """
+    if start is not None:
+        return account.balance_as_of(start - timedelta(microseconds=1))
+    opening = (
+        account.balance_snapshots.filter(last_entry_id=0)
+        .values_list("balance", flat=True)
+        .first()
+    )
+    return opening if opening is not None else Decimal(0)
+
+
+def iter_transfers(account: Account, start=None, end=None):
+    """Yield the transfers of the account oldest first
+
+    The sent and received transfers are read by two server side cursors,
+    each an index range scan on (account, created), and merged, so the
+    first rows arrive without sorting the whole history. Related rows are
+    not joined, a join makes the planner sort the history up front.
+    """
+    queryset = Transfer.objects.order_by("created", "id").values_list(
+        *TRANSFER_FIELDS, named=True
+    )
+    if start is not None:
+        queryset = queryset.filter(created__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created__lt=end)
+
+    chunk_size = settings.STATEMENT_CHUNK_SIZE
+    last_id = None
+    for transfer in heapq.merge(
+        queryset.filter(source_id=account.pk).iterator(chunk_size),
+        queryset.filter(destination_id=account.pk).iterator(chunk_size),
+        key=lambda transfer: (transfer.created, transfer.id),
+    ):
+        if transfer.id != last_id:
+            last_id = transfer.id
+            yield transfer
+
+
+class Counterparties:
+    """
+    Uuid and name of the accounts and banks on the other side of the
+    statement, read in bulk for each chunk of transfers and kept in a
+    bounded map
+    """
+
+    max_size = 10000
+
+    def __init__(self) -> None:
+        self.known = {}
+
+    def load(self, transfers: list) -> None:
+        """Read the counterparties of the transfers not known yet"""
+        missing = {Account: set(), Bank: set()}
+        for transfer in transfers:
+            for model, pk in (
+                (Account, transfer.source_id),
+                (Account, transfer.destination_id),
+                (Bank, transfer.src_bank_id),
+                (Bank, transfer.dst_bank_id),
+            ):
+                if pk is not None and (model, pk) not in self.known:
+                    missing[model].add(pk)
+        if len(self.known) + sum(map(len, missing.values())) > self.max_size:
+            self.known.clear()
+        for model, pks in missing.items():
+            for pk, uuid, name in model.objects.filter(
+                pk__in=pks
+            ).values_list("pk", "uuid", "name"):
+                self.known[(model, pk)] = (str(uuid), name)
+
+    def get(self, model, pk) -> tuple:
+        return self.known.get((model, pk), ("", ""))
+
+
+def iter_statement_rows(account: Account, start=None, end=None):
+    """Yield statement rows with the running balance of the account
+
+    The rows are read in a transaction, outside of one the server side
+    cursors are declared WITH HOLD and materialize the whole result before
+    the first row. The transaction is opened on the database the reads are
+    routed to, a replica for a replica_reads view, so the opening balance
+    and the rows come from the same one. Archived transfers are left out,
+    the statement then starts at the archive cutoff with the balance the
+    ledger gives.
+    """
+    archived_before = get_archived_before()
+    if archived_before is not None and (
+        start is None or start < archived_before
+    ):
+        start = archived_before
+    with transaction.atomic(using=router.db_for_read(Transfer)):
+        balance = get_opening_balance(account, start)
+        counterparties = Counterparties()
+        transfers = iter_transfers(account, start, end)
+        while True:
+            chunk = list(islice(transfers, ROWS_PER_CHUNK))
+            if not chunk:
+                return
+            counterparties.load(chunk)
+            for transfer in chunk:
+                amount = Decimal(0)
+                if transfer.destination_id == account.pk:
+                    amount += transfer.amount
+                if transfer.source_id == account.pk:
+                    amount -= transfer.amount
+                balance += amount
+
+                if transfer.source_id == account.pk:
+                    counterparty = (
+                        counterparties.get(Account, transfer.destination_id)
+                        if transfer.destination_id
+                        else counterparties.get(Bank, transfer.dst_bank_id)
+                    )
+                else:
+                    counterparty = (
+                        counterparties.get(Account, transfer.source_id)
+                        if transfer.source_id
+                        else counterparties.get(Bank, transfer.src_bank_id)
+                    )
+                yield {
+                    "created": transfer.created.isoformat(),
+                    "transfer_type": transfer.transfer_type,
+                    "info": transfer.info,
+                    "counterparty": counterparty[0],
+                    "counterparty_name": counterparty[1],
+                    "amount": str(amount),
+                    "balance": str(balance),
+                }
+
+
+class Echo:
+    """File like object whose write returns the written value"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def stream_csv(rows):
+    """Yield the rows as CSV, a chunk of lines at a time"""
+    writer = csv.DictWriter(Echo(), fieldnames=STATEMENT_COLUMNS)
+    lines = [writer.writeheader()]
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def stream_ndjson(rows):
+    """Yield the rows as newline delimited JSON, a chunk at a time"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row) + "\n")
+        if len(lines) >= ROWS_PER_CHUNK:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
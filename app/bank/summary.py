@@ -0,0 +1,148 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from core.models import Account, Checkpoint, DailyTransferRollup, Transfer
+
+
+PERIODS = ("day", "week", "month")
+
+CENT = Decimal("0.01")
+
+
+def get_rolled_through():
+    """Return the last day complete in the rollups, or None"""
+    reached_at = (
+        Checkpoint.objects.filter(name=DailyTransferRollup.CHECKPOINT)
+        .values_list("reached_at", flat=True)
+        .first()
+    )
+    if reached_at is None:
+        return None
+    return timezone.localdate(reached_at) - timedelta(days=1)
+
+
+def get_rollup_totals(account: Account, start, end, period: str):
+    """Return the rollup totals of the days in [start, end] per bucket"""
+    return (
+        DailyTransferRollup.objects.filter(
+            account=account, day__gte=start, day__lte=end
+        )
+        .annotate(
+            bucket=Trunc("day", period, output_field=models.DateField())
+        )
+        .values("bucket", "transfer_type")
+        .annotate(
+            total_count=Sum("count"),
+            total_credit=Sum("credit"),
+            total_debit=Sum("debit"),
+        )
+        .order_by()
+    )
+
+
+def get_live_totals(account: Account, start, end, period: str) -> list:
+    """Return the transfer totals of the days in [start, end] per bucket
+
+    The received and sent transfers are aggregated separately, each over
+    its (account, created) index.
+    """
+    start = timezone.make_aware(datetime.combine(start, time.min))
+    end = timezone.make_aware(
+        datetime.combine(end + timedelta(days=1), time.min)
+    )
+    transfers = Transfer.objects.filter(created__gte=start, created__lt=end)
+
+    rows = []
+    for side, field in (("credit", "destination"), ("debit", "source")):
+        for row in (
+            transfers.filter(**{field: account})
+            .annotate(
+                bucket=Trunc(
+                    "created", period, output_field=models.DateField()
+                )
+            )
+            .values("bucket", "transfer_type")
+            .annotate(total_count=Count("id"), total=Sum("amount"))
+            .order_by()
+        ):
+            rows.append(
+                {
+                    "bucket": row["bucket"],
+                    "transfer_type": row["transfer_type"],
+                    "total_count": row["total_count"],
+                    "total_credit": row["total"] if side == "credit" else 0,
+                    "total_debit": row["total"] if side == "debit" else 0,
+                }
+            )
+    return rows
+
+
+def get_summary(account: Account, start, end, period: str) -> dict:
+    """Return the transfer totals of the account per type and per period
+
+    Days already complete in the rollups are read from them, at most one
+    row per day and type, and only the days after from the transfers.
+
+    Args:
+        account (Account): the account
+        start (date): first day of the range
+        end (date): last day of the range
+        period (str): day, week or month
+
+    Returns:
+        dict: totals per transfer type and per period and transfer type
+    """
+    rows = []
+    rolled_through = get_rolled_through()
+    live_start = start
+    if rolled_through is not None and rolled_through >= start:
+        rows.extend(
+            get_rollup_totals(
+                account, start, min(end, rolled_through), period
+            )
+        )
+        live_start = rolled_through + timedelta(days=1)
+    if live_start <= end:
+        rows.extend(get_live_totals(account, live_start, end, period))
+
+    by_type = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    by_period = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for row in rows:
+        for key, totals in (
+            (row["transfer_type"], by_type),
+            ((row["bucket"], row["transfer_type"]), by_period),
+        ):
+            totals[key][0] += row["total_count"]
+            totals[key][1] += row["total_credit"] or 0
+            totals[key][2] += row["total_debit"] or 0
+
+    def serialize(count, credit, debit) -> dict:
+        return {
+            "count": count,
+            "credit": str(credit.quantize(CENT)),
+            "debit": str(debit.quantize(CENT)),
+        }
+
+    return {
+        "start": start,
+        "end": end,
+        "period": period,
+        "by_type": [
+            {"transfer_type": transfer_type, **serialize(*totals)}
+            for transfer_type, totals in sorted(by_type.items())
+        ],
+        "by_period": [
+            {
+                "period": bucket,
+                "transfer_type": transfer_type,
+                **serialize(*totals),
+            }
+            for (bucket, transfer_type), totals in sorted(by_period.items())
+        ],
+    }
@@ -0,0 +1,296 @@
+import asyncio
+import gc
+import json
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TransactionTestCase
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from bank.async_views import (
+    AsyncBankListView,
+    AsyncViewMixin,
+    AsyncTransferListView,
+    async_add_fund,
+    async_make_transfer,
+    async_remove_fund,
+)
+from bank.statements import STATEMENT_COLUMNS
+from core.db import database_sync_to_async
+from core.metrics import DB_QUERIES, MetricsMiddleware
+from core.middleware import MessageMiddleware, SessionMiddleware
+from core.models import Account, Bank, Transfer
+from core.utils import sample_bank, sample_account, sample_user
+from user.authentication import local_token_cache
+
+
+class AsyncViewTests(TransactionTestCase):
+    """Test the coroutine versions of the transfer and list views"""
+
+    def setUp(self) -> None:
+        cache.clear()
+        local_token_cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.token = Token.objects.create(user=sample_user())
+
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=100)
+        self.account_2 = sample_account(bank=self.bank, name="second")
+
+    def tearDown(self) -> None:
+        # the worker threads end with the loop of each call, their kept
+        # connections close once collected, before the database is dropped
+        gc.collect()
+
+    def call(self, view, path: str, data=None, **kwargs):
+        """Run an async view with the token of the test user, a GET without
+        data and a PUT with it"""
+        # the async factory takes header names as they are sent
+        headers = {"authorization": f"Token {self.token.key}"}
+        if data is None:
+            request = self.factory.get(path, **headers)
+        else:
+            request = self.factory.put(
+                path,
+                json.dumps(data),
+                content_type="application/json",
+                **headers,
+            )
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_views_are_coroutines(self):
+        """Test the views run on the event loop"""
+        for view in (
+            AsyncBankListView.as_view(),
+            async_make_transfer,
+            async_add_fund,
+        ):
+            self.assertTrue(asyncio.iscoroutinefunction(view))
+
+    def test_bank_list(self):
+        """Test the bank list, first from the database then the cache"""
+        view = AsyncBankListView.as_view()
+
+        res_1 = self.call(view, "/bank/")
+        res_2 = self.call(view, "/bank/")
+
+        self.assertEqual(res_1.status_code, 200)
+        self.assertEqual(json.loads(res_1.content)[0]["name"], "testname")
+        self.assertEqual(res_1.content, res_2.content)
+        self.assertEqual(res_1["Content-Type"], "application/json")
+
+    def test_bank_list_runs_once(self):
+        """Test a cold bank list runs its handler once, in a worker thread,
+        and a cached one on the event loop"""
+        view = AsyncBankListView.as_view()
+        handle = AsyncBankListView.handle
+
+        with patch.object(
+            AsyncBankListView, "handle", autospec=True, side_effect=handle
+        ) as handled:
+            self.call(view, "/bank/")
+        self.assertEqual(handled.call_count, 1)
+
+        with patch(
+            "bank.async_views.database_sync_to_async",
+            side_effect=AssertionError("left the event loop"),
+        ):
+            res = self.call(view, "/bank/")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.content)[0]["name"], "testname")
+
+    def test_cookies_kept(self):
+        """Test the cookies set by a view reach the rendered response"""
+
+        class CookieView(AsyncViewMixin, APIView):
+            authentication_classes = []
+            permission_classes = []
+
+            def get(self, request):
+                response = Response({})
+                response.set_cookie("seen", "1")
+                return response
+
+        res = async_to_sync(CookieView.as_view())(self.factory.get("/"))
+
+        self.assertEqual(res.cookies["seen"].value, "1")
+
+    def test_transfer_and_funds(self):
+        """Test the write views change the balances"""
+        res_1 = self.call(
+            async_make_transfer,
+            "/transfer/",
+            {
+                "source": str(self.account_1.uuid),
+                "destination": str(self.account_2.uuid),
+                "amount": 30,
+                "info": "rent",
+            },
+        )
+        res_2 = self.call(
+            async_add_fund,
+            "/add/",
+            {"src_bank": str(self.bank.uuid), "amount": 5, "info": "fund"},
+            account_id=self.account_2.uuid,
+        )
+        res_3 = self.call(
+            async_remove_fund,
+            "/retire/",
+            {"amount": 500, "info": "too much"},
+            account_id=self.account_2.uuid,
+        )
+
+        self.assertEqual(res_1.status_code, 201)
+        self.assertEqual(res_2.status_code, 201)
+        self.assertEqual(res_3.status_code, 400)
+        self.assertEqual(
+            Account.objects.get(pk=self.account_2.pk).balance, 35
+        )
+        self.assertEqual(Transfer.objects.count(), 2)
+
+    def test_transfer_list(self):
+        """Test the transfer list pages through the transfers"""
+        for _ in range(3):
+            Transfer.objects.create(
+                destination=self.account_1,
+                src_bank=self.bank,
+                amount=1,
+                transfer_type=Transfer.ADD_FUND,
+            )
+
+        res = self.call(
+            AsyncTransferListView.as_view(),
+            "/list/",
+            account_id=self.account_1.uuid,
+        )
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(json.loads(res.content)["results"]), 3)
+
+    def test_unauthenticated(self):
+        """Test a request without a token is rejected"""
+        request = self.factory.get("/bank/")
+
+        res = async_to_sync(AsyncBankListView.as_view())(request)
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_metrics_count_worker_queries(self):
+        """Test the async middleware counts the queries of worker threads"""
+        DB_QUERIES.clear()
+
+        async def view(request):
+            await database_sync_to_async(Bank.objects.count)()
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(view)
+        async_to_sync(middleware)(self.factory.get("/bank/"))
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(DB_QUERIES.series[("unmatched", "GET")][1], 1)
+
+    def test_middleware_hook_touching_database(self):
+        """Test a session saved by the inline middleware reaches the
+        database from the shared thread"""
+
+        async def view(request):
+            request.session["bank"] = str(self.bank.uuid)
+            return HttpResponse()
+
+        middleware = SessionMiddleware(view)
+        process_response = middleware.process_response
+        with patch.object(
+            middleware, "process_response", side_effect=process_response
+        ) as processed:
+            res = async_to_sync(middleware)(self.factory.get("/bank/"))
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(processed.call_count, 1)
+        self.assertIn("sessionid", res.cookies)
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_middleware_hooks_decided_up_front(self):
+        """Test only the hooks that will write run on the shared thread"""
+
+        async def view(request):
+            return HttpResponse()
+
+        request = self.factory.get("/bank/")
+        sessions = SessionMiddleware(view)
+        sessions.process_request(request)
+        messages = MessageMiddleware(view)
+        messages.process_request(request)
+        response = HttpResponse()
+
+        for middleware in (sessions, messages):
+            self.assertFalse(
+                middleware.uses_database(middleware.process_request, request)
+            )
+            self.assertFalse(
+                middleware.uses_database(
+                    middleware.process_response, request, response
+                )
+            )
+        request.session["bank"] = "changed"
+        request._messages.add(20, "saved")
+        for middleware in (sessions, messages):
+            self.assertTrue(
+                middleware.uses_database(
+                    middleware.process_response, request, response
+                )
+            )
+
+    def test_statement_streamed_by_asgi_app(self):
+        """Test app.asgi streams a statement, its rows read off the loop"""
+        from app.asgi import application
+
+        for amount in (5, 7):
+            Transfer.objects.create(
+                destination=self.account_1,
+                src_bank=self.bank,
+                amount=amount,
+                info="fund",
+                transfer_type=Transfer.ADD_FUND,
+            )
+        path = reverse("bank:account-statement", args=[self.account_1.uuid])
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": b"",
+            "headers": [
+                (b"authorization", f"Token {self.token.key}".encode()),
+                (b"host", b"localhost"),
+            ],
+        }
+
+        async def request() -> tuple:
+            communicator = ApplicationCommunicator(application, scope)
+            await communicator.send_input({"type": "http.request"})
+            start = await communicator.receive_output(timeout=10)
+            body = b""
+            while True:
+                message = await communicator.receive_output(timeout=10)
+                body += message.get("body", b"")
+                if not message.get("more_body"):
+                    break
+            await communicator.wait()
+            return start, body
+
+        start, body = async_to_sync(request)()
+
+        self.assertEqual(start["status"], 200)
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0], ",".join(STATEMENT_COLUMNS))
+        self.assertEqual(
+            [line.rsplit(",", 2)[1:] for line in lines[1:]],
+            [["5.00", "105.00"], ["7.00", "112.00"]],
+        )
@@ -1,11 +1,13 @@
 from django.urls import reverse
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.db.models import Q
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Transfer, Bank, Account
+from core.models import Transfer, Bank, Account, ScheduledTransfer
 from core.utils import (
     sample_bank,
     sample_account,
@@ -22,6 +24,9 @@ from bank.serializers import (
 
 BANK_LIST_URL = reverse("bank:bank-list")
 TRANSFER_MAKE_URL = reverse("bank:transfer-make")
+TRANSFER_BATCH_URL = reverse("bank:transfer-batch")
+TRANSFER_INTER_BANK_URL = reverse("bank:transfer-inter-bank")
+TRANSFER_SCHEDULED_URL = reverse("bank:transfer-scheduled")
 
 
 def bank_account_list_url(bank_id: str):
@@ -57,6 +62,14 @@ class PublicBankAPITests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
+    def test_batch_transfer_login_required(self):
+        """Test login is required to make batch transfers"""
+        res = self.client.put(
+            TRANSFER_BATCH_URL, {"transfers": []}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
 
 class PrivateBankAPITests(TestCase):
     """Test the authenticated bank api access"""
@@ -125,11 +138,12 @@ class PrivateBankAPITests(TestCase):
         transfers = Transfer.objects.filter(
             Q(source__uuid=test_account_id)
             | Q(destination__uuid=test_account_id)
-        )
+        ).order_by("-created", "-id")
         serializer = TransferSerializer(transfers, many=True)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
+        self.assertIsNone(res.data["next"])
 
     def test_transfer_list_not_found(self):
         """Test transfer list for an incorrect account"""
@@ -139,7 +153,173 @@ class PrivateBankAPITests(TestCase):
         url = account_transfer_list_url(test_account_id)
         res = self.client.get(url)
 
-        self.assertEqual(res.data, [])
+        self.assertEqual(res.data["results"], [])
+
+    def test_transfer_list_pagination(self):
+        """Test transfer list pages follow the cursor without gaps"""
+        test_bank = sample_bank()
+
+        test_account_1 = sample_account(bank=test_bank, balance=100)
+        test_account_2 = sample_account(bank=test_bank, balance=100)
+
+        for index in range(7):
+            sample_transfer(
+                source=test_account_1 if index % 2 else test_account_2,
+                destination=test_account_2 if index % 2 else test_account_1,
+                amount=1,
+                transfer_type=Transfer.INTRA_BANK_TRANSFER,
+            )
+        sample_transfer(
+            destination=test_account_1,
+            amount=1,
+            transfer_type=Transfer.ADD_FUND,
+        )
+
+        url = account_transfer_list_url(str(test_account_1.uuid))
+        res = self.client.get(url, {"page_size": 3})
+
+        pages = [res.data]
+        while pages[-1]["next"]:
+            res = self.client.get(pages[-1]["next"])
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append(res.data)
+
+        transfers = Transfer.objects.filter(
+            Q(source=test_account_1) | Q(destination=test_account_1)
+        ).order_by("-created", "-id")
+        serializer = TransferSerializer(transfers, many=True)
+
+        self.assertEqual([len(page["results"]) for page in pages], [3, 3, 2])
+        self.assertEqual(
+            [item for page in pages for item in page["results"]],
+            serializer.data,
+        )
+
+    def test_transfer_list_flat(self):
+        """Test flat transfer list returns related uuids and names"""
+        test_bank = sample_bank(name="flatbank")
+
+        test_account_1 = sample_account(bank=test_bank, name="first")
+        test_account_2 = sample_account(bank=test_bank, name="second")
+
+        sample_transfer(
+            destination=test_account_1,
+            src_bank=test_bank,
+            amount=5,
+            transfer_type=Transfer.ADD_FUND,
+        )
+        sample_transfer(
+            source=test_account_1,
+            destination=test_account_2,
+            amount=2,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+
+        url = account_transfer_list_url(str(test_account_1.uuid))
+        res = self.client.get(url, {"flat": "true"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        transfer, fund = res.data["results"]
+        self.assertEqual(transfer["source"], str(test_account_1.uuid))
+        self.assertEqual(transfer["source_name"], "first")
+        self.assertEqual(transfer["destination"], str(test_account_2.uuid))
+        self.assertEqual(transfer["destination_name"], "second")
+        self.assertEqual(transfer["amount"], "2.00")
+        self.assertIsNone(transfer["src_bank"])
+        self.assertIsNone(fund["source"])
+        self.assertEqual(fund["src_bank"], str(test_bank.uuid))
+        self.assertEqual(fund["src_bank_name"], "flatbank")
+
+    def test_transfer_list_query_count(self):
+        """Test transfer list queries do not grow with the page size"""
+        test_bank = sample_bank()
+
+        test_account_1 = sample_account(bank=test_bank, balance=100)
+        test_account_2 = sample_account(bank=test_bank)
+
+        for _ in range(20):
+            sample_transfer(
+                source=test_account_1,
+                destination=test_account_2,
+                src_bank=test_bank,
+                dst_bank=test_bank,
+                amount=1,
+                transfer_type=Transfer.INTRA_BANK_TRANSFER,
+            )
+
+        url = account_transfer_list_url(str(test_account_1.uuid))
+        for params in ({}, {"flat": "true"}):
+            # account lookup, then one query per indexed side
+            with self.assertNumQueries(3):
+                res = self.client.get(url, params)
+            self.assertEqual(len(res.data["results"]), 20)
+
+    def test_transfer_list_sharded_query_count(self):
+        """Test transfer list queries do not grow with the page size when
+        the accounts are sharded, and the balances count the shards"""
+        test_bank = sample_bank()
+
+        test_account_1 = sample_account(bank=test_bank, balance=100)
+        test_account_2 = sample_account(bank=test_bank)
+        for account in (test_account_1, test_account_2):
+            Account.objects.reshard(account.pk, 2)
+        test_account_1.refresh_from_db()
+        test_account_2.refresh_from_db()
+
+        for _ in range(20):
+            sample_transfer(
+                source=test_account_1,
+                destination=test_account_2,
+                amount=1,
+                transfer_type=Transfer.INTRA_BANK_TRANSFER,
+            )
+
+        url = account_transfer_list_url(str(test_account_1.uuid))
+        with self.assertNumQueries(3):
+            res = self.client.get(url)
+        self.assertEqual(len(res.data["results"]), 20)
+        transfer = res.data["results"][0]
+        self.assertEqual(transfer["source"]["balance"], "80.00")
+        self.assertEqual(transfer["destination"]["balance"], "20.00")
+
+    def test_transfer_list_date_range(self):
+        """Test transfer list only returns transfers in the date range"""
+        test_account = sample_account(bank=sample_bank())
+        transfers = [
+            sample_transfer(
+                destination=test_account,
+                amount=amount,
+                transfer_type=Transfer.ADD_FUND,
+            )
+            for amount in (1, 2, 3)
+        ]
+        for transfer, created in zip(
+            transfers, ("2021-01-31T23:00Z", "2021-02-10T00:00Z")
+        ):
+            Transfer.objects.filter(pk=transfer.pk).update(created=created)
+
+        url = account_transfer_list_url(str(test_account.uuid))
+        res = self.client.get(url, {"start": "2021-02-01"})
+        older = self.client.get(url, {"end": "2021-02-10"})
+        invalid = self.client.get(url, {"start": "february"})
+
+        self.assertEqual(
+            [item["amount"] for item in res.data["results"]], ["3.00", "2.00"]
+        )
+        self.assertEqual(
+            [item["amount"] for item in older.data["results"]],
+            ["2.00", "1.00"],
+        )
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_transfer_list_invalid_cursor(self):
+        """Test transfer list with a malformed cursor"""
+        test_account = sample_account(bank=sample_bank())
+
+        url = account_transfer_list_url(str(test_account.uuid))
+        res = self.client.get(url, {"cursor": "not-a-cursor"})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_make_transfer_success(self):
         """Test transfer make"""
@@ -220,6 +400,111 @@ class PrivateBankAPITests(TestCase):
         self.assertEqual(test_account_1.balance, 20)
         self.assertEqual(test_account_2.balance, 20)
 
+    def test_make_inter_bank_transfer_success(self):
+        """Test inter-bank transfer make debits the source and queues the
+        transfer"""
+
+        test_account_1 = sample_account(bank=sample_bank(), balance=20)
+        test_account_2 = sample_account(bank=sample_bank(), balance=20)
+
+        payload = {
+            "source": str(test_account_1.uuid),
+            "destination": str(test_account_2.uuid),
+            "amount": 10,
+            "info": "test info",
+        }
+        res = self.client.put(TRANSFER_INTER_BANK_URL, payload)
+
+        test_account_1.refresh_from_db()
+        test_account_2.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["destination"], str(test_account_2.uuid))
+        self.assertEqual(res.data["status"], "queued")
+        self.assertEqual(test_account_1.balance, 10)
+        self.assertEqual(test_account_2.balance, 20)
+        transfer = Transfer.objects.get()
+        self.assertEqual(transfer.transfer_type, Transfer.INTER_BANK_TRANSFER)
+        self.assertIsNone(transfer.destination)
+        self.assertEqual(transfer.settlement.destination, test_account_2)
+
+    def test_make_inter_bank_transfer_same_bank(self):
+        """Test inter-bank transfer make when both accounts are in the same
+        bank"""
+
+        test_bank = sample_bank()
+        test_account_1 = sample_account(bank=test_bank, balance=20)
+        test_account_2 = sample_account(bank=test_bank, balance=20)
+
+        payload = {
+            "source": str(test_account_1.uuid),
+            "destination": str(test_account_2.uuid),
+            "amount": 10,
+            "info": "test info",
+        }
+        res = self.client.put(TRANSFER_INTER_BANK_URL, payload)
+
+        test_account_1.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("destination", res.data)
+        self.assertEqual(test_account_1.balance, 20)
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_make_scheduled_transfer_success(self):
+        """Test a scheduled transfer is due at its start and can be
+        cancelled"""
+
+        test_bank = sample_bank()
+        test_account_1 = sample_account(bank=test_bank, balance=20)
+        test_account_2 = sample_account(bank=test_bank)
+
+        payload = {
+            "name": "rent",
+            "source": str(test_account_1.uuid),
+            "destination": str(test_account_2.uuid),
+            "amount": 10,
+            "info": "test info",
+            "frequency": ScheduledTransfer.MONTHLY,
+            "starts_at": "2030-01-31T09:00:00Z",
+        }
+        res = self.client.put(TRANSFER_SCHEDULED_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["next_run_at"], "2030-01-31T09:00:00Z")
+        self.assertEqual(res.data["occurrences"], 0)
+
+        url = reverse(
+            "bank:transfer-scheduled-cancel", args=[res.data["uuid"]]
+        )
+        res = self.client.delete(url)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(ScheduledTransfer.objects.exists())
+        self.assertEqual(
+            self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND
+        )
+
+    def test_make_scheduled_transfer_invalid(self):
+        """Test a scheduled transfer to its own source is rejected"""
+
+        test_account = sample_account(bank=sample_bank(), balance=20)
+
+        payload = {
+            "name": "rent",
+            "source": str(test_account.uuid),
+            "destination": str(test_account.uuid),
+            "amount": 10,
+            "info": "test info",
+            "frequency": ScheduledTransfer.DAILY,
+            "starts_at": "2030-01-31T09:00:00Z",
+        }
+        res = self.client.put(TRANSFER_SCHEDULED_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("destination", res.data)
+        self.assertFalse(ScheduledTransfer.objects.exists())
+
     def test_fund_add_success(self):
         """Test fund add"""
 
@@ -316,3 +601,126 @@ class PrivateBankAPITests(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(test_account.balance, 5)
+
+    def test_batch_transfer_success(self):
+        """Test batch transfer applies every transfer"""
+
+        test_bank = sample_bank()
+        test_account_1 = sample_account(bank=test_bank, balance=20)
+        test_account_2 = sample_account(bank=test_bank, balance=20)
+
+        payload = {
+            "transfers": [
+                {
+                    "source": str(test_account_1.uuid),
+                    "destination": str(test_account_2.uuid),
+                    "amount": 15,
+                    "info": "test info",
+                },
+                {
+                    "source": str(test_account_2.uuid),
+                    "destination": str(test_account_1.uuid),
+                    "amount": 5,
+                    "info": "test info",
+                },
+            ]
+        }
+        res = self.client.put(TRANSFER_BATCH_URL, payload, format="json")
+
+        test_account_1.refresh_from_db()
+        test_account_2.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["status"] for item in res.data], ["created", "created"]
+        )
+        self.assertEqual(res.data[0]["transfer"]["amount"], "15.00")
+        self.assertEqual(test_account_1.balance, 10)
+        self.assertEqual(test_account_2.balance, 30)
+        self.assertEqual(
+            Transfer.objects.filter(
+                transfer_type=Transfer.INTRA_BANK_TRANSFER
+            ).count(),
+            2,
+        )
+
+    def test_batch_transfer_item_errors(self):
+        """Test batch transfer reports and skips invalid transfers"""
+
+        test_bank_1 = sample_bank()
+        test_bank_2 = sample_bank()
+        test_account_1 = sample_account(bank=test_bank_1, balance=20)
+        test_account_2 = sample_account(bank=test_bank_1, balance=0)
+        test_account_3 = sample_account(bank=test_bank_2, balance=0)
+
+        def item(source, destination, amount=10):
+            return {
+                "source": str(source.uuid),
+                "destination": destination,
+                "amount": amount,
+                "info": "test info",
+            }
+
+        payload = {
+            "transfers": [
+                item(test_account_1, str(test_account_2.uuid)),
+                item(test_account_1, "8bce8de8-4856-4113-aff7-0812a5c6ea29"),
+                item(test_account_1, str(test_account_3.uuid)),
+                item(test_account_1, str(test_account_2.uuid), amount=0),
+                item(test_account_1, str(test_account_2.uuid)),
+                item(test_account_1, str(test_account_2.uuid)),
+            ]
+        }
+        res = self.client.put(TRANSFER_BATCH_URL, payload, format="json")
+
+        test_account_1.refresh_from_db()
+        test_account_2.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["status"] for item in res.data],
+            ["created", "failed", "failed", "failed", "created", "failed"],
+        )
+        self.assertIn("destination", res.data[1]["errors"])
+        self.assertIn("source", res.data[2]["errors"])
+        self.assertIn("amount", res.data[3]["errors"])
+        self.assertIn("source", res.data[5]["errors"])
+        self.assertEqual(test_account_1.balance, 0)
+        self.assertEqual(test_account_2.balance, 20)
+
+    def test_batch_transfer_empty(self):
+        """Test batch transfer rejects an empty batch"""
+        res = self.client.put(
+            TRANSFER_BATCH_URL, {"transfers": []}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_transfer_query_count(self):
+        """Test batch transfer queries do not grow with the batch size"""
+
+        test_bank = sample_bank()
+        accounts = [
+            sample_account(bank=test_bank, balance=1000) for _ in range(10)
+        ]
+
+        def put_batch(size):
+            payload = {
+                "transfers": [
+                    {
+                        "source": str(accounts[index % 9].uuid),
+                        "destination": str(accounts[9].uuid),
+                        "amount": 1,
+                        "info": "test info",
+                    }
+                    for index in range(size)
+                ]
+            }
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.put(
+                    TRANSFER_BATCH_URL, payload, format="json"
+                )
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(put_batch(5), put_batch(100))
@@ -0,0 +1,56 @@
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Transfer
+from core.utils import sample_bank, sample_account, sample_user
+
+
+def bank_totals_url(bank_id: str):
+    """Return the totals URL for a bank"""
+    return reverse("bank:bank-totals", args=[bank_id])
+
+
+class BankTotalsApiTests(TestCase):
+    """Test the bank totals API"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.client.force_authenticate(user=sample_user())
+        self.bank = sample_bank()
+
+    def test_bank_totals(self):
+        """Test the totals sum the accounts and transfers of the bank"""
+        account = sample_account(bank=self.bank, balance=100)
+        sample_account(bank=sample_bank("other"), balance=40)
+        Transfer.objects.create(
+            destination=account,
+            src_bank=self.bank,
+            amount=12.5,
+            transfer_type=Transfer.ADD_FUND,
+        )
+
+        res = self.client.get(bank_totals_url(str(self.bank.uuid)))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["balance"], "112.50")
+        self.assertEqual(res.data["funds_added"], "12.50")
+        self.assertEqual(res.data["funds_removed"], "0.00")
+        self.assertEqual(res.data["transfer_count"], 1)
+
+    def test_bank_without_accounts(self):
+        """Test a bank without totals returns zeros"""
+        res = self.client.get(bank_totals_url(str(self.bank.uuid)))
+
+        self.assertEqual(res.data["balance"], "0.00")
+        self.assertEqual(res.data["transfer_count"], 0)
+
+    def test_unknown_bank(self):
+        """Test the totals of an unknown bank are not found"""
+        res = self.client.get(
+            bank_totals_url("00000000-0000-0000-0000-000000000000")
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
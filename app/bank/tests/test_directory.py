@@ -0,0 +1,126 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Account
+from core.utils import sample_bank, sample_account, sample_user
+
+
+BANK_LIST_URL = reverse("bank:bank-list")
+
+
+def bank_account_list_url(bank_id: str):
+    """Return the account list URL for a bank"""
+    return reverse("bank:bank-account-list", args=[bank_id])
+
+
+class DirectoryCacheTests(TestCase):
+    """Test the cached bank and account listings"""
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(user=self.user)
+
+        self.bank = sample_bank()
+        self.account = sample_account(bank=self.bank, balance=20)
+        self.url = bank_account_list_url(str(self.bank.uuid))
+
+    def test_bank_list_cached(self):
+        """Test a repeated bank list runs no queries"""
+        self.client.get(BANK_LIST_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data[0]["name"], self.bank.name)
+
+    def test_bank_created_and_renamed(self):
+        """Test bank changes move the bank list to a new generation"""
+        self.client.get(BANK_LIST_URL)
+        sample_bank(name="Second Bank")
+        self.bank.name = "Renamed Bank"
+        self.bank.save()
+
+        res = self.client.get(BANK_LIST_URL)
+
+        names = {bank["name"] for bank in res.data}
+        self.assertEqual(names, {"Renamed Bank", "Second Bank"})
+
+    def test_bank_deleted(self):
+        """Test a deleted bank leaves the bank list"""
+        self.client.get(BANK_LIST_URL)
+        self.bank.delete()
+
+        res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.data, [])
+
+    def test_account_list_reads_fresh_balances(self):
+        """Test a cached account list runs only the balance query"""
+        self.client.get(self.url)
+        Account.objects.filter(pk=self.account.pk).update(balance=35)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(self.url)
+
+        self.assertEqual(res.data[0]["balance"], "35.00")
+        self.assertEqual(res.data[0]["name"], self.account.name)
+
+    def test_account_changes_invalidate(self):
+        """Test created, renamed and deleted accounts show up"""
+        self.client.get(self.url)
+        new_account = sample_account(bank=self.bank, name="New Account")
+        self.account.name = "Renamed Account"
+        self.account.save()
+
+        res = self.client.get(self.url)
+        names = {account["name"] for account in res.data}
+        self.assertEqual(names, {"New Account", "Renamed Account"})
+
+        new_account.delete()
+        res = self.client.get(self.url)
+        self.assertEqual(len(res.data), 1)
+
+    def test_bank_rename_invalidates_accounts(self):
+        """Test the nested bank of a cached account list is renamed"""
+        self.client.get(self.url)
+        self.bank.name = "Renamed Bank"
+        self.bank.save()
+
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.data[0]["bank"]["name"], "Renamed Bank")
+
+    def test_bank_list_not_modified(self):
+        """Test a bank list poll with the current ETag gets a 304"""
+        res_1 = self.client.get(BANK_LIST_URL)
+
+        with self.assertNumQueries(0):
+            res_2 = self.client.get(
+                BANK_LIST_URL, HTTP_IF_NONE_MATCH=res_1["ETag"]
+            )
+        sample_bank(name="Second Bank")
+        res_3 = self.client.get(
+            BANK_LIST_URL, HTTP_IF_NONE_MATCH=res_1["ETag"]
+        )
+
+        self.assertEqual(res_2.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res_3.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res_3.data), 2)
+
+    def test_account_list_not_modified(self):
+        """Test the account list ETag changes with the balances"""
+        res_1 = self.client.get(self.url)
+        res_2 = self.client.get(self.url, HTTP_IF_NONE_MATCH=res_1["ETag"])
+        Account.objects.filter(pk=self.account.pk).update(balance=35)
+        res_3 = self.client.get(self.url, HTTP_IF_NONE_MATCH=res_1["ETag"])
+
+        self.assertEqual(res_2.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res_3.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res_3["ETag"], res_1["ETag"])
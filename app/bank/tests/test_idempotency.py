@@ -0,0 +1,228 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Transfer, IdempotencyKey
+from core.utils import sample_bank, sample_account, sample_user
+from bank.ratelimit import local_buckets
+
+
+TRANSFER_MAKE_URL = reverse("bank:transfer-make")
+
+
+def account_fund_add_url(account_id: str):
+    """Return the fund add URL for an account"""
+    return reverse("bank:fund-add", args=[account_id])
+
+
+def account_fund_retire_url(account_id: str):
+    """Return the fund retire URL for an account"""
+    return reverse("bank:fund-retire", args=[account_id])
+
+
+class IdempotencyKeyTests(TestCase):
+    """Test the Idempotency-Key header of the fund and transfer endpoints"""
+
+    def setUp(self) -> None:
+        cache.clear()
+        local_buckets.clear()
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(user=self.user)
+
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=20)
+        self.account_2 = sample_account(bank=self.bank, balance=20)
+        self.payload = {
+            "source": str(self.account_1.uuid),
+            "destination": str(self.account_2.uuid),
+            "amount": 10,
+            "info": "test info",
+        }
+
+    def test_transfer_replayed(self):
+        """Test a retried transfer is applied once and replayed"""
+        res_1 = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        res_2 = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+
+        self.account_1.refresh_from_db()
+
+        self.assertEqual(res_1.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res_2.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res_1.data, res_2.data)
+        self.assertEqual(res_2["Idempotent-Replayed"], "true")
+        self.assertEqual(self.account_1.balance, 10)
+        self.assertEqual(Transfer.objects.count(), 1)
+
+    def test_cached_replay_runs_no_queries(self):
+        """Test a replay from the cache does not touch the database"""
+        self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+
+        with self.assertNumQueries(0):
+            res = self.client.put(
+                TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_replay_from_database(self):
+        """Test a key is replayed from the database when not cached"""
+        res_1 = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        cache.clear()
+        res_2 = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+
+        self.account_1.refresh_from_db()
+
+        self.assertEqual(res_2.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res_2["Idempotent-Replayed"], "true")
+        self.assertEqual(res_2.data["source"], str(res_1.data["source"]))
+        self.assertEqual(self.account_1.balance, 10)
+
+    def test_key_reused_for_different_request(self):
+        """Test a key sent with different data is rejected"""
+        self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        self.payload["amount"] = 5
+        res = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+
+        self.account_1.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.account_1.balance, 10)
+
+    def test_key_scoped_by_endpoint(self):
+        """Test the same key on another endpoint is a new request"""
+        payload = {"amount": 5, "info": "test info"}
+        self.client.put(
+            account_fund_add_url(str(self.account_1.uuid)),
+            payload,
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+        self.client.put(
+            account_fund_retire_url(str(self.account_1.uuid)),
+            payload,
+            HTTP_IDEMPOTENCY_KEY="key-1",
+        )
+
+        self.account_1.refresh_from_db()
+
+        self.assertEqual(self.account_1.balance, 20)
+        self.assertEqual(Transfer.objects.count(), 2)
+
+    def test_failed_request_not_stored(self):
+        """Test a failed request can be retried with the same key"""
+        self.payload["amount"] = 30
+        res_1 = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        self.account_1.balance = 40
+        self.account_1.save()
+        res_2 = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+
+        self.account_1.refresh_from_db()
+
+        self.assertEqual(res_1.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res_2.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.account_1.balance, 10)
+
+    def test_expired_key_not_replayed(self):
+        """Test an expired key runs the request again"""
+        self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+        cache.clear()
+        IdempotencyKey.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        res = self.client.put(
+            TRANSFER_MAKE_URL, self.payload, HTTP_IDEMPOTENCY_KEY="key-1"
+        )
+
+        self.account_1.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", res)
+        self.assertEqual(self.account_1.balance, 0)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_purge_expired_keys(self):
+        """Test the purge command deletes only expired keys"""
+        now = timezone.now()
+        IdempotencyKey.objects.create(
+            key="expired", fingerprint="", expires_at=now - timedelta(hours=1)
+        )
+        IdempotencyKey.objects.create(
+            key="live", fingerprint="", expires_at=now + timedelta(hours=1)
+        )
+
+        call_command(
+            "purge_idempotency_keys", "--batch-size=1", stdout=StringIO()
+        )
+
+        self.assertEqual(
+            list(IdempotencyKey.objects.values_list("key", flat=True)),
+            ["live"],
+        )
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class IdempotencyKeyConcurrencyTests(TransactionTestCase):
+    """Test parallel retries of the same request"""
+
+    def test_parallel_retries_applied_once(self):
+        """Test parallel requests with one key make a single transfer"""
+        cache.clear()
+        user = sample_user()
+        bank = sample_bank()
+        account_1 = sample_account(bank=bank, balance=100)
+        account_2 = sample_account(bank=bank)
+        payload = {
+            "source": str(account_1.uuid),
+            "destination": str(account_2.uuid),
+            "amount": 10,
+            "info": "test info",
+        }
+
+        def retry(index):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                return client.put(
+                    TRANSFER_MAKE_URL, payload, HTTP_IDEMPOTENCY_KEY="key-1"
+                ).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            codes = list(executor.map(retry, range(32)))
+
+        account_1.refresh_from_db()
+
+        self.assertEqual(set(codes), {status.HTTP_201_CREATED})
+        self.assertEqual(account_1.balance, 90)
+        self.assertEqual(Transfer.objects.count(), 1)
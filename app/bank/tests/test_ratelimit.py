@@ -0,0 +1,209 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Transfer
+from core.utils import sample_account, sample_bank, sample_user
+from bank.idempotency import REPLAYED_HEADER
+from bank.ratelimit import (
+    LocalTokenBuckets,
+    count_shared,
+    get_shared_wait,
+    local_buckets,
+    parse_rate,
+)
+
+
+TRANSFER_MAKE_URL = reverse("bank:transfer-make")
+
+TRANSFER_LIMITS = {"intra_bank_transfer": {"user": "", "account": "2/min"}}
+BOTH_LIMITS = {"intra_bank_transfer": {"user": "3/min", "account": "2/min"}}
+FUND_LIMITS = {"add_fund": {"user": "2/min", "account": ""}}
+
+
+def account_fund_add_url(account_id: str):
+    """Return the fund add URL for an account"""
+    return reverse("bank:fund-add", args=[account_id])
+
+
+def take_shared(key: str, limit: int, period: float) -> float:
+    """Count a request of key in the shared cache when it fits, return the
+    wait"""
+    wait = get_shared_wait(cache, key, limit, period)
+    if not wait:
+        count_shared(cache, key, period)
+    return wait
+
+
+class RateLimitTests(TestCase):
+    """Test the rate limits of the money moving endpoints"""
+
+    def setUp(self) -> None:
+        local_buckets.clear()
+        cache.clear()
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(user=self.user)
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=100)
+        self.account_2 = sample_account(bank=self.bank, balance=100)
+
+    def transfer(self, source, destination, amount="1.00"):
+        payload = {
+            "source": str(source.uuid),
+            "destination": str(destination.uuid),
+            "amount": amount,
+            "info": "test info",
+        }
+        return self.client.put(TRANSFER_MAKE_URL, payload)
+
+    def test_parse_rate(self):
+        """Test rates are read as requests per seconds"""
+        self.assertEqual(parse_rate("60/min"), (60, 60))
+        self.assertEqual(parse_rate("1000/day"), (1000, 86400))
+        self.assertIsNone(parse_rate(""))
+
+    def test_token_bucket_refills(self):
+        """Test a bucket allows a burst of limit, then one token per
+        limit/period"""
+        buckets = LocalTokenBuckets()
+        with patch("bank.ratelimit.time.monotonic", return_value=100):
+            waits = [buckets.take("key", 2, 60, 10) for index in range(3)]
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertAlmostEqual(waits[2], 30)
+
+        with patch("bank.ratelimit.time.monotonic", return_value=130):
+            self.assertEqual(buckets.take("key", 2, 60, 10), 0)
+            self.assertGreater(buckets.take("key", 2, 60, 10), 0)
+
+    def test_token_bucket_peek(self):
+        """Test peeking a bucket does not take its token"""
+        buckets = LocalTokenBuckets()
+        with patch("bank.ratelimit.time.monotonic", return_value=100):
+            self.assertEqual(buckets.peek("key", 1, 60), 0)
+            self.assertEqual(buckets.take("key", 1, 60, 10), 0)
+            self.assertAlmostEqual(buckets.peek("key", 1, 60), 60)
+
+    def test_token_buckets_bounded(self):
+        """Test the least recently used buckets are dropped past the size"""
+        buckets = LocalTokenBuckets()
+        for index in range(3):
+            buckets.take(f"key-{index}", 1, 60, 2)
+
+        self.assertEqual(list(buckets.buckets), ["key-1", "key-2"])
+
+    @override_settings(RATE_LIMITS=TRANSFER_LIMITS)
+    def test_account_limit(self):
+        """Test an account over its limit is turned away before the request
+        is validated, with a Retry-After header"""
+        for index in range(2):
+            res = self.transfer(self.account_1, self.account_2)
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(0):
+            res = self.transfer(self.account_1, self.account_2, amount="x")
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("account", res.data["detail"])
+        self.assertEqual(res["Retry-After"], "30")
+        self.assertEqual(Transfer.objects.count(), 2)
+        res = self.transfer(self.account_2, self.account_1)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(RATE_LIMITS=TRANSFER_LIMITS)
+    def test_replay_not_counted(self):
+        """Test a retry replaying a stored response is neither limited nor
+        counted"""
+        payload = {
+            "source": str(self.account_1.uuid),
+            "destination": str(self.account_2.uuid),
+            "amount": "1.00",
+            "info": "test info",
+        }
+        for index in range(3):
+            res = self.client.put(
+                TRANSFER_MAKE_URL, payload, HTTP_IDEMPOTENCY_KEY="retry"
+            )
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.transfer(self.account_1, self.account_2)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.client.put(
+            TRANSFER_MAKE_URL, payload, HTTP_IDEMPOTENCY_KEY="retry"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res[REPLAYED_HEADER], "true")
+        self.assertEqual(Transfer.objects.count(), 2)
+
+    @override_settings(RATE_LIMITS=BOTH_LIMITS, RATE_LIMIT_CACHE="default")
+    def test_turned_away_not_counted(self):
+        """Test a request turned away by one limit is not counted by the
+        others, locally or in the shared cache"""
+        for index in range(4):
+            self.transfer(self.account_1, self.account_2)
+        local_buckets.clear()
+
+        res = self.transfer(self.account_2, self.account_1)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transfer.objects.count(), 3)
+
+    @override_settings(RATE_LIMITS=FUND_LIMITS)
+    def test_user_limit(self):
+        """Test a user over its limit is turned away on every account"""
+        payload = {"amount": "1.00", "info": "test info"}
+        for account in (self.account_1, self.account_2):
+            res = self.client.put(account_fund_add_url(account.uuid), payload)
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.put(
+            account_fund_add_url(self.account_1.uuid), payload
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("user", res.data["detail"])
+        other = APIClient()
+        other.force_authenticate(user=sample_user("other", "other@test.com"))
+        res = other.put(account_fund_add_url(self.account_1.uuid), payload)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(RATE_LIMITS=TRANSFER_LIMITS, RATE_LIMITS_ENABLED=False)
+    def test_rate_limits_disabled(self):
+        """Test no request is limited when the rate limits are turned off"""
+        for index in range(3):
+            res = self.transfer(self.account_1, self.account_2)
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(
+        RATE_LIMITS=TRANSFER_LIMITS, RATE_LIMIT_CACHE="default"
+    )
+    def test_shared_limit(self):
+        """Test the shared cache counts the requests of every worker"""
+        self.transfer(self.account_1, self.account_2)
+        # another worker, its local buckets are empty
+        local_buckets.clear()
+        self.transfer(self.account_1, self.account_2)
+        local_buckets.clear()
+
+        res = self.transfer(self.account_1, self.account_2)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(res["Retry-After"]), 0)
+
+    def test_shared_sliding_window(self):
+        """Test the previous window counts for the part it still covers"""
+        with patch("bank.ratelimit.time.time", return_value=60 * 10 + 45):
+            waits = [take_shared("key", 4, 60) for index in range(5)]
+        self.assertEqual(waits[:4], [0] * 4)
+        self.assertGreater(waits[4], 0)
+
+        # a quarter into the next window, 3 of the 4 still count
+        with patch("bank.ratelimit.time.time", return_value=60 * 11 + 15):
+            self.assertEqual(take_shared("key", 4, 60), 0)
+            self.assertAlmostEqual(take_shared("key", 4, 60), 15)
@@ -0,0 +1,167 @@
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.models import Account, Transfer
+from core.routers import ReplicaRouter, Routing, current_routing
+from core.utils import sample_account, sample_bank, sample_user
+from user.authentication import local_token_cache
+
+
+REPLICA = "replica"
+TRANSFER_MAKE_URL = reverse("bank:transfer-make")
+
+# a mirror of the test database stands in for a streaming replica, added
+# on import as the test runner sets up the databases of the loaded tests
+connections.databases.setdefault(
+    REPLICA,
+    {
+        **connections.databases[DEFAULT_DB_ALIAS],
+        "TEST": {"MIRROR": DEFAULT_DB_ALIAS},
+    },
+)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Test reads of the list endpoints go to the replica and writes and
+    recent writers stay on the primary"""
+
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def setUp(self) -> None:
+        cache.clear()
+        local_token_cache.clear()
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=100)
+        self.account_2 = sample_account(bank=self.bank, name="second")
+        self.client = self.token_client(sample_user())
+
+    def token_client(self, user) -> APIClient:
+        client = APIClient()
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return client
+
+    def get(self, client, url: str):
+        """Return the response and the queries run on each database"""
+        with CaptureQueriesContext(
+            connections[DEFAULT_DB_ALIAS]
+        ) as primary, CaptureQueriesContext(connections[REPLICA]) as replica:
+            res = client.get(url)
+            if res.streaming:
+                b"".join(res.streaming_content)
+        return res, len(primary), len(replica)
+
+    def test_list_reads_from_replica(self):
+        """Test the list endpoints read from the replica"""
+        urls = [
+            reverse("bank:bank-list"),
+            reverse("bank:bank-account-list", args=[self.bank.uuid]),
+            reverse("bank:transfer-list", args=[self.account_1.uuid]),
+            reverse("bank:account-summary", args=[self.account_1.uuid]),
+        ]
+        for url in urls:
+            res, primary, replica = self.get(self.client, url)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertGreater(replica, 0, url)
+
+    def test_streamed_statement_reads_from_replica(self):
+        """Test the rows of a streamed statement are read from the
+        replica after the view returned"""
+        Transfer.objects.create(
+            destination=self.account_1,
+            dst_bank=self.bank,
+            amount=20,
+            info="deposit",
+            transfer_type=Transfer.ADD_FUND,
+        )
+        url = reverse("bank:account-statement", args=[self.account_1.uuid])
+
+        with CaptureQueriesContext(
+            connections[DEFAULT_DB_ALIAS]
+        ) as primary, CaptureQueriesContext(connections[REPLICA]) as replica:
+            res = self.client.get(url)
+            content = b"".join(res.streaming_content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(b"deposit", content)
+
+        def transfer_reads(queries):
+            return [
+                query["sql"]
+                for query in queries
+                if "core_transfer" in query["sql"]
+                and query["sql"].lstrip().upper().startswith(
+                    ("SELECT", "DECLARE")
+                )
+            ]
+
+        self.assertGreater(len(transfer_reads(replica)), 0)
+        self.assertEqual(transfer_reads(primary), [])
+
+    def test_writes_and_validation_stay_on_primary(self):
+        """Test the transfer and fund endpoints, with their balance
+        checks, only use the primary"""
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            transfer = self.client.put(
+                TRANSFER_MAKE_URL,
+                {
+                    "source": self.account_1.uuid,
+                    "destination": self.account_2.uuid,
+                    "amount": 30,
+                    "info": "rent",
+                },
+                format="json",
+            )
+            retire = self.client.put(
+                reverse("bank:fund-retire", args=[self.account_2.uuid]),
+                {"amount": 50, "info": "too much"},
+                format="json",
+            )
+
+        self.assertEqual(transfer.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retire.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(replica), 0)
+
+    def test_writer_pinned_to_primary(self):
+        """Test a client reads its own writes from the primary while other
+        clients keep reading from the replica"""
+        other = self.token_client(sample_user("other", "other@test.com"))
+        url = reverse("bank:bank-account-list", args=[self.bank.uuid])
+        self.client.put(
+            reverse("bank:fund-add", args=[self.account_1.uuid]),
+            {"amount": 10, "info": "deposit"},
+            format="json",
+        )
+
+        res, primary, replica = self.get(self.client, url)
+        other_res, other_primary, other_replica = self.get(other, url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        self.assertGreater(other_replica, 0)
+
+    def test_router(self):
+        """Test reads in a transaction and writes go to the primary"""
+        router = ReplicaRouter()
+        routing = Routing(None)
+        routing.decided, routing.replica = True, REPLICA
+        token = current_routing.set(routing)
+        try:
+            self.assertEqual(router.db_for_read(Account), REPLICA)
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Account))
+            self.assertEqual(router.db_for_write(Account), DEFAULT_DB_ALIAS)
+            self.assertIsNone(router.db_for_read(Account))
+        finally:
+            current_routing.reset(token)
+        self.assertFalse(router.allow_migrate(REPLICA, "core"))
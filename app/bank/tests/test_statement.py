@@ -0,0 +1,172 @@
+import csv
+import io
+import json
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Account, BalanceSnapshot, LedgerEntry, Transfer
+from core.utils import (
+    migrate_with_history,
+    sample_bank,
+    sample_account,
+    sample_transfer,
+    sample_user,
+)
+
+
+def account_statement_url(account_id: str):
+    """Return the statement URL for an account"""
+    return reverse("bank:account-statement", args=[account_id])
+
+
+class AccountStatementTests(TestCase):
+    """Test the streamed account statement"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(user=self.user)
+
+        self.bank = sample_bank()
+        self.account = sample_account(bank=self.bank, balance=100)
+        self.other = sample_account(bank=self.bank, name="other")
+        self.url = account_statement_url(str(self.account.uuid))
+
+        self.fund = Transfer.objects.create(
+            destination=self.account,
+            src_bank=self.bank,
+            amount=50,
+            info="salary",
+            transfer_type=Transfer.ADD_FUND,
+        )
+        self.transfer = Transfer.objects.create(
+            source=self.account,
+            destination=self.other,
+            amount=30,
+            info="rent",
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+
+    def read_csv(self, res) -> list:
+        content = b"".join(res.streaming_content).decode()
+        return list(csv.DictReader(io.StringIO(content)))
+
+    def move_back(self, transfer: Transfer, days: int) -> None:
+        """Move a transfer and its ledger entries back in time"""
+        created = timezone.now() - timedelta(days=days)
+        Transfer.objects.filter(pk=transfer.pk).update(created=created)
+        LedgerEntry.objects.filter(transfer=transfer).update(created=created)
+
+    def test_csv_running_balance(self):
+        """Test the CSV statement has a running balance"""
+        res = self.client.get(self.url)
+        rows = self.read_csv(res)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        self.assertEqual(res["Content-Type"], "text/csv")
+        self.assertEqual(
+            [(row["amount"], row["balance"]) for row in rows],
+            [("50.00", "150.00"), ("-30.00", "120.00")],
+        )
+        self.assertEqual(rows[0]["counterparty"], str(self.bank.uuid))
+        self.assertEqual(rows[1]["counterparty_name"], "other")
+
+    def test_ndjson(self):
+        """Test the NDJSON statement has one object per line"""
+        res = self.client.get(self.url, {"output": "ndjson"})
+        content = b"".join(res.streaming_content).decode()
+        rows = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        self.assertEqual([row["info"] for row in rows], ["salary", "rent"])
+        self.assertEqual(rows[-1]["balance"], "120.00")
+
+    def test_date_range(self):
+        """Test a date range starts from the balance before it"""
+        BalanceSnapshot.objects.update(
+            taken_at=timezone.now() - timedelta(days=20)
+        )
+        self.move_back(self.fund, days=10)
+        self.move_back(self.transfer, days=5)
+        start = (timezone.now() - timedelta(days=7)).date().isoformat()
+
+        rows = self.read_csv(self.client.get(self.url, {"start": start}))
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["balance"], "120.00")
+
+    def test_end_date_inclusive(self):
+        """Test a date end includes the whole day"""
+        self.move_back(self.transfer, days=5)
+        end = (timezone.now() - timedelta(days=5)).date().isoformat()
+
+        rows = self.read_csv(self.client.get(self.url, {"end": end}))
+
+        self.assertEqual([row["info"] for row in rows], ["rent"])
+        self.assertEqual(rows[0]["balance"], "70.00")
+
+    def test_invalid_params(self):
+        """Test an unknown output or date is rejected"""
+        res_1 = self.client.get(self.url, {"output": "xml"})
+        res_2 = self.client.get(self.url, {"start": "yesterday"})
+
+        self.assertEqual(res_1.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res_2.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_account(self):
+        """Test the statement of an unknown account is not found"""
+        res = self.client.get(
+            account_statement_url("00000000-0000-0000-0000-000000000000")
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class UpgradedStatementTests(TransactionTestCase):
+    """Test the statement of an account with transfers from before the
+    ledger"""
+
+    def create_history(self, apps) -> None:
+        """Write an account opened with 20 and funded with 100"""
+        Bank = apps.get_model("core", "Bank")
+        Account = apps.get_model("core", "Account")
+        Transfer = apps.get_model("core", "Transfer")
+        bank = Bank.objects.create(name="old")
+        account = Account.objects.create(name="old", bank=bank, balance=120)
+        Transfer.objects.create(
+            destination=account,
+            src_bank=bank,
+            amount=100,
+            info="fund",
+            transfer_type="add_fund",
+        )
+
+    def test_running_balance(self):
+        """Test the statement starts from the balance before the transfers
+        and ends at the current balance"""
+        migrate_with_history("0003_idempotencykey", self.create_history)
+        account = Account.objects.get()
+        sample_transfer(
+            source=account,
+            dst_bank=account.bank,
+            amount=30,
+            transfer_type=Transfer.REMOVE_FUND,
+        )
+        client = APIClient()
+        client.force_authenticate(user=sample_user())
+
+        res = client.get(account_statement_url(str(account.uuid)))
+        content = b"".join(res.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+
+        self.assertEqual(
+            [(row["amount"], row["balance"]) for row in rows],
+            [("100.00", "120.00"), ("-30.00", "90.00")],
+        )
@@ -0,0 +1,141 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import LedgerEntry, Transfer
+from core.utils import sample_bank, sample_account, sample_user
+
+
+def account_summary_url(account_id: str):
+    """Return the summary URL for an account"""
+    return reverse("bank:account-summary", args=[account_id])
+
+
+class AccountSummaryTests(TestCase):
+    """Test the account transfer summary"""
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(user=self.user)
+
+        self.bank = sample_bank()
+        self.account = sample_account(bank=self.bank, balance=100)
+        self.other = sample_account(bank=self.bank, name="other")
+        self.url = account_summary_url(str(self.account.uuid))
+        self.today = timezone.localdate()
+
+    def transfer(self, amount, days: int, incoming: bool = False) -> None:
+        """Create a transfer of the account, days back in time"""
+        if incoming:
+            transfer = Transfer.objects.create(
+                destination=self.account,
+                src_bank=self.bank,
+                amount=amount,
+                transfer_type=Transfer.ADD_FUND,
+            )
+        else:
+            transfer = Transfer.objects.create(
+                source=self.account,
+                destination=self.other,
+                amount=amount,
+                transfer_type=Transfer.INTRA_BANK_TRANSFER,
+            )
+        created = timezone.now() - timedelta(days=days)
+        Transfer.objects.filter(pk=transfer.pk).update(created=created)
+        LedgerEntry.objects.filter(transfer=transfer).update(created=created)
+
+    def test_totals_by_type(self):
+        """Test the totals per transfer type"""
+        self.transfer(50, days=3, incoming=True)
+        self.transfer(20, days=2)
+        self.transfer(5, days=1)
+
+        res = self.client.get(self.url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["by_type"],
+            [
+                {
+                    "transfer_type": Transfer.ADD_FUND,
+                    "count": 1,
+                    "credit": "50.00",
+                    "debit": "0.00",
+                },
+                {
+                    "transfer_type": Transfer.INTRA_BANK_TRANSFER,
+                    "count": 2,
+                    "credit": "0.00",
+                    "debit": "25.00",
+                },
+            ],
+        )
+
+    def test_rollups_and_live_merged(self):
+        """Test rolled up days and newer transfers add up to the same"""
+        self.transfer(20, days=3)
+        self.transfer(5, days=3)
+        before = self.client.get(self.url, {"period": "day"}).data
+
+        call_command("rollup_transfers", "--lag=0", stdout=StringIO())
+        self.transfer(7, days=0)
+        after = self.client.get(self.url, {"period": "day"}).data
+
+        self.assertEqual(before["by_period"], after["by_period"][:1])
+        self.assertEqual(
+            after["by_period"][0]["period"], self.today - timedelta(days=3)
+        )
+        self.assertEqual(after["by_period"][0]["count"], 2)
+        self.assertEqual(after["by_period"][1]["debit"], "7.00")
+
+    def test_month_period(self):
+        """Test the totals are bucketed per month"""
+        first = self.today.replace(day=1)
+        self.transfer(10, days=(self.today - first).days)
+        self.transfer(4, days=(self.today - first).days + 1)
+        call_command("rollup_transfers", "--lag=0", stdout=StringIO())
+
+        res = self.client.get(
+            self.url,
+            {
+                "start": (first - timedelta(days=1)).isoformat(),
+                "end": self.today.isoformat(),
+                "period": "month",
+            },
+        )
+
+        self.assertEqual(
+            [(row["period"], row["debit"]) for row in res.data["by_period"]],
+            [
+                ((first - timedelta(days=1)).replace(day=1), "4.00"),
+                (first, "10.00"),
+            ],
+        )
+
+    def test_invalid_params(self):
+        """Test an unknown period or a reversed range is rejected"""
+        res_1 = self.client.get(self.url, {"period": "year"})
+        res_2 = self.client.get(
+            self.url, {"start": "2021-02-01", "end": "2021-01-01"}
+        )
+        res_3 = self.client.get(self.url, {"start": "2021-02-30"})
+
+        self.assertEqual(res_1.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res_2.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res_3.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_account(self):
+        """Test the summary of an unknown account is not found"""
+        res = self.client.get(
+            account_summary_url("00000000-0000-0000-0000-000000000000")
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,41 +1,102 @@
+from django.conf import settings
 from django.urls import path
 
 from bank.views import (
     BankListView,
     BankAccountListView,
     TransferListView,
+    bank_totals,
     make_transfer,
+    make_inter_bank_transfer,
+    make_batch_transfer,
+    make_scheduled_transfer,
+    cancel_scheduled_transfer,
     add_fund,
     remove_fund,
+    account_statement,
+    account_summary,
 )
 
 app_name = "bank"
 
+bank_list = BankListView.as_view()
+bank_account_list = BankAccountListView.as_view()
+transfer_list = TransferListView.as_view()
+transfer_make = make_transfer
+fund_add = add_fund
+fund_retire = remove_fund
+
+if settings.ASYNC_VIEWS:
+    # coroutine views for ASGI servers, see bank/async_views.py
+    from bank import async_views
+
+    bank_list = async_views.AsyncBankListView.as_view()
+    bank_account_list = async_views.AsyncBankAccountListView.as_view()
+    transfer_list = async_views.AsyncTransferListView.as_view()
+    transfer_make = async_views.async_make_transfer
+    fund_add = async_views.async_add_fund
+    fund_retire = async_views.async_remove_fund
+
 urlpatterns = [
     path(
         "bank/",
-        BankListView.as_view(),
+        bank_list,
         name="bank-list",
     ),
     path(
         "bank/<uuid:bank_id>/account/",
-        BankAccountListView.as_view(),
+        bank_account_list,
         name="bank-account-list",
     ),
+    path(
+        "bank/<uuid:bank_id>/totals/",
+        bank_totals,
+        name="bank-totals",
+    ),
     path(
         "<uuid:account_id>/list/",
-        TransferListView.as_view(),
+        transfer_list,
         name="transfer-list",
     ),
-    path("transfer/", make_transfer, name="transfer-make"),
+    path("transfer/", transfer_make, name="transfer-make"),
+    path(
+        "transfer/inter-bank/",
+        make_inter_bank_transfer,
+        name="transfer-inter-bank",
+    ),
+    path(
+        "transfer/batch/",
+        make_batch_transfer,
+        name="transfer-batch",
+    ),
+    path(
+        "transfer/scheduled/",
+        make_scheduled_transfer,
+        name="transfer-scheduled",
+    ),
+    path(
+        "transfer/scheduled/<uuid:scheduled_id>/",
+        cancel_scheduled_transfer,
+        name="transfer-scheduled-cancel",
+    ),
     path(
         "<uuid:account_id>/add/",
-        add_fund,
+        fund_add,
         name="fund-add",
     ),
     path(
         "<uuid:account_id>/retire/",
-        remove_fund,
+        fund_retire,
         name="fund-retire",
     ),
+    path(
+        "<uuid:account_id>/statement/",
+        account_statement,
+        name="account-statement",
+    ),
+    path(
+        "<uuid:account_id>/summary/",
+        account_summary,
+        name="account-summary",
+    ),
 ]
@@ -1,25 +1,48 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.core.exceptions import ValidationError
-from django.db.models import Q
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
 
 from rest_framework import generics, status
 from rest_framework.decorators import permission_classes, api_view
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError as APIValidationError
 from rest_framework.response import Response
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from core.models import Transfer, Account, Bank
+from core.models import Transfer, Account, Bank, BankTotal, ScheduledTransfer
+from core.routers import replica_reads
+from bank.directory import get_bank_list, get_account_list, etag_response
+from bank.idempotency import idempotent, IDEMPOTENCY_KEY_PARAMETER
+from bank.ratelimit import rate_limited
+from bank.pagination import KeysetPagination
+from bank.summary import CENT, PERIODS, get_summary
+from bank.statements import (
+    parse_bound,
+    iter_statement_rows,
+    stream_csv,
+    stream_ndjson,
+)
 from bank.serializers import (
     BankSerializer,
     AccountSerializer,
     TransferSerializer,
+    FlatTransferSerializer,
     FundSerializer,
     IntraBankTransferSerializer,
+    InterBankTransferSerializer,
+    BatchTransferSerializer,
+    ScheduledTransferSerializer,
 )
 
 
+@replica_reads
 class BankListView(generics.ListAPIView):
     """Bank list"""
 
@@ -28,7 +51,44 @@ class BankListView(generics.ListAPIView):
     queryset = Bank.objects.all()
     my_tags = ["Bank"]
 
+    def list(self, request, *args, **kwargs):
+        """
+        Return the cached bank list, tagged with its generation
+        """
+        generation, data = get_bank_list()
+        return etag_response(request, data, etag=f"banks-{generation}")
+
+
+@swagger_auto_schema(
+    method="get",
+    responses={200: "Running totals of the bank", 404: "Not Found"},
+    operation_description="Sum of the account balances of a bank, the "
+    "funds added and removed and the volume and number of its transfers",
+    tags=[
+        "Bank",
+    ],
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def bank_totals(request, bank_id):
+    """Returns the running totals of a bank"""
+
+    try:
+        bank = Bank.objects.only("pk", "uuid").get(uuid=bank_id)
+    except Bank.DoesNotExist:
+        raise Http404
+
+    totals = BankTotal.objects.filter(bank=bank).per_bank().first() or {}
+    data = {"bank": bank.uuid}
+    for field in BankTotal.TOTAL_FIELDS:
+        value = totals.get(field) or 0
+        if field != "transfer_count":
+            value = str(Decimal(value).quantize(CENT))
+        data[field] = value
+    return Response(data)
 
+
+@replica_reads
 class BankAccountListView(generics.ListAPIView):
     """Bank Account list for a bank"""
 
@@ -47,42 +107,129 @@ class BankAccountListView(generics.ListAPIView):
         bank_id = self.kwargs[self.lookup_field]
 
         try:
-            queryset = Account.objects.filter(bank__uuid=bank_id)
+            queryset = (
+                Account.objects.filter(bank__uuid=bank_id)
+                .select_related("bank")
+                .with_shard_balance()
+            )
         except ValidationError:
             raise Http404
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """
+        Return the cached accounts of the bank with fresh balances
+        """
+        return etag_response(
+            request, get_account_list(self.kwargs[self.lookup_field])
+        )
 
+
+@replica_reads
+@method_decorator(
+    name="get",
+    decorator=swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "flat",
+                openapi.IN_QUERY,
+                description="Return related accounts and banks as uuid "
+                "and name instead of nested objects",
+                type=openapi.TYPE_BOOLEAN,
+            ),
+            openapi.Parameter(
+                "start",
+                openapi.IN_QUERY,
+                description="Date or datetime of the oldest transfer",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "end",
+                openapi.IN_QUERY,
+                description="Date or datetime after the newest transfer, a "
+                "date includes the whole day",
+                type=openapi.TYPE_STRING,
+            ),
+        ]
+    ),
+)
 class TransferListView(generics.ListAPIView):
-    """Transfer list for an account"""
+    """Transfer list for an account, newest first"""
 
     serializer_class = TransferSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     queryset = Transfer.objects.all()
     lookup_field = "account_id"
     my_tags = ["Transfer"]
 
+    def is_flat(self) -> bool:
+        """Check if the flat representation was requested"""
+        return self.request.query_params.get("flat") in ("true", "1")
+
+    def get_serializer_class(self):
+        if self.is_flat():
+            return FlatTransferSerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
         """
-        Return transfers linked to selected account
+        Return transfers with every related row the serializer reads
+        joined in, so a page takes the same number of queries at any size
+        """
+        queryset = super().get_queryset()
+        if self.is_flat():
+            return queryset.select_related(
+                "source", "destination", "src_bank", "dst_bank"
+            )
+        return queryset.select_related(
+            "source__bank", "destination__bank", "src_bank", "dst_bank"
+        ).with_shard_balances()
+
+    def get_querysets(self) -> list:
+        """
+        Return transfers linked to selected account, one queryset for
+        the sent and one for the received transfers so each can use its
+        (account, created) index
         """
-        if self.lookup_field is None:
-            return None
         account_id = self.kwargs[self.lookup_field]
+        start = parse_bound(self.request.query_params.get("start"), "start")
+        end = parse_bound(
+            self.request.query_params.get("end"), "end", end=True
+        )
 
-        try:
-            queryset = Transfer.objects.filter(
-                Q(source__uuid=account_id) | Q(destination__uuid=account_id)
-            )
-        except ValidationError:
-            raise Http404
+        # resolve the account once instead of joining on every row
+        account_pk = (
+            Account.objects.filter(uuid=account_id)
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if account_pk is None:
+            return []
 
-        return queryset
+        # a date range only scans the monthly partitions it covers
+        queryset = self.get_queryset()
+        if start is not None:
+            queryset = queryset.filter(created__gte=start)
+        if end is not None:
+            queryset = queryset.filter(created__lt=end)
+        return [
+            queryset.filter(source_id=account_pk),
+            queryset.filter(destination_id=account_pk),
+        ]
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginator.paginate_querysets(
+            self.get_querysets(), request, view=self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 @swagger_auto_schema(
     method="put",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         properties={
@@ -106,6 +253,7 @@ class TransferListView(generics.ListAPIView):
     responses={
         201: openapi.Response("Success", IntraBankTransferSerializer),
         400: "Bad Request",
+        429: "Too Many Requests",
     },
     operation_description="Intra-bank transfer from one account to another",
     tags=[
@@ -114,6 +262,8 @@ class TransferListView(generics.ListAPIView):
 )
 @permission_classes(IsAuthenticated)
 @api_view(["PUT"])
+@idempotent
+@rate_limited(Transfer.INTRA_BANK_TRANSFER, "source")
 def make_transfer(request):
     """Transfers fund from one account to another within the same bank"""
 
@@ -130,6 +280,134 @@ def make_transfer(request):
 
 @swagger_auto_schema(
     method="put",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            "source": openapi.Schema(
+                type=openapi.TYPE_STRING, description="($uuid) title: Source"
+            ),
+            "destination": openapi.Schema(
+                type=openapi.TYPE_STRING,
+                description="($uuid) title: Destination",
+            ),
+            "amount": openapi.Schema(
+                type=openapi.TYPE_NUMBER,
+                description="($decimal) title: Amount",
+            ),
+            "info": openapi.Schema(
+                type=openapi.TYPE_STRING,
+                description="title: Info maxLength: 255",
+            ),
+        },
+    ),
+    responses={
+        201: openapi.Response("Success", InterBankTransferSerializer),
+        400: "Bad Request",
+        429: "Too Many Requests",
+    },
+    operation_description="Inter-bank transfer from one account to an "
+    "account of another bank. The source is debited at once, the "
+    "destination is credited when the transfer is settled",
+    tags=[
+        "Transfer",
+    ],
+)
+@api_view(["PUT"])
+@permission_classes([IsAuthenticated])
+@idempotent
+@rate_limited(Transfer.INTER_BANK_TRANSFER, "source")
+def make_inter_bank_transfer(request):
+    """Queues a transfer of fund to an account of another bank"""
+
+    # copy request data, set transfer type to inter bank transfer
+    data = request.data.copy()
+    data.update({"transfer_type": Transfer.INTER_BANK_TRANSFER})
+
+    serializer = InterBankTransferSerializer(data=data)
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@swagger_auto_schema(
+    method="put",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    request_body=BatchTransferSerializer,
+    responses={
+        200: "Per transfer results, in request order",
+        400: "Bad Request",
+    },
+    operation_description="Intra-bank transfers in bulk, applied in order "
+    "within one transaction. Invalid transfers are reported and skipped",
+    tags=[
+        "Transfer",
+    ],
+)
+@api_view(["PUT"])
+@permission_classes([IsAuthenticated])
+@idempotent
+def make_batch_transfer(request):
+    """Transfers funds between accounts of the same bank in bulk"""
+
+    serializer = BatchTransferSerializer(data=request.data)
+    if serializer.is_valid():
+        results = serializer.save()
+        return Response(results, status=status.HTTP_200_OK)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@swagger_auto_schema(
+    method="put",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
+    request_body=ScheduledTransferSerializer,
+    responses={
+        201: openapi.Response("Success", ScheduledTransferSerializer),
+        400: "Bad Request",
+    },
+    operation_description="Standing order from one account to another, "
+    "made once or every day, week or month from starts_at until ends_at",
+    tags=[
+        "Transfer",
+    ],
+)
+@api_view(["PUT"])
+@permission_classes([IsAuthenticated])
+@idempotent
+def make_scheduled_transfer(request):
+    """Schedules transfers from one account to another"""
+
+    serializer = ScheduledTransferSerializer(data=request.data)
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@swagger_auto_schema(
+    method="delete",
+    responses={204: "Cancelled", 404: "Not Found"},
+    operation_description="Cancel a scheduled transfer, the transfers "
+    "already made stay",
+    tags=[
+        "Transfer",
+    ],
+)
+@api_view(["DELETE"])
+@permission_classes([IsAuthenticated])
+def cancel_scheduled_transfer(request, scheduled_id):
+    """Deletes a scheduled transfer"""
+
+    deleted, _ = ScheduledTransfer.objects.filter(uuid=scheduled_id).delete()
+    if not deleted:
+        raise Http404
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@swagger_auto_schema(
+    method="put",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         properties={
@@ -150,6 +428,7 @@ def make_transfer(request):
     responses={
         201: openapi.Response("Success", FundSerializer),
         400: "Bad Request",
+        429: "Too Many Requests",
     },
     operation_description="Add fund to an account",
     tags=[
@@ -158,6 +437,8 @@ def make_transfer(request):
 )
 @permission_classes(IsAuthenticated)
 @api_view(["PUT"])
+@idempotent
+@rate_limited(Transfer.ADD_FUND, "account_id")
 def add_fund(request, account_id):
     """Adds fund to an account"""
 
@@ -182,6 +463,7 @@ def add_fund(request, account_id):
 
 @swagger_auto_schema(
     method="put",
+    manual_parameters=[IDEMPOTENCY_KEY_PARAMETER],
     request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         properties={
@@ -201,6 +483,7 @@ def add_fund(request, account_id):
     responses={
         201: openapi.Response("Success", FundSerializer),
         400: "Bad Request",
+        429: "Too Many Requests",
     },
     operation_description="Removes fund from an account",
     tags=[
@@ -209,6 +492,8 @@ def add_fund(request, account_id):
 )
 @permission_classes(IsAuthenticated)
 @api_view(["PUT"])
+@idempotent
+@rate_limited(Transfer.REMOVE_FUND, "account_id")
 def remove_fund(request, account_id):
     """Removes fund from an account"""
 
@@ -221,3 +506,126 @@ def remove_fund(request, account_id):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+STATEMENT_OUTPUTS = {
+    "csv": ("text/csv", stream_csv),
+    "ndjson": ("application/x-ndjson", stream_ndjson),
+}
+
+
+@replica_reads
+@swagger_auto_schema(
+    method="get",
+    manual_parameters=[
+        openapi.Parameter(
+            "output",
+            openapi.IN_QUERY,
+            description="csv (default) or ndjson",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            "start",
+            openapi.IN_QUERY,
+            description="First date or datetime of the statement",
+            type=openapi.TYPE_STRING,
+        ),
+        openapi.Parameter(
+            "end",
+            openapi.IN_QUERY,
+            description="Last date, or datetime up to, of the statement",
+            type=openapi.TYPE_STRING,
+        ),
+    ],
+    responses={200: "Statement rows, oldest first", 400: "Bad Request"},
+    operation_description="Streams the statement of an account with a "
+    "running balance",
+    tags=[
+        "Transfer",
+    ],
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def account_statement(request, account_id):
+    """Streams the transfers of an account with its running balance"""
+
+    output = request.query_params.get("output", "csv")
+    if output not in STATEMENT_OUTPUTS:
+        raise APIValidationError({"output": "Choose csv or ndjson"})
+    start = parse_bound(request.query_params.get("start"), "start")
+    end = parse_bound(request.query_params.get("end"), "end", end=True)
+
+    try:
+        account = Account.objects.only("pk", "uuid").get(uuid=account_id)
+    except Account.DoesNotExist:
+        raise Http404
+
+    content_type, stream = STATEMENT_OUTPUTS[output]
+    response = StreamingHttpResponse(
+        stream(iter_statement_rows(account, start, end)),
+        content_type=content_type,
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="statement-{account.uuid}.{output}"'
+    )
+    return response
+
+
+@replica_reads
+@swagger_auto_schema(
+    method="get",
+    manual_parameters=[
+        openapi.Parameter(
+            "start",
+            openapi.IN_QUERY,
+            description="First day, defaults to 29 days before end",
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATE,
+        ),
+        openapi.Parameter(
+            "end",
+            openapi.IN_QUERY,
+            description="Last day, defaults to today",
+            type=openapi.TYPE_STRING,
+            format=openapi.FORMAT_DATE,
+        ),
+        openapi.Parameter(
+            "period",
+            openapi.IN_QUERY,
+            description="day (default), week or month",
+            type=openapi.TYPE_STRING,
+        ),
+    ],
+    responses={200: "Totals per transfer type and period", 400: "Bad Request"},
+    operation_description="Transfer counts and totals of an account per "
+    "transfer type and per day, week or month",
+    tags=[
+        "Transfer",
+    ],
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def account_summary(request, account_id):
+    """Returns the transfer totals of an account over a date range"""
+
+    period = request.query_params.get("period", "day")
+    if period not in PERIODS:
+        raise APIValidationError({"period": "Choose day, week or month"})
+    try:
+        end = parse_date(request.query_params.get("end") or "") or (
+            timezone.localdate()
+        )
+        start = parse_date(request.query_params.get("start") or "") or (
+            end - timedelta(days=29)
+        )
+    except ValueError:
+        raise APIValidationError({"detail": "Enter valid dates"})
+    if start > end:
+        raise APIValidationError({"start": "Must not be after end"})
+
+    try:
+        account = Account.objects.only("pk").get(uuid=account_id)
+    except Account.DoesNotExist:
+        raise Http404
+
+    return Response(get_summary(account, start, end, period))
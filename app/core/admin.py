@@ -1,9 +1,76 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 
-from .models import User, Bank, Account, Transfer
+from .imports import TransferImporter, TransferImportError
+from .models import (
+    User,
+    Bank,
+    Account,
+    AccountBalanceShard,
+    Transfer,
+    IdempotencyKey,
+    LedgerEntry,
+    BalanceSnapshot,
+    DailyTransferRollup,
+    Checkpoint,
+    TransferImport,
+    SettlementCycle,
+    SettlementPosition,
+    ScheduledTransfer,
+)
 
 
 admin.site.register(User)
 admin.site.register(Bank)
 admin.site.register(Account)
+admin.site.register(AccountBalanceShard)
 admin.site.register(Transfer)
+admin.site.register(IdempotencyKey)
+admin.site.register(LedgerEntry)
+admin.site.register(BalanceSnapshot)
+admin.site.register(DailyTransferRollup)
+admin.site.register(Checkpoint)
+admin.site.register(SettlementCycle)
+admin.site.register(SettlementPosition)
+admin.site.register(ScheduledTransfer)
+
+
+@admin.register(TransferImport)
+class TransferImportAdmin(admin.ModelAdmin):
+    """Upload transfer files and import them with an action"""
+
+    list_display = ["file", "created", "imported", "rejected", "finished_at"]
+    readonly_fields = ["imported", "rejected", "errors", "finished_at"]
+    actions = ["run_import"]
+
+    @admin.action(description="Import the transfers of the selected files")
+    def run_import(self, request, queryset):
+        """Import each file in the request, an import cut short by a
+        timeout carries on from its checkpoint when run again"""
+        for upload in queryset:
+
+            def on_reject(number: int, errors: dict) -> None:
+                if len(upload.errors) < TransferImport.MAX_ERRORS:
+                    upload.errors.append({"record": number, "errors": errors})
+
+            try:
+                result = TransferImporter(
+                    upload.file.path, on_reject=on_reject
+                ).run()
+            except (OSError, TransferImportError) as error:
+                self.message_user(
+                    request, f"{upload}: {error}", level=messages.ERROR
+                )
+                continue
+            upload.imported += result["imported"]
+            upload.rejected += result["rejected"]
+            upload.finished_at = timezone.now()
+            upload.save()
+            self.message_user(
+                request,
+                f"{upload}: imported {result['imported']} transfers, "
+                f"rejected {result['rejected']}",
+                level=messages.WARNING if result["rejected"] else (
+                    messages.SUCCESS
+                ),
+            )
@@ -0,0 +1,119 @@
+from functools import partial
+
+from django.db.backends.postgresql import base
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from core.db import get_pool
+
+
+Database = base.Database
+
+
+def check_connection(connection) -> bool:
+    """Return whether an idle connection still answers a query"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def reset_connection(connection) -> bool:
+    """Roll back what a returned connection left open
+
+    Returns:
+        bool: False when the connection is closed or broken
+    """
+    try:
+        if connection.closed:
+            return False
+        if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend with health checks and an optional connection pool
+    With CONN_HEALTH_CHECKS, a persistent connection kept by CONN_MAX_AGE
+    runs SELECT 1 before the first query of each request, and is replaced
+    when the server closed it, as Django 4.1 does. With POOL MAX_SIZE
+    set, connections are borrowed from a pool shared by the threads of
+    the process instead of opened per thread, and given back on close.
+    """
+
+    health_check_done = False
+    connection_pool = None
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get("POOL") or {}
+        if not options.get("MAX_SIZE"):
+            return None
+        health_checks = self.settings_dict.get("CONN_HEALTH_CHECKS")
+        # the test database changes the parameters of the same alias
+        key = (self.alias, tuple(sorted(conn_params.items())))
+        return get_pool(
+            key,
+            alias=self.alias,
+            max_size=options["MAX_SIZE"],
+            timeout=options.get("TIMEOUT", 10),
+            check=check_connection if health_checks else None,
+            reset=reset_connection,
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.acquire(
+            partial(super().get_new_connection, conn_params)
+        )
+        self.connection_pool = pool
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def connect(self):
+        # a new connection needs no check, connect sets autocommit on it
+        self.health_check_done = True
+        super().connect()
+
+    def _close(self):
+        pool, self.connection_pool = self.connection_pool, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        # closed inside atomic, Django keeps the object until the rollback
+        if self.in_atomic_block:
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # check a kept connection again before the next request uses it
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (
+            self.connection is None
+            or self.health_check_done
+            or not self.settings_dict.get("CONN_HEALTH_CHECKS")
+        ):
+            return
+        if not self.in_atomic_block and not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
+
+    def set_autocommit(self, *args, **kwargs):
+        self.close_if_health_check_failed()
+        return super().set_autocommit(*args, **kwargs)
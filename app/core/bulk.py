@@ -0,0 +1,87 @@
+import csv
+import io
+
+from django.db import connection
+
+
+def format_cents(cents: int) -> str:
+    """Return an amount in cents as a decimal string"""
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+def to_csv(rows: list) -> io.StringIO:
+    """Return the rows as a CSV file for COPY, None as NULL"""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+class RowWriter:
+    """
+    Insert rows of plain values into a table, with COPY on PostgreSQL and
+    a batched INSERT elsewhere
+    """
+
+    def __init__(self, model, columns: tuple) -> None:
+        self.table = model._meta.db_table
+        self.columns = columns
+
+    def reserve_ids(self, count: int) -> int:
+        """Return the first of count consecutive ids for the rows
+
+        Moves the id sequence past them on PostgreSQL. An insert of another
+        connection in between can take one of them, only use it on a
+        database nothing else writes to, next_ids otherwise.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    "nextval(pg_get_serial_sequence(%s, 'id')) + %s - 1)",
+                    [self.table, self.table, count],
+                )
+                return cursor.fetchone()[0] - count + 1
+            cursor.execute(f"SELECT max(id) FROM {self.table}")
+            return (cursor.fetchone()[0] or 0) + 1
+
+    def next_ids(self, count: int) -> list:
+        """Return count ids for the rows, safe beside other writers
+
+        On PostgreSQL each id is drawn from the sequence, so they need not
+        be consecutive. SQLite takes the write lock at the first insert of
+        the transaction, a concurrent insert makes the rows clash on their
+        primary key instead.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+                    "FROM generate_series(1, %s)",
+                    [self.table, count],
+                )
+                return [row[0] for row in cursor.fetchall()]
+        first = self.reserve_ids(count)
+        return list(range(first, first + count))
+
+    def write(self, rows: list) -> None:
+        """Insert the rows, tuples of values in the order of the columns
+
+        Through COPY an empty string is read as NULL like None.
+        """
+        columns = ", ".join(self.columns)
+        with connection.cursor() as cursor:
+            if connection.vendor != "postgresql":
+                placeholders = ", ".join(["%s"] * len(self.columns))
+                cursor.executemany(
+                    f"INSERT INTO {self.table} ({columns}) "
+                    f"VALUES ({placeholders})",
+                    rows,
+                )
+                return
+            cursor.copy_expert(
+                f"COPY {self.table} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                to_csv(rows),
+            )
@@ -0,0 +1,214 @@
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import OperationalError, close_old_connections, connections
+
+from core.metrics import LATENCY_BUCKETS, Histogram, current_request
+
+
+def database_sync_to_async(func):
+    """Run database work of an async view in a worker thread
+
+    Unlike ``sync_to_async`` with its default thread_sensitive=True, which
+    runs the work of every request on one shared thread, the work runs in
+    the thread pool of the event loop, so requests query the database in
+    parallel. Each worker thread keeps its own connection, which is closed
+    or kept by CONN_MAX_AGE as after a sync request, and the queries are
+    added to the metrics of the current request.
+
+    Args:
+        func (callable): the sync function
+
+    Returns:
+        callable: a coroutine function running func
+    """
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            with ExitStack() as stack:
+                stats = current_request.get()
+                if stats is not None:
+                    for connection in connections.all():
+                        stack.enter_context(
+                            connection.execute_wrapper(stats)
+                        )
+                return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time waited for a connection from the pool",
+    LATENCY_BUCKETS,
+)
+POOLS = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of open database connections shared by the threads of a
+    process
+    A thread borrows a connection when Django connects and gives it back
+    when Django closes it. When all max_size connections are borrowed,
+    threads wait for one up to timeout seconds, so however many threads
+    or async workers a process runs, it holds at most max_size connections.
+    """
+
+    def __init__(
+        self,
+        alias: str,
+        max_size: int,
+        timeout: float,
+        check=None,
+        reset=None,
+    ) -> None:
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check = check
+        self.reset = reset
+        self.condition = threading.Condition()
+        self.idle = []
+        self.size = 0
+        self.waiting = 0
+        self.opened = 0
+        self.timeouts = 0
+
+    def acquire(self, connect):
+        """Return an idle connection or one opened with connect
+
+        Args:
+            connect (callable): opens a new connection
+
+        Raises:
+            OperationalError: no connection was given back within timeout
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise OperationalError(
+                            f"No connection of the {self.alias} pool was "
+                            f"free within {self.timeout} seconds"
+                        )
+                    self.waiting += 1
+                    try:
+                        self.condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                if self.idle:
+                    connection = self.idle.pop()
+                else:
+                    connection = None
+                    self.size += 1
+            POOL_WAIT.observe((self.alias,), time.monotonic() - start)
+
+            if connection is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    self.forget()
+                    raise
+                with self.condition:
+                    self.opened += 1
+                return connection
+            # the most recently used connection is the least likely stale
+            if self.check is None or self.check(connection):
+                return connection
+            self.discard(connection)
+
+    def release(self, connection) -> None:
+        """Give a borrowed connection back, or drop it when it is broken"""
+        if self.reset is not None and not self.reset(connection):
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def discard(self, connection) -> None:
+        """Close a borrowed connection and free its place in the pool"""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self.forget()
+
+    def forget(self) -> None:
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def close_idle(self) -> None:
+        """Close the idle connections, borrowed ones are kept"""
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            self.discard(connection)
+
+    def stats(self) -> dict:
+        """Return the gauges and counters of the pool"""
+        with self.condition:
+            return {
+                "in_use": self.size - len(self.idle),
+                "idle": len(self.idle),
+                "max_size": self.max_size,
+                "waiting": self.waiting,
+                "opened": self.opened,
+                "timeouts": self.timeouts,
+            }
+
+
+def get_pool(key: tuple, **kwargs) -> ConnectionPool:
+    """Return the pool of key, created with kwargs on first use"""
+    with pools_lock:
+        pool = POOLS.get(key)
+        if pool is None:
+            pool = POOLS[key] = ConnectionPool(**kwargs)
+        return pool
+
+
+# name, type, help text and stats key of each metric of a pool
+POOL_METRICS = (
+    ("db_pool_connections", "gauge", "Connections of the pool by state"),
+    ("db_pool_max_connections", "gauge", "Size limit of the pool", "max_size"),
+    ("db_pool_waiting", "gauge", "Threads waiting to borrow", "waiting"),
+    ("db_pool_opened_total", "counter", "Connections opened", "opened"),
+    ("db_pool_timeouts_total", "counter", "Waits that timed out", "timeouts"),
+)
+
+
+def pool_metrics() -> list:
+    """Return the exposition lines of every connection pool"""
+    with pools_lock:
+        pools = [(pool.alias, pool.stats()) for pool in POOLS.values()]
+    if not pools:
+        return []
+    lines = []
+    for name, kind, help_text, *key in POOL_METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for alias, stats in pools:
+            if key:
+                lines.append(f'{name}{{alias="{alias}"}} {stats[key[0]]}')
+                continue
+            for state in ("in_use", "idle"):
+                lines.append(
+                    f'{name}{{alias="{alias}",state="{state}"}} '
+                    f"{stats[state]}"
+                )
+    lines.extend(POOL_WAIT.render(("alias",)))
+    return lines
@@ -0,0 +1,76 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    ASGIHandler reading streamed bodies off the event loop
+    Django 3.2 iterates a StreamingHttpResponse on the event loop, so a body
+    generated from the database, like an account statement, raises
+    SynchronousOnlyOperation after the headers were sent. Here the iterator
+    runs on a thread of its own for the whole response, which keeps its
+    transaction and server side cursor on one connection, and each chunk is
+    sent from the loop as it is read. The response is closed on that
+    thread too, so the generator ends its transaction where it started it.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            value = cookie.output(header="").encode("ascii").strip()
+            response_headers.append((b"Set-Cookie", value))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response_headers,
+            }
+        )
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+        # Access __iter__ and not streaming_content, as Django does
+        parts = iter(response)
+        done = object()
+        try:
+            while True:
+                part = await loop.run_in_executor(executor, next, parts, done)
+                if part is done:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": True,
+                        }
+                    )
+            await send({"type": "http.response.body"})
+        finally:
+            await loop.run_in_executor(executor, self.close, response)
+            executor.shutdown()
+
+    @staticmethod
+    def close(response) -> None:
+        """Close the response and the connections of the streaming thread"""
+        try:
+            response.close()
+        finally:
+            connections.close_all()
+
+
+def get_asgi_application() -> StreamingASGIHandler:
+    """Set up Django and return the ASGI application"""
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
@@ -0,0 +1,548 @@
+import csv
+import gzip
+import hashlib
+import json
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.bulk import RowWriter
+from core.models import (
+    Account,
+    Bank,
+    BankTotal,
+    Checkpoint,
+    LedgerEntry,
+    OutboxEvent,
+    Transfer,
+)
+from core.partitions import (
+    create_partition,
+    get_archived_before,
+    get_partitions,
+    is_partitioned,
+    month_start,
+    partition_name,
+)
+
+
+IMPORT_COLUMNS = (
+    "created",
+    "transfer_type",
+    "amount",
+    "info",
+    "source",
+    "destination",
+    "src_bank",
+    "dst_bank",
+)
+TRANSFER_COLUMNS = (
+    "id",
+    "amount",
+    "info",
+    "transfer_type",
+    "created",
+    "source_id",
+    "destination_id",
+    "src_bank_id",
+    "dst_bank_id",
+)
+LEDGER_COLUMNS = (
+    "id",
+    "transfer_id",
+    "account_id",
+    "bank_id",
+    "amount",
+    "created",
+)
+OUTBOX_COLUMNS = ("topic", "payload", "created")
+CENT = Decimal("0.01")
+
+INSUFFICIENT_FUNDS = "Account does not have enough fund"
+
+# name of the checkpoint of an import, followed by the file digest
+CHECKPOINT_PREFIX = "transfer_import:"
+
+# the fields each transfer type uses, the others must be empty
+TYPE_FIELDS = {
+    Transfer.INTRA_BANK_TRANSFER: {"source", "destination"},
+    Transfer.ADD_FUND: {"destination", "src_bank"},
+    Transfer.REMOVE_FUND: {"source", "dst_bank"},
+}
+REQUIRED_FIELDS = {
+    Transfer.INTRA_BANK_TRANSFER: {"source", "destination"},
+    Transfer.ADD_FUND: {"destination"},
+    Transfer.REMOVE_FUND: {"source"},
+}
+
+
+class TransferImportError(Exception):
+    """Raised when a file can not be imported"""
+
+
+# the records are checked without serializer fields, which cost more than
+# the rest of the import, with the rules and messages of the endpoints
+
+
+def clean_created(value) -> datetime:
+    try:
+        created = parse_datetime(value)
+    except (TypeError, ValueError):
+        created = None
+    if created is None:
+        raise ValueError("Datetime has wrong format.")
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created)
+    return created
+
+
+def clean_transfer_type(value) -> str:
+    if value not in TYPE_FIELDS:
+        raise ValueError(f'"{value}" is not a valid choice.')
+    return value
+
+
+def clean_amount(value) -> Decimal:
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite():
+        raise ValueError("A valid number is required.")
+    if amount.as_tuple().exponent < -2:
+        raise ValueError(
+            "Ensure that there are no more than 2 decimal places."
+        )
+    # setting $1 to be min transfer, as the endpoints
+    if amount < 1:
+        raise ValueError("Ensure this value is greater than or equal to 1.")
+    if amount >= 10 ** 16:
+        raise ValueError(
+            "Ensure that there are no more than 18 digits in total."
+        )
+    return amount.quantize(CENT)
+
+
+def clean_info(value) -> str:
+    value = str(value)
+    if len(value) > 255:
+        raise ValueError("Ensure this field has no more than 255 characters.")
+    return value
+
+
+def clean_uuid(value) -> str:
+    """Return a uuid in the form of str(UUID)"""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        raise ValueError("Must be a valid UUID.")
+
+
+CLEANERS = {
+    "created": clean_created,
+    "transfer_type": clean_transfer_type,
+    "amount": clean_amount,
+    "info": clean_info,
+}
+
+
+def get_file_digest(path: str) -> str:
+    """Return the sha256 hex digest of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_format(path: str) -> str:
+    """Return the format of a file by its extension, csv by default"""
+    name = path[:-3] if path.endswith(".gz") else path
+    return "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+def read_records(path: str, file_format: str):
+    """Yield the records of a CSV or NDJSON file, optionally gzipped
+
+    The file is read a line at a time. A blank NDJSON line is no record,
+    a line that is not a JSON object is yielded as None.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", newline="", encoding="utf-8") as file:
+        if file_format == "csv":
+            yield from csv.DictReader(file)
+            return
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else None
+
+
+class TransferImporter:
+    """
+    Import the transfers of a CSV or NDJSON file, one chunk of records per
+    transaction
+
+    Each record has the fields of IMPORT_COLUMNS, accounts and banks given
+    by uuid as in the API and the transfer events. The fields are checked
+    against the rules of the transfer endpoints through an in memory map
+    of uuids to ids, then each chunk locks its accounts, checks the
+    sources cover their debits in file order and writes the transfers,
+    ledger entries and events with COPY on PostgreSQL. The balances change
+    by one grouped update per chunk, the bank totals by one per bank.
+    Invalid records are skipped and passed to on_reject.
+
+    The import checkpoint, named after the file digest, counts the records
+    done and moves in the transaction of each chunk, so a run started again
+    after a crash carries on after the last committed chunk and a file
+    imported once is not imported twice.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_format: str = "",
+        chunk_size: int = None,
+        events: bool = True,
+        on_reject=None,
+    ) -> None:
+        self.path = path
+        self.file_format = file_format or get_format(path)
+        if self.file_format not in ("csv", "ndjson"):
+            raise TransferImportError(f"Unknown format {self.file_format}")
+        self.chunk_size = chunk_size or settings.TRANSFER_IMPORT_CHUNK_SIZE
+        self.events = events
+        self.on_reject = on_reject
+        self.transfers = RowWriter(Transfer, TRANSFER_COLUMNS)
+        self.entries = RowWriter(LedgerEntry, LEDGER_COLUMNS)
+        self.outbox = RowWriter(OutboxEvent, OUTBOX_COLUMNS)
+
+    def run(self) -> dict:
+        """Import the records after the checkpoint
+
+        Returns:
+            dict: the records imported, rejected and skipped as done by an
+                earlier run
+        """
+        name = CHECKPOINT_PREFIX + get_file_digest(self.path)
+        checkpoint, _ = Checkpoint.objects.get_or_create(name=name)
+        result = {"imported": 0, "rejected": 0, "skipped": checkpoint.position}
+
+        # the maps by uuid string cover the accounts and banks of the whole
+        # file, those created meanwhile are read when a chunk names them
+        self.accounts, self.account_banks, self.banks = {}, {}, {}
+        self.add_accounts(Account.objects.all())
+        self.add_banks(Bank.objects.all())
+        self.archived_before = get_archived_before()
+        self.now = timezone.now()
+        self.partitions = (
+            set(get_partitions()) if is_partitioned() else None
+        )
+
+        records = enumerate(
+            read_records(self.path, self.file_format), start=1
+        )
+        records = islice(records, checkpoint.position, None)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return result
+            imported, rejects = self.import_chunk(
+                name, chunk[0][0] - 1, chunk
+            )
+            result["imported"] += imported
+            result["rejected"] += len(rejects)
+            if self.on_reject is not None:
+                for number, errors in rejects:
+                    self.on_reject(number, errors)
+
+    def import_chunk(self, name: str, position: int, chunk: list) -> tuple:
+        """Validate and write one chunk of (number, record) in a transaction
+
+        Returns:
+            tuple: the number of imported records and a list of (number,
+                errors) of the rejected ones
+        """
+        self.load_missing(record for number, record in chunk)
+        rows, rejects = [], []
+        for number, record in chunk:
+            row, errors = self.parse(record)
+            if errors:
+                rejects.append((number, errors))
+            else:
+                rows.append((number, row))
+        self.create_partitions(row for number, row in rows)
+
+        with transaction.atomic():
+            checkpoint = Checkpoint.objects.select_for_update().get(
+                name=name
+            )
+            if checkpoint.position != position:
+                raise TransferImportError(
+                    "The file is being imported by another run"
+                )
+            balances = self.lock_accounts(row for number, row in rows)
+            accepted = []
+            for number, row in rows:
+                source = row["source_id"]
+                if source is not None:
+                    if balances[source] < row["amount"]:
+                        rejects.append(
+                            (number, {"source": INSUFFICIENT_FUNDS})
+                        )
+                        continue
+                    balances[source] -= row["amount"]
+                if row["destination_id"] is not None:
+                    balances[row["destination_id"]] += row["amount"]
+                accepted.append(row)
+            self.write(accepted)
+            checkpoint.position = position + len(chunk)
+            checkpoint.save()
+
+        rejects.sort(key=lambda reject: reject[0])
+        return len(accepted), rejects
+
+    def add_accounts(self, accounts) -> None:
+        """Add the ids and banks of an account queryset to the maps"""
+        for account_uuid, pk, bank_id in accounts.values_list(
+            "uuid", "pk", "bank_id"
+        ).iterator(chunk_size=10000):
+            self.accounts[str(account_uuid)] = pk
+            self.account_banks[pk] = bank_id
+
+    def add_banks(self, banks) -> None:
+        """Add the ids of a bank queryset to the map"""
+        for bank_uuid, pk in banks.values_list("uuid", "pk"):
+            self.banks[str(bank_uuid)] = pk
+
+    def load_missing(self, records) -> None:
+        """Add the accounts and banks named by the records but not yet in
+        the maps, each read by one query"""
+        missing = set()
+        for record in records:
+            for field in ("source", "destination", "src_bank", "dst_bank"):
+                value = record and record.get(field)
+                if not value or value in self.accounts or value in self.banks:
+                    continue
+                try:
+                    missing.add(clean_uuid(value))
+                except ValueError:
+                    pass
+        missing.difference_update(self.accounts, self.banks)
+        if missing:
+            self.add_accounts(Account.objects.filter(uuid__in=missing))
+            self.add_banks(Bank.objects.filter(uuid__in=missing))
+
+    def parse(self, record) -> tuple:
+        """Check the fields of a record
+
+        Returns:
+            tuple: the transfer values and a dict of errors by field, one
+                of them empty
+        """
+        if record is None:
+            return None, {"record": "Not a JSON object"}
+        row, errors = {}, {}
+        for field, clean in CLEANERS.items():
+            value = record.get(field)
+            if value is None or value == "":
+                errors[field] = "This field is required."
+                continue
+            try:
+                row[field] = clean(value)
+            except ValueError as error:
+                errors[field] = str(error)
+        transfer_type = row.get("transfer_type")
+
+        for field, known, key in (
+            ("source", self.accounts, "source_id"),
+            ("destination", self.accounts, "destination_id"),
+            ("src_bank", self.banks, "src_bank_id"),
+            ("dst_bank", self.banks, "dst_bank_id"),
+        ):
+            row[key] = None
+            value = record.get(field)
+            if transfer_type is None:
+                continue
+            if not value:
+                if field in REQUIRED_FIELDS[transfer_type]:
+                    errors[field] = "This field is required."
+                continue
+            if field not in TYPE_FIELDS[transfer_type]:
+                errors[field] = f"Not used by {transfer_type} transfers."
+                continue
+            if value not in known:
+                try:
+                    value = clean_uuid(value)
+                except ValueError as error:
+                    errors[field] = str(error)
+                    continue
+            if value not in known:
+                errors[field] = f"Object with uuid={value} does not exist."
+                continue
+            row[key] = known[value]
+            row[field] = value
+
+        created = row.get("created")
+        if created is not None:
+            if created > self.now:
+                errors["created"] = "Can not be in the future."
+            elif self.archived_before and created < self.archived_before:
+                errors["created"] = "Falls in an archived month."
+        if (
+            transfer_type == Transfer.INTRA_BANK_TRANSFER
+            and row["source_id"]
+            and row["destination_id"]
+            and self.account_banks[row["source_id"]]
+            != self.account_banks[row["destination_id"]]
+        ):
+            errors["source"] = (
+                "Source bank does not match with destination bank"
+            )
+        if errors:
+            return None, errors
+        return row, {}
+
+    def create_partitions(self, rows) -> None:
+        """Create the missing monthly partitions of the rows"""
+        if self.partitions is None:
+            return
+        for month in {month_start(row["created"]) for row in rows}:
+            name = partition_name(month)
+            if name not in self.partitions:
+                create_partition(month)
+                self.partitions.add(name)
+
+    def lock_accounts(self, rows) -> dict:
+        """Lock the accounts of the rows and return their balances
+
+        The balance shards of the sources are consolidated first, so the
+        balance of each source is all its money, as for a batch of
+        transfers.
+        """
+        pks, sources = set(), set()
+        for row in rows:
+            if row["source_id"] is not None:
+                sources.add(row["source_id"])
+            pks.update(
+                pk
+                for pk in (row["source_id"], row["destination_id"])
+                if pk is not None
+            )
+        Account.objects.lock(*pks)
+        for pk in Account.objects.filter(
+            pk__in=sources, shard_count__gt=0
+        ).values_list("pk", flat=True):
+            Account.objects.consolidate(pk)
+        return dict(
+            Account.objects.filter(pk__in=pks).values_list("pk", "balance")
+        )
+
+    def write(self, rows: list) -> None:
+        """Write the transfers of the rows with their ledger entries,
+        events, balance changes and bank totals"""
+        if not rows:
+            return
+        adapt = connection.ops.adapt_datetimefield_value
+        transfer_ids = self.transfers.next_ids(len(rows))
+        entry_ids = self.entries.next_ids(2 * len(rows))
+        transfers, entries, events = [], [], []
+        deltas = defaultdict(Decimal)
+        totals = defaultdict(lambda: defaultdict(Decimal, transfer_count=0))
+
+        for index, row in enumerate(rows):
+            transfer_id = transfer_ids[index]
+            amount = str(row["amount"])
+            created = str(adapt(row["created"]))
+            source, destination = row["source_id"], row["destination_id"]
+            transfers.append(
+                (
+                    transfer_id,
+                    amount,
+                    row["info"],
+                    row["transfer_type"],
+                    created,
+                    source,
+                    destination,
+                    row["src_bank_id"],
+                    row["dst_bank_id"],
+                )
+            )
+            # the entries of Transfer.get_ledger_entries
+            entries.append(
+                (
+                    entry_ids[2 * index],
+                    transfer_id,
+                    source,
+                    None if source else row["src_bank_id"],
+                    str(-row["amount"]),
+                    created,
+                )
+            )
+            entries.append(
+                (
+                    entry_ids[2 * index + 1],
+                    transfer_id,
+                    destination,
+                    None if destination else row["dst_bank_id"],
+                    amount,
+                    created,
+                )
+            )
+            if self.events:
+                payload = {
+                    "id": transfer_id,
+                    "transfer_type": row["transfer_type"],
+                    "amount": amount,
+                    "info": row["info"],
+                    "created": row["created"],
+                    "source": row.get("source"),
+                    "destination": row.get("destination"),
+                    "src_bank": row.get("src_bank"),
+                    "dst_bank": row.get("dst_bank"),
+                }
+                events.append(
+                    (
+                        OutboxEvent.TRANSFER_CREATED,
+                        json.dumps(payload, cls=DjangoJSONEncoder),
+                        created,
+                    )
+                )
+
+            if source is not None:
+                deltas[source] -= row["amount"]
+            if destination is not None:
+                deltas[destination] += row["amount"]
+            # the totals of Transfer.update_accounts
+            if row["transfer_type"] == Transfer.INTRA_BANK_TRANSFER:
+                bank_totals = totals[self.account_banks[source]]
+                bank_totals["transferred"] += row["amount"]
+            elif row["transfer_type"] == Transfer.ADD_FUND:
+                bank_totals = totals[self.account_banks[destination]]
+                bank_totals["balance"] += row["amount"]
+                bank_totals["funds_added"] += row["amount"]
+            else:
+                bank_totals = totals[self.account_banks[source]]
+                bank_totals["balance"] -= row["amount"]
+                bank_totals["funds_removed"] += row["amount"]
+            bank_totals["transfer_count"] += 1
+
+        self.transfers.write(transfers)
+        self.entries.write(entries)
+        if events:
+            self.outbox.write(events)
+        Account.objects.apply_deltas(deltas)
+        for bank_id in sorted(totals):
+            BankTotal.objects.record(bank_id, **totals[bank_id])
@@ -0,0 +1,121 @@
+"""
+Django command to create the coming transfer partitions and archive the
+old ones.
+"""
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.models import Checkpoint, DailyTransferRollup
+from core.partitions import (
+    add_months,
+    archive_partition,
+    ensure_partitions,
+    get_partitions,
+    is_partitioned,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    """
+    Django command to create the monthly transfer partitions of the
+    coming months, and detach the partitions older than the kept months
+    into the archive schema or a compressed CSV file. Only months complete
+    in the daily rollups are archived, so the summaries and the reconcile
+    command still count their transfers.
+    """
+
+    help = "Create coming transfer partitions and archive old ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Months of partitions created after the current one",
+        )
+        parser.add_argument(
+            "--keep-months",
+            type=int,
+            default=12,
+            help="Months kept before the current one",
+        )
+        parser.add_argument(
+            "--before",
+            help="Archive the months before this date instead, YYYY-MM-DD",
+        )
+        parser.add_argument(
+            "--to",
+            choices=["table", "file"],
+            default="table",
+            help="Move archived months to the archive schema or to files",
+        )
+        parser.add_argument(
+            "--directory",
+            default=settings.TRANSFER_ARCHIVE_DIR,
+            help="Directory of the archive files",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the partitions to archive without archiving them",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        if not is_partitioned():
+            raise CommandError(
+                "The transfer table is not partitioned, it is on PostgreSQL "
+                "11 or later"
+            )
+
+        if not options["dry_run"]:
+            for name in ensure_partitions(options["months_ahead"]):
+                self.stdout.write(f"Created partition {name}")
+
+        if options["before"]:
+            day = parse_date(options["before"])
+            if day is None:
+                raise CommandError("Enter --before as YYYY-MM-DD")
+            cutoff = month_start(
+                timezone.make_aware(datetime.combine(day, time.min))
+            )
+        else:
+            cutoff = add_months(
+                month_start(timezone.now()), -options["keep_months"]
+            )
+        rolled_up_to = (
+            Checkpoint.objects.filter(name=DailyTransferRollup.CHECKPOINT)
+            .values_list("reached_at", flat=True)
+            .first()
+        )
+
+        archived = 0
+        for name, month in get_partitions().items():
+            end = add_months(month, 1)
+            if end > cutoff:
+                break
+            if rolled_up_to is None or end > rolled_up_to:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Kept {name}, run rollup_transfers past its end "
+                        "first"
+                    )
+                )
+                break
+            if options["dry_run"]:
+                self.stdout.write(f"Would archive {name}")
+                continue
+            target = archive_partition(
+                name, options["to"], options["directory"]
+            )
+            self.stdout.write(f"Archived {name} to {target}")
+            archived += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {archived} transfer partitions")
+        )
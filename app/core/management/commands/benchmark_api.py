@@ -0,0 +1,324 @@
+"""
+Django command to load test the bank API with concurrent clients.
+"""
+import json
+import random
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.metrics import percentile
+from core.models import Account
+
+
+DEFAULT_MIX = (
+    "make_transfer=30,add_fund=15,remove_fund=15,"
+    "transfer_list=25,bank_account_list=15"
+)
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Return the latency, throughput and query statistics of samples"""
+    latencies = sorted(sample["ms"] for sample in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(sample["status"] >= 400 for sample in samples),
+        "throughput": round(len(samples) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "queries_per_request": round(
+            sum(sample["queries"] for sample in samples) / len(samples), 2
+        )
+        if samples
+        else 0,
+    }
+
+
+class Command(BaseCommand):
+    """
+    Django command to run a weighted mix of transfer, fund and list
+    requests from concurrent in process clients against the seeded data.
+    Reports p50/p95/p99 latency, throughput and queries per request per
+    operation and writes them to a JSON results file.
+    """
+
+    help = "Load test the bank API and write the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients", type=int, default=8, help="Concurrent clients"
+        )
+        parser.add_argument(
+            "--requests", type=int, default=2000, help="Measured requests"
+        )
+        parser.add_argument(
+            "--warmup",
+            type=int,
+            default=100,
+            help="Requests run before measuring",
+        )
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help="Comma separated operation=weight pairs",
+        )
+        parser.add_argument(
+            "--accounts",
+            type=int,
+            default=1000,
+            help="Number of seeded accounts the clients pick from",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Random seed of the workload"
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark_results.json",
+            help="Path of the JSON results file",
+        )
+        parser.add_argument(
+            "--baseline",
+            help="JSON results file of an earlier run to compare against",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        mix = self.parse_mix(options["mix"])
+        accounts = list(
+            Account.objects.filter(bank__isnull=False).values_list(
+                "uuid", "bank__uuid"
+            )[: options["accounts"]]
+        )
+        if not accounts:
+            raise CommandError("No accounts, run seed_data first")
+        by_bank = defaultdict(list)
+        for account_uuid, bank_uuid in accounts:
+            by_bank[str(bank_uuid)].append(str(account_uuid))
+        if not any(len(uuids) > 1 for uuids in by_bank.values()):
+            mix.pop("make_transfer", None)
+
+        user, _ = get_user_model().objects.get_or_create(
+            username="benchmark", defaults={"email": "benchmark@example.com"}
+        )
+        token, _ = Token.objects.get_or_create(user=user)
+        if connection.vendor == "sqlite" and options["clients"] > 1:
+            self.stdout.write(
+                self.style.WARNING(
+                    "SQLite allows a single writer, the clients take turns"
+                )
+            )
+
+        self.run_clients(
+            token.key, by_bank, mix, options["warmup"], options, seed=-1
+        )
+        start = time.perf_counter()
+        samples = self.run_clients(
+            token.key,
+            by_bank,
+            mix,
+            options["requests"],
+            options,
+            seed=options["seed"],
+        )
+        elapsed = time.perf_counter() - start
+
+        by_operation = defaultdict(list)
+        for sample in samples:
+            by_operation[sample["operation"]].append(sample)
+        results = {
+            "commit": self.get_commit(),
+            "database": connection.vendor,
+            "started_at": timezone.now().isoformat(),
+            "options": {
+                "clients": options["clients"],
+                "requests": options["requests"],
+                "mix": mix,
+            },
+            "total": summarize(samples, elapsed),
+            "operations": {
+                operation: summarize(operation_samples, elapsed)
+                for operation, operation_samples in sorted(
+                    by_operation.items()
+                )
+            },
+        }
+        with open(options["output"], "w") as output:
+            json.dump(results, output, indent=2)
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)
+        self.report(results, baseline)
+        self.stdout.write(
+            self.style.SUCCESS(f"Results written to {options['output']}")
+        )
+
+    def parse_mix(self, mix: str) -> dict:
+        """Parse operation=weight pairs into a dict"""
+        weights = {}
+        for pair in mix.split(","):
+            operation, _, weight = pair.partition("=")
+            operation = operation.strip()
+            if not hasattr(self, f"op_{operation}"):
+                raise CommandError(f"Unknown operation {operation}")
+            try:
+                weights[operation] = float(weight)
+            except ValueError:
+                raise CommandError(f"Invalid weight for {operation}")
+        return weights
+
+    def run_clients(
+        self,
+        token: str,
+        by_bank: dict,
+        mix: dict,
+        count: int,
+        options: dict,
+        seed: int,
+    ) -> list:
+        """Run count requests over the clients and return the samples"""
+        clients = options["clients"]
+        operations, weights = list(mix), list(mix.values())
+        bank_uuids = list(by_bank)
+
+        def client_loop(index, share):
+            rng = random.Random(f"{seed}:{index}")
+            client = APIClient(SERVER_NAME="localhost")
+            client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+            queries = []
+
+            def count_queries(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            samples = []
+            try:
+                with connection.execute_wrapper(count_queries):
+                    for _ in range(share):
+                        operation = rng.choices(operations, weights)[0]
+                        bank_uuid = rng.choice(bank_uuids)
+                        queries.clear()
+                        start = time.perf_counter()
+                        res = getattr(self, f"op_{operation}")(
+                            client, rng, bank_uuid, by_bank[bank_uuid]
+                        )
+                        samples.append(
+                            {
+                                "operation": operation,
+                                "ms": (time.perf_counter() - start) * 1000,
+                                "status": res.status_code,
+                                "queries": len(queries),
+                            }
+                        )
+            finally:
+                connection.close()
+            return samples
+
+        shares = [
+            count // clients + (index < count % clients)
+            for index in range(clients)
+        ]
+        # concurrent writers fail on SQLite instead of waiting on its lock
+        workers = 1 if connection.vendor == "sqlite" else clients
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return [
+                sample
+                for samples in executor.map(
+                    client_loop, range(clients), shares
+                )
+                for sample in samples
+            ]
+
+    def op_make_transfer(self, client, rng, bank_uuid, account_uuids):
+        source, destination = rng.sample(account_uuids, 2)
+        return client.put(
+            reverse("bank:transfer-make"),
+            {
+                "source": source,
+                "destination": destination,
+                "amount": self.random_amount(rng),
+                "info": "benchmark",
+            },
+            format="json",
+        )
+
+    def op_add_fund(self, client, rng, bank_uuid, account_uuids):
+        return client.put(
+            reverse("bank:fund-add", args=[rng.choice(account_uuids)]),
+            {"amount": self.random_amount(rng), "info": "benchmark"},
+            format="json",
+        )
+
+    def op_remove_fund(self, client, rng, bank_uuid, account_uuids):
+        return client.put(
+            reverse("bank:fund-retire", args=[rng.choice(account_uuids)]),
+            {"amount": self.random_amount(rng), "info": "benchmark"},
+            format="json",
+        )
+
+    def op_transfer_list(self, client, rng, bank_uuid, account_uuids):
+        return client.get(
+            reverse("bank:transfer-list", args=[rng.choice(account_uuids)])
+        )
+
+    def op_bank_account_list(self, client, rng, bank_uuid, account_uuids):
+        return client.get(
+            reverse("bank:bank-account-list", args=[bank_uuid])
+        )
+
+    def random_amount(self, rng) -> str:
+        return f"{rng.randint(100, 10000) / 100:.2f}"
+
+    def get_commit(self) -> str:
+        """Return the current git commit, if there is one"""
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+
+    def report(self, results: dict, baseline: dict = None) -> None:
+        """Print the results, with the change from the baseline if given"""
+        header = (
+            f"{'operation':<18}{'requests':>9}{'errors':>7}{'req/s':>8}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        )
+        if baseline:
+            header += f"{'p95 vs base':>13}"
+        self.stdout.write(header)
+
+        rows = list(results["operations"].items())
+        rows.append(("total", results["total"]))
+        for operation, stats in rows:
+            line = (
+                f"{operation:<18}{stats['requests']:>9}{stats['errors']:>7}"
+                f"{stats['throughput']:>8.0f}{stats['p50_ms']:>9.1f}"
+                f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+                f"{stats['queries_per_request']:>9.1f}"
+            )
+            if baseline:
+                base = (
+                    baseline["total"]
+                    if operation == "total"
+                    else baseline["operations"].get(operation)
+                )
+                if base and base["p95_ms"]:
+                    change = stats["p95_ms"] / base["p95_ms"] - 1
+                    line += f"{change:>+13.0%}"
+            self.stdout.write(line)
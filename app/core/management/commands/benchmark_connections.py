@@ -0,0 +1,213 @@
+"""
+Django command to compare how the API keeps its database connections.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.db import POOLS
+from core.metrics import percentile
+from core.models import Bank
+
+
+# database settings of each mode
+MODES = {
+    "new": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False, "POOL": {}},
+    "persistent": {
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": False,
+        "POOL": {},
+    },
+    "checked": {"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True, "POOL": {}},
+    "pool": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": True, "POOL": None},
+}
+
+
+class Command(BaseCommand):
+    """
+    Django command to load the bank list from concurrent in process
+    clients once per connection mode: a new connection per request,
+    persistent connections with and without health checks, and the
+    connection pool. The directory cache is bypassed so every request
+    queries the database, and each request opens and closes its
+    connections as under a server. Reports p50/p95/p99 latency,
+    throughput and the connections opened per mode.
+    """
+
+    help = "Compare new, persistent and pooled database connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clients", type=int, default=16, help="Concurrent clients"
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=2000,
+            help="Measured requests per mode",
+        )
+        parser.add_argument(
+            "--pool-size",
+            type=int,
+            default=4,
+            help="Connections of the pool in the pool mode",
+        )
+        parser.add_argument(
+            "--modes",
+            default=",".join(MODES),
+            help="Comma separated modes to run",
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark_connections.json",
+            help="Path of the JSON results file",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        modes = [mode.strip() for mode in options["modes"].split(",")]
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f"Unknown mode {mode}")
+        if connections[DEFAULT_DB_ALIAS].vendor != "postgresql":
+            raise CommandError("The connection modes need PostgreSQL")
+        if not Bank.objects.exists():
+            raise CommandError("No banks, run seed_data first")
+        user, _ = get_user_model().objects.get_or_create(
+            username="benchmark", defaults={"email": "benchmark@example.com"}
+        )
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        connections.close_all()
+
+        # every new thread connects with the settings of the running mode
+        database = connections.databases[DEFAULT_DB_ALIAS]
+        saved = {key: database.get(key) for key in MODES["new"]}
+        results = {}
+        try:
+            with override_settings(
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.dummy."
+                        "DummyCache"
+                    }
+                },
+                DIRECTORY_CACHE="default",
+            ):
+                for mode in modes:
+                    database.update(MODES[mode])
+                    if mode == "pool":
+                        database["POOL"] = {
+                            "MAX_SIZE": options["pool_size"],
+                            "TIMEOUT": 10,
+                        }
+                    results[mode] = self.run_mode(options)
+        finally:
+            database.update(saved)
+            for pool in POOLS.values():
+                pool.close_idle()
+
+        with open(options["output"], "w") as output:
+            json.dump(
+                {
+                    "options": {
+                        "clients": options["clients"],
+                        "requests": options["requests"],
+                        "pool_size": options["pool_size"],
+                    },
+                    "modes": results,
+                },
+                output,
+                indent=2,
+            )
+        self.stdout.write(
+            f"{'mode':<11}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'p99 ms':>9}{'opened':>8}{'errors':>8}"
+        )
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:<11}{stats['throughput']:>8.0f}"
+                f"{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+                f"{stats['p99_ms']:>9.2f}{stats['opened']:>8}"
+                f"{stats['errors']:>8}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Results written to {options['output']}")
+        )
+
+    def run_mode(self, options: dict) -> dict:
+        """Run the clients with the current database settings"""
+        clients = options["clients"]
+        url = reverse("bank:bank-list")
+        created = []
+        pools_opened = self.pools_opened()
+
+        def count_connection(sender, connection, **kwargs):
+            created.append(connection.alias)
+
+        def client_loop(share):
+            client = APIClient(SERVER_NAME="localhost")
+            client.credentials(HTTP_AUTHORIZATION=f"Token {self.token}")
+            samples = []
+            try:
+                for _ in range(share):
+                    start = time.perf_counter()
+                    # the test client skips the request signals
+                    close_old_connections()
+                    res = client.get(url)
+                    close_old_connections()
+                    samples.append(
+                        ((time.perf_counter() - start) * 1000, res.status_code)
+                    )
+            finally:
+                connections.close_all()
+            return samples
+
+        count = options["requests"]
+        shares = [
+            count // clients + (index < count % clients)
+            for index in range(clients)
+        ]
+        connection_created.connect(count_connection)
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                samples = [
+                    sample
+                    for client_samples in executor.map(client_loop, shares)
+                    for sample in client_samples
+                ]
+        finally:
+            connection_created.disconnect(count_connection)
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(ms for ms, _ in samples)
+        opened = len(created)
+        if connections.databases[DEFAULT_DB_ALIAS]["POOL"]:
+            # a connection borrowed from the pool is reported as created
+            opened = self.pools_opened() - pools_opened
+        return {
+            "requests": len(samples),
+            "errors": sum(status >= 400 for _, status in samples),
+            "throughput": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "opened": opened,
+        }
+
+    def pools_opened(self) -> int:
+        return sum(
+            pool.stats()["opened"]
+            for pool in POOLS.values()
+            if pool.alias == DEFAULT_DB_ALIAS
+        )
@@ -0,0 +1,326 @@
+"""
+Django command to compare the API served by sync views under WSGI with
+async views under ASGI at high concurrency.
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework.authtoken.models import Token
+
+from core.metrics import percentile
+from core.models import Account
+
+
+DEFAULT_MIX = (
+    "bank_list=40,bank_account_list=20,transfer_list=30,"
+    "add_fund=5,make_transfer=5"
+)
+
+# uvicorn application and interface of each server mode
+MODES = {
+    "wsgi": ("app.wsgi:application", "wsgi", "False"),
+    "asgi": ("app.asgi:application", "asgi3", "True"),
+}
+
+
+class HTTPConnection:
+    """
+    Minimal HTTP/1.1 keep alive client connection
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(
+        self, method: str, path: str, headers: dict, body: bytes = b""
+    ) -> int:
+        """Send a request and return the status after reading the body"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        lines = [f"{method} {path} HTTP/1.1", "Host: localhost"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+
+        status = int((await self.reader.readline()).split()[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = (await self.reader.readline()).strip()
+            if not line:
+                break
+            name, _, value = line.decode("latin1").partition(":")
+            name, value = name.lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding":
+                chunked = value == "chunked"
+            elif name == "connection":
+                close = value == "close"
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return status
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    """
+    Django command to start the API under uvicorn once as a WSGI app with
+    the sync views and once as an ASGI app with the async views, and load
+    each with the same read heavy mix from many concurrent keep alive
+    connections. Reports throughput and p50/p95/p99 latency per mode and
+    writes them to a JSON results file.
+    """
+
+    help = "Compare sync WSGI and async ASGI serving at high concurrency"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=200,
+            help="Concurrent connections",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=10,
+            help="Seconds measured per mode",
+        )
+        parser.add_argument(
+            "--warmup",
+            type=float,
+            default=2,
+            help="Seconds run before measuring",
+        )
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help="Comma separated operation=weight pairs",
+        )
+        parser.add_argument(
+            "--modes",
+            default="wsgi,asgi",
+            help="Comma separated server modes to run, wsgi and asgi",
+        )
+        parser.add_argument(
+            "--accounts",
+            type=int,
+            default=1000,
+            help="Number of seeded accounts the clients pick from",
+        )
+        parser.add_argument(
+            "--port", type=int, default=8765, help="Port of the server"
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark_servers.json",
+            help="Path of the JSON results file",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        mix = {}
+        for pair in options["mix"].split(","):
+            operation, _, weight = pair.partition("=")
+            if not hasattr(self, f"op_{operation.strip()}"):
+                raise CommandError(f"Unknown operation {operation}")
+            mix[operation.strip()] = float(weight)
+        modes = [mode.strip() for mode in options["modes"].split(",")]
+        for mode in modes:
+            if mode not in MODES:
+                raise CommandError(f"Unknown mode {mode}")
+
+        self.by_bank = defaultdict(list)
+        for account_uuid, bank_uuid in Account.objects.values_list(
+            "uuid", "bank__uuid"
+        )[: options["accounts"]]:
+            self.by_bank[str(bank_uuid)].append(str(account_uuid))
+        self.by_bank = {
+            bank: uuids
+            for bank, uuids in self.by_bank.items()
+            if len(uuids) > 1
+        }
+        if not self.by_bank:
+            raise CommandError("No accounts, run seed_data first")
+        user, _ = get_user_model().objects.get_or_create(
+            username="benchmark", defaults={"email": "benchmark@example.com"}
+        )
+        token, _ = Token.objects.get_or_create(user=user)
+        self.headers = {
+            "Authorization": f"Token {token.key}",
+            "Content-Type": "application/json",
+        }
+
+        results = {}
+        for mode in modes:
+            server = self.start_server(mode, options["port"])
+            try:
+                results[mode] = asyncio.run(self.load(mix, options))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+        with open(options["output"], "w") as output:
+            json.dump(
+                {
+                    "database": settings.DATABASES["default"]["ENGINE"],
+                    "options": {
+                        "concurrency": options["concurrency"],
+                        "duration": options["duration"],
+                        "mix": mix,
+                    },
+                    "modes": results,
+                },
+                output,
+                indent=2,
+            )
+
+        self.stdout.write(
+            f"{'mode':<6}{'requests':>10}{'errors':>8}{'req/s':>8}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        )
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:<6}{stats['requests']:>10}{stats['errors']:>8}"
+                f"{stats['throughput']:>8.0f}{stats['p50_ms']:>9.1f}"
+                f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Results written to {options['output']}")
+        )
+
+    def start_server(self, mode: str, port: int) -> subprocess.Popen:
+        """Start uvicorn in the given mode and wait until it accepts"""
+        application, interface, async_views = MODES[mode]
+        env = dict(os.environ, ASYNC_VIEWS=async_views)
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                application,
+                "--interface",
+                interface,
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+                "--no-access-log",
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), 1).close()
+                return server
+            except OSError:
+                if server.poll() is not None:
+                    break
+                time.sleep(0.2)
+        server.kill()
+        raise CommandError(f"The {mode} server did not start")
+
+    async def load(self, mix: dict, options: dict) -> dict:
+        """Run the clients for warmup plus duration seconds"""
+        operations, weights = list(mix), list(mix.values())
+        start = time.perf_counter()
+        measured_from = start + options["warmup"]
+        stop = measured_from + options["duration"]
+        latencies, errors = [], 0
+
+        async def client(index):
+            nonlocal errors
+            rng = random.Random(index)
+            connection = HTTPConnection("127.0.0.1", options["port"])
+            try:
+                while time.perf_counter() < stop:
+                    operation = rng.choices(operations, weights)[0]
+                    bank_uuid = rng.choice(list(self.by_bank))
+                    method, path, body = getattr(self, f"op_{operation}")(
+                        rng, bank_uuid, self.by_bank[bank_uuid]
+                    )
+                    sent = time.perf_counter()
+                    try:
+                        status = await connection.request(
+                            method, path, self.headers, body
+                        )
+                    except (OSError, ValueError, IndexError):
+                        status = 599
+                        connection.close()
+                    if sent >= measured_from:
+                        latencies.append((time.perf_counter() - sent) * 1000)
+                        errors += status >= 400
+            finally:
+                connection.close()
+
+        await asyncio.gather(
+            *(client(index) for index in range(options["concurrency"]))
+        )
+        latencies.sort()
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput": round(len(latencies) / options["duration"], 1),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+        }
+
+    def op_bank_list(self, rng, bank_uuid, account_uuids):
+        return "GET", "/bank/", b""
+
+    def op_bank_account_list(self, rng, bank_uuid, account_uuids):
+        return "GET", f"/bank/{bank_uuid}/account/", b""
+
+    def op_transfer_list(self, rng, bank_uuid, account_uuids):
+        return "GET", f"/{rng.choice(account_uuids)}/list/", b""
+
+    def op_add_fund(self, rng, bank_uuid, account_uuids):
+        body = {"amount": self.random_amount(rng), "info": "benchmark"}
+        return (
+            "PUT",
+            f"/{rng.choice(account_uuids)}/add/",
+            json.dumps(body).encode(),
+        )
+
+    def op_make_transfer(self, rng, bank_uuid, account_uuids):
+        source, destination = rng.sample(account_uuids, 2)
+        body = {
+            "source": source,
+            "destination": destination,
+            "amount": self.random_amount(rng),
+            "info": "benchmark",
+        }
+        return "PUT", "/transfer/", json.dumps(body).encode()
+
+    def random_amount(self, rng) -> str:
+        return f"{rng.randint(100, 10000) / 100:.2f}"
@@ -0,0 +1,104 @@
+"""
+Django command to measure credit throughput on a hot account.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Account, Transfer
+from core.utils import sample_bank, sample_account
+
+
+class Command(BaseCommand):
+    """
+    Django command to run parallel add fund transfers into one account for
+    each shard count and report the credits per second. The benchmark bank
+    is deleted afterwards.
+    """
+
+    help = "Measure hot account credit throughput against the shard count"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shards",
+            type=int,
+            nargs="+",
+            default=[0, 4, 16],
+            help="Shard counts to measure",
+        )
+        parser.add_argument(
+            "--writers",
+            type=int,
+            default=32,
+            help="Number of parallel writers",
+        )
+        parser.add_argument(
+            "--credits",
+            type=int,
+            default=2000,
+            help="Number of credits per shard count",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=5,
+            help="Milliseconds each transaction stays open after the "
+            "credit, standing in for the database round trips and commit "
+            "time of a remote database",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        bank = sample_bank(name="benchmark_sharding")
+        try:
+            self.stdout.write("shards  credits/s  balance")
+            for count in options["shards"]:
+                account = sample_account(bank=bank, name="hot")
+                Account.objects.reshard(account.pk, count)
+                account.refresh_from_db()
+
+                elapsed = self.run_credits(
+                    account,
+                    options["writers"],
+                    options["credits"],
+                    options["latency"] / 1000,
+                )
+                account = Account.objects.with_shard_balance().get(
+                    pk=account.pk
+                )
+                self.stdout.write(
+                    f"{count:>6}  {options['credits'] / elapsed:>9.0f}"
+                    f"  {account.total_balance}"
+                )
+        finally:
+            bank.delete()
+
+    def run_credits(
+        self, account: Account, writers: int, credits: int, latency: float
+    ) -> float:
+        """Run the credits from parallel writers and return the seconds"""
+
+        def writer(count):
+            try:
+                for _ in range(count):
+                    with transaction.atomic():
+                        Transfer.objects.create(
+                            destination=account,
+                            amount=1,
+                            info="benchmark",
+                            transfer_type=Transfer.ADD_FUND,
+                        )
+                        time.sleep(latency)
+            finally:
+                connection.close()
+
+        shares = [
+            credits // writers + (index < credits % writers)
+            for index in range(writers)
+        ]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            list(executor.map(writer, shares))
+        return time.perf_counter() - start
@@ -0,0 +1,79 @@
+"""
+Django command to import a CSV or NDJSON file of historical transfers.
+"""
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import TransferImporter, TransferImportError
+
+
+class Command(BaseCommand):
+    """
+    Django command to stream a file of transfers into the database one
+    chunk per transaction, with the balances, ledger entries and bank
+    totals the transfers give. A run stopped midway carries on from the
+    last committed chunk when started again on the same file.
+    """
+
+    help = "Import historical transfers from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, optionally .gz")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "ndjson"],
+            help="Format of the file, by default from its extension",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.TRANSFER_IMPORT_CHUNK_SIZE,
+            help="Records validated and written per transaction",
+        )
+        parser.add_argument(
+            "--no-events",
+            action="store_true",
+            help="Do not add the transfer events to the outbox",
+        )
+        parser.add_argument(
+            "--rejects",
+            help="Write the rejected records as NDJSON to this file instead "
+            "of the error output",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        rejects = open(options["rejects"], "a") if options["rejects"] else None
+
+        def on_reject(number: int, errors: dict) -> None:
+            if rejects is not None:
+                rejects.write(
+                    json.dumps({"record": number, "errors": errors}) + "\n"
+                )
+                return
+            for field, message in errors.items():
+                self.stderr.write(f"Record {number}: {field}: {message}")
+
+        try:
+            result = TransferImporter(
+                options["path"],
+                file_format=options["format"],
+                chunk_size=options["chunk_size"],
+                events=not options["no_events"],
+                on_reject=on_reject,
+            ).run()
+        except (OSError, TransferImportError) as error:
+            raise CommandError(str(error))
+        finally:
+            if rejects is not None:
+                rejects.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result['imported']} transfers, rejected "
+                f"{result['rejected']}, skipped {result['skipped']} records "
+                "done by earlier runs"
+            )
+        )
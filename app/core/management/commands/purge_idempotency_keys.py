@@ -0,0 +1,38 @@
+"""
+Django command to delete expired idempotency keys.
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """Django command to delete expired idempotency keys in batches."""
+
+    help = "Delete expired idempotency keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of keys deleted per query",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        now = timezone.now()
+        deleted = 0
+        while True:
+            pks = list(
+                IdempotencyKey.objects.filter(expires_at__lte=now)
+                .values_list("pk", flat=True)[: options["batch_size"]]
+            )
+            if not pks:
+                break
+            deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys")
+        )
@@ -0,0 +1,227 @@
+"""
+Django command to check account balances and bank totals against the
+transfer history.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import (
+    Account,
+    BalanceSnapshot,
+    Bank,
+    BankTotal,
+    DailyTransferRollup,
+    Transfer,
+)
+from core.partitions import get_archived_before
+
+
+def init_worker() -> None:
+    """Set Django up in a spawned worker, forked ones inherit it"""
+    django.setup()
+
+
+def consistent_read() -> None:
+    """Make the statements of the running transaction share one snapshot
+
+    Balances and transfers are read by separate statements, so under READ
+    COMMITTED a transfer committed between them would show up as drift.
+    Only the outermost atomic block starts the transaction and can set it.
+    """
+    if connection.vendor == "postgresql" and not connection.savepoint_ids:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+            )
+
+
+def net_transfers(account_ids: list) -> dict:
+    """Return the received minus the sent amount of each account
+
+    Each side is one grouped scan of the (account, created) index over the
+    chunk of accounts. The transfers of archived months are counted from
+    their daily rollups.
+    """
+    net = {}
+    transfers = Transfer.objects.all()
+    archived_before = get_archived_before()
+    if archived_before is not None:
+        transfers = transfers.filter(created__gte=archived_before)
+        for account_id, total in (
+            DailyTransferRollup.objects.filter(
+                account_id__in=account_ids,
+                day__lt=timezone.localdate(archived_before),
+            )
+            .values_list("account_id")
+            .annotate(total=Sum("credit") - Sum("debit"))
+            .order_by()
+        ):
+            net[account_id] = total
+    for field, sign in (("destination_id", 1), ("source_id", -1)):
+        for account_id, total in (
+            transfers.filter(**{f"{field}__in": account_ids})
+            .values_list(field)
+            .annotate(total=Sum("amount"))
+            .order_by()
+        ):
+            net[account_id] = net.get(account_id, Decimal(0)) + sign * total
+    return net
+
+
+def reconcile_bank(bank_id: int, chunk_size: int) -> dict:
+    """Check the accounts and totals of one bank
+
+    The accounts are read in primary key chunks, each in its own
+    transaction, so memory is bounded by the chunk size whatever the
+    number of transfers.
+
+    Args:
+        bank_id (int): primary key of the bank
+        chunk_size (int): accounts checked per transaction
+
+    Returns:
+        dict: the number of accounts checked, the drifted accounts and
+            the stored and actual bank balance
+    """
+    result = {"bank_id": bank_id, "accounts": 0, "drifted": []}
+    start = 0
+    while True:
+        with transaction.atomic():
+            consistent_read()
+            accounts = list(
+                Account.objects.filter(bank_id=bank_id, pk__gt=start)
+                .with_shard_balance()
+                .order_by("pk")
+                .values_list("pk", "uuid", "balance", "shard_balance")[
+                    :chunk_size
+                ]
+            )
+            if not accounts:
+                break
+            start = accounts[-1][0]
+            account_ids = [account[0] for account in accounts]
+            opening = dict(
+                BalanceSnapshot.objects.filter(
+                    account_id__in=account_ids, last_entry_id=0
+                ).values_list("account_id", "balance")
+            )
+            net = net_transfers(account_ids)
+
+        for pk, uuid, balance, shard_balance in accounts:
+            actual = balance + shard_balance
+            expected = opening.get(pk, Decimal(0)) + net.get(pk, Decimal(0))
+            if actual != expected:
+                result["drifted"].append((str(uuid), actual, expected))
+        result["accounts"] += len(accounts)
+
+    # the stored totals against the balances, read in one snapshot
+    with transaction.atomic():
+        consistent_read()
+        actual = (
+            Account.objects.filter(bank_id=bank_id)
+            .with_shard_balance()
+            .aggregate(total=Sum("balance") + Sum("shard_balance"))
+        )
+        stored = BankTotal.objects.filter(bank_id=bank_id).aggregate(
+            total=Sum("balance")
+        )
+        result["actual"] = actual["total"] or Decimal(0)
+        result["stored"] = stored["total"] or Decimal(0)
+    return result
+
+
+class Command(BaseCommand):
+    """
+    Django command to recompute the balance of every account from its
+    opening balance and transfers, and the balance of every bank from its
+    accounts, and report where they differ from the stored ones. Banks are
+    checked in parallel by a pool of processes.
+    """
+
+    help = "Check account balances and bank totals against the transfers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Processes checking banks in parallel, 1 checks them in "
+            "this process",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of accounts checked per transaction",
+        )
+        parser.add_argument(
+            "--fix-totals",
+            action="store_true",
+            help="Reset drifted bank totals to the sum of their accounts",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        bank_ids = list(
+            Bank.objects.order_by("pk").values_list("pk", flat=True)
+        )
+        chunk_sizes = [options["chunk_size"]] * len(bank_ids)
+
+        if options["workers"] > 1 and len(bank_ids) > 1:
+            # workers open their own connections, never the parent's
+            connections.close_all()
+            with ProcessPoolExecutor(
+                options["workers"], initializer=init_worker
+            ) as pool:
+                results = list(
+                    pool.map(reconcile_bank, bank_ids, chunk_sizes)
+                )
+        else:
+            results = list(map(reconcile_bank, bank_ids, chunk_sizes))
+
+        checked = drifted = 0
+        drifted_banks = []
+        for result in results:
+            checked += result["accounts"]
+            drifted += len(result["drifted"])
+            for uuid, actual, expected in result["drifted"]:
+                self.stdout.write(
+                    f"Account {uuid}: balance {actual}, "
+                    f"transfers give {expected}, "
+                    f"drift {actual - expected}"
+                )
+            if result["stored"] != result["actual"]:
+                drifted_banks.append(result)
+                self.stdout.write(
+                    f"Bank {result['bank_id']}: totals {result['stored']}, "
+                    f"accounts {result['actual']}, "
+                    f"drift {result['stored'] - result['actual']}"
+                )
+
+        if options["fix_totals"]:
+            for result in drifted_banks:
+                BankTotal.objects.record(
+                    result["bank_id"],
+                    balance=result["actual"] - result["stored"],
+                )
+            drifted_banks = []
+
+        if drifted or drifted_banks:
+            raise CommandError(
+                f"Checked {checked} accounts in {len(bank_ids)} banks, "
+                f"{drifted} accounts and {len(drifted_banks)} bank totals "
+                "drifted"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Checked {checked} accounts in {len(bank_ids)} banks, "
+                "no drift"
+            )
+        )
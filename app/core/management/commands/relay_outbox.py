@@ -0,0 +1,117 @@
+"""
+Django command to publish the outbox events to the configured sinks.
+"""
+import logging
+import signal
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.metrics import percentile
+from core.outbox import get_sinks, purge_published, relay_batch
+
+
+logger = logging.getLogger(__name__)
+
+# lag samples kept for the report of a long running relay
+LAG_SAMPLES = 100000
+
+
+class Command(BaseCommand):
+    """
+    Django command to relay the outbox: read the pending events in id
+    order in batches, publish each batch to every sink and mark it
+    published. Polls for new events until stopped, or until the outbox is
+    drained with --once, then reports the throughput and the lag between
+    an event being written and published. A failed batch stays pending and
+    is retried after --interval.
+    """
+
+    help = "Publish the outbox events to the sinks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sinks",
+            default=",".join(settings.OUTBOX_SINKS),
+            help="Comma separated sinks, file, queue, webhook or dotted "
+            "paths of Sink classes",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Events published per transaction",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Seconds to wait when no event is pending",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop once no event is pending",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        sinks = get_sinks(options["sinks"].split(","))
+        self.stopping = False
+        # finish the running batch on a stop from the process manager
+        signal.signal(signal.SIGTERM, self.stop)
+
+        published = 0
+        lags = deque(maxlen=LAG_SAMPLES)
+        purged_at = None
+        start = time.perf_counter()
+        try:
+            while not self.stopping:
+                try:
+                    events = relay_batch(sinks, options["batch_size"])
+                except Exception:
+                    if options["once"]:
+                        raise
+                    logger.exception("Publishing an outbox batch failed")
+                    time.sleep(options["interval"])
+                    continue
+                published += len(events)
+                lags.extend(
+                    (event.published_at - event.created).total_seconds()
+                    for event in events
+                )
+                if events:
+                    continue
+                if purged_at is None or timezone.now() - purged_at > (
+                    timedelta(minutes=5)
+                ):
+                    purged_at = timezone.now()
+                    purge_published(
+                        purged_at - timedelta(hours=settings.OUTBOX_KEEP_HOURS)
+                    )
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for sink in sinks:
+                sink.close()
+        elapsed = time.perf_counter() - start
+
+        lags = sorted(lags)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Published {published} events in {elapsed:.1f} s "
+                f"({published / elapsed:.0f}/s), lag p50 "
+                f"{percentile(lags, 50) * 1000:.0f} ms, p99 "
+                f"{percentile(lags, 99) * 1000:.0f} ms"
+            )
+        )
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
@@ -0,0 +1,177 @@
+"""
+Django command to roll new ledger entries into daily transfer rollups.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import Checkpoint, DailyTransferRollup, LedgerEntry
+
+
+AMOUNT_FIELD = models.DecimalField(decimal_places=2, max_digits=18)
+
+
+class Command(BaseCommand):
+    """
+    Django command to add the ledger entries after the rollup checkpoint to
+    the per account, day and transfer type rollups. Only the new entries
+    are read, up to an id watermark, and every run leaves the days before
+    its cutoff complete. Entries count on the day of their transfer.
+    """
+
+    help = "Roll new ledger entries into the daily transfer rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50000,
+            help="Range of ledger entry ids rolled up per transaction",
+        )
+        parser.add_argument(
+            "--lag",
+            type=int,
+            default=60,
+            help="Skip entries newer than this many seconds, so entries of "
+            "transactions still running are not passed over",
+        )
+
+    def get_watermark(self, lag: int):
+        """Return the (last ledger entry id, time) to roll up to, or None
+
+        The last entry id is recorded with the time it was read. Once lag
+        seconds have passed, the transactions holding smaller ids have
+        committed, so a run rolls up to the watermark recorded at least lag
+        seconds before it and records a new one.
+        """
+        now = timezone.now()
+        last_entry_id = LedgerEntry.objects.aggregate(last=Max("id"))[
+            "last"
+        ] or 0
+        if lag <= 0:
+            return last_entry_id, now
+        Checkpoint.objects.get_or_create(name=DailyTransferRollup.WATERMARK)
+        with transaction.atomic():
+            watermark = Checkpoint.objects.select_for_update().get(
+                name=DailyTransferRollup.WATERMARK
+            )
+            previous = watermark.position, watermark.reached_at
+            if (
+                watermark.reached_at is None
+                or watermark.reached_at <= now - timedelta(seconds=lag)
+            ):
+                watermark.position = last_entry_id
+                watermark.reached_at = now
+                watermark.save()
+        if previous[1] is None or previous[1] > now - timedelta(seconds=lag):
+            return None
+        return previous
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        watermark = self.get_watermark(options["lag"])
+        if watermark is None:
+            self.stdout.write(self.style.SUCCESS("Rolled up 0 account days"))
+            return
+        last_entry_id, seen_at = watermark
+        # transfers created before are complete up to the watermark
+        cutoff = seen_at - timedelta(seconds=options["lag"])
+        Checkpoint.objects.get_or_create(name=DailyTransferRollup.CHECKPOINT)
+
+        rolled = 0
+        while True:
+            with transaction.atomic():
+                # one job at a time moves the checkpoint
+                checkpoint = Checkpoint.objects.select_for_update().get(
+                    name=DailyTransferRollup.CHECKPOINT
+                )
+                if checkpoint.position >= last_entry_id:
+                    if (
+                        checkpoint.reached_at is None
+                        or checkpoint.reached_at < cutoff
+                    ):
+                        checkpoint.reached_at = cutoff
+                        checkpoint.save()
+                    break
+                upper = min(
+                    checkpoint.position + options["batch_size"], last_entry_id
+                )
+                rolled += self.roll_up(checkpoint.position, upper)
+                checkpoint.position = upper
+                checkpoint.save()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rolled up {rolled} account days")
+        )
+
+    def roll_up(self, after: int, upper: int) -> int:
+        """Add the entries with ids in (after, upper] to the rollups"""
+        totals = (
+            LedgerEntry.objects.filter(
+                id__gt=after, id__lte=upper, account__isnull=False
+            )
+            .annotate(day=TruncDate("transfer__created"))
+            .values("account_id", "day", "transfer__transfer_type")
+            .annotate(
+                count=Count("id"),
+                credit=Sum(
+                    Case(
+                        When(amount__gt=0, then=F("amount")),
+                        default=0,
+                        output_field=AMOUNT_FIELD,
+                    )
+                ),
+                debit=Sum(
+                    Case(
+                        When(amount__lt=0, then=-F("amount")),
+                        default=0,
+                        output_field=AMOUNT_FIELD,
+                    )
+                ),
+            )
+            .order_by()
+        )
+        totals = {
+            (
+                row["account_id"],
+                row["day"],
+                row["transfer__transfer_type"],
+            ): row
+            for row in totals
+        }
+        if not totals:
+            return 0
+
+        existing = DailyTransferRollup.objects.select_for_update().filter(
+            account_id__in={key[0] for key in totals},
+            day__in={key[1] for key in totals},
+        )
+        updated = []
+        for rollup in existing:
+            row = totals.pop(
+                (rollup.account_id, rollup.day, rollup.transfer_type), None
+            )
+            if row is not None:
+                rollup.count += row["count"]
+                rollup.credit += row["credit"]
+                rollup.debit += row["debit"]
+                updated.append(rollup)
+        DailyTransferRollup.objects.bulk_update(
+            updated, ["count", "credit", "debit"]
+        )
+        DailyTransferRollup.objects.bulk_create(
+            DailyTransferRollup(
+                account_id=account_id,
+                day=day,
+                transfer_type=transfer_type,
+                count=row["count"],
+                credit=row["credit"],
+                debit=row["debit"],
+            )
+            for (account_id, day, transfer_type), row in totals.items()
+        )
+        return len(updated) + len(totals)
@@ -0,0 +1,101 @@
+"""
+Django command to run the scheduled transfers as they fall due.
+"""
+import logging
+import signal
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand
+
+from core.metrics import percentile
+from core.scheduling import run_due
+
+
+logger = logging.getLogger(__name__)
+
+# lag samples kept for the report of a long running worker
+LAG_SAMPLES = 100000
+
+
+class Command(BaseCommand):
+    """
+    Django command to run the scheduler: claim the due scheduled transfers
+    in batches with SKIP LOCKED, make their transfers and move each to its
+    next occurrence, in one transaction per batch. Workers can run side by
+    side. Polls for due transfers until stopped, or until none is due with
+    --once, then reports the throughput and the lag between a transfer
+    falling due and being made. A failed batch is retried after
+    --interval.
+    """
+
+    help = "Run the due scheduled transfers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Scheduled transfers run per transaction",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Seconds to wait when no transfer is due",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop once no transfer is due",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.stopping = False
+        # finish the running batch on a stop from the process manager
+        signal.signal(signal.SIGTERM, self.stop)
+
+        made = failed = 0
+        lags = deque(maxlen=LAG_SAMPLES)
+        start = time.perf_counter()
+        try:
+            while not self.stopping:
+                try:
+                    batch = run_due(options["batch_size"])
+                except Exception:
+                    if options["once"]:
+                        raise
+                    logger.exception("A scheduled transfer batch failed")
+                    time.sleep(options["interval"])
+                    continue
+                for scheduled in batch:
+                    if scheduled.last_error:
+                        failed += 1
+                    else:
+                        made += 1
+                    lags.append(
+                        (scheduled.last_run_at - scheduled.due_at)
+                        .total_seconds()
+                    )
+                if batch:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - start
+
+        lags = sorted(lags)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Made {made} scheduled transfers, {failed} failed, in "
+                f"{elapsed:.1f} s ({(made + failed) / elapsed:.0f}/s), lag "
+                f"p50 {percentile(lags, 50) * 1000:.0f} ms, p99 "
+                f"{percentile(lags, 99) * 1000:.0f} ms"
+            )
+        )
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
@@ -0,0 +1,579 @@
+"""
+Django command to seed banks, accounts and transfers for benchmarks.
+"""
+import random
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from bank.directory import BANKS_SCOPE, bump_generation
+from core.bulk import RowWriter, format_cents, to_csv
+from core.models import (
+    Account,
+    BalanceSnapshot,
+    Bank,
+    BankTotal,
+    InterBankTransfer,
+    LedgerEntry,
+    ScheduledTransfer,
+    Transfer,
+)
+from core.partitions import (
+    add_months,
+    create_partition,
+    is_partitioned,
+    month_start,
+)
+
+
+OPENING_BALANCE = Decimal("1000000.00")
+
+TRANSFER_COLUMNS = (
+    "id",
+    "amount",
+    "info",
+    "transfer_type",
+    "created",
+    "source_id",
+    "destination_id",
+    "src_bank_id",
+    "dst_bank_id",
+)
+LEDGER_COLUMNS = (
+    "id",
+    "transfer_id",
+    "account_id",
+    "bank_id",
+    "amount",
+    "created",
+)
+QUEUE_COLUMNS = (
+    "transfer_id",
+    "created",
+    "destination_id",
+    "src_bank_id",
+    "dst_bank_id",
+    "amount",
+)
+
+
+@contextmanager
+def deferred_indexes(models: list):
+    """Drop the secondary indexes and foreign keys of the tables of models
+    and create them again on exit
+
+    Building an index and checking a foreign key once over the loaded rows
+    is several times faster than keeping them up to date row by row. Use
+    it inside a transaction, which holds the tables locked until commit,
+    on PostgreSQL only.
+    """
+    definitions = []
+    with connection.cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes "
+                "WHERE schemaname = current_schema() AND tablename = %s "
+                "AND indexname NOT IN (SELECT conindid::regclass::text "
+                "FROM pg_constraint WHERE conrelid = %s::regclass)",
+                [table, table],
+            )
+            indexes = cursor.fetchall()
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [table],
+            )
+            foreign_keys = cursor.fetchall()
+            for name, definition in foreign_keys:
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+            for name, definition in indexes:
+                cursor.execute(f"DROP INDEX {name}")
+            definitions.append((table, indexes, foreign_keys))
+    yield
+    with connection.cursor() as cursor:
+        for table, indexes, foreign_keys in definitions:
+            for name, definition in indexes:
+                # the indexes of a partitioned table are defined ON ONLY the
+                # parent
+                cursor.execute(definition.replace(" ON ONLY ", " ON ", 1))
+            for name, definition in foreign_keys:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}"
+                )
+
+
+class Command(BaseCommand):
+    """
+    Django command to bulk create banks, accounts and a history of intra
+    bank transfers, fund additions and fund removals. The data is drawn
+    from a seeded random generator, the same seed and end date give the
+    same data. Transfers and ledger entries are written in chunks, with
+    COPY on PostgreSQL, and the final account balances and bank totals in
+    one pass at the end. Everything is written in one transaction.
+    """
+
+    help = "Seed banks, accounts and transfers with bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--banks", type=int, default=10, help="Number of banks"
+        )
+        parser.add_argument(
+            "--accounts",
+            type=int,
+            default=1000,
+            help="Number of accounts, spread over the banks",
+        )
+        parser.add_argument(
+            "--transfers", type=int, default=100000, help="Number of transfers"
+        )
+        parser.add_argument(
+            "--queued",
+            type=int,
+            default=0,
+            help="Number of inter-bank transfers left queued for settlement",
+        )
+        parser.add_argument(
+            "--scheduled",
+            type=int,
+            default=0,
+            help="Number of monthly scheduled transfers due at the end",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50000,
+            help="Number of transfers written per chunk",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the random data"
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="Days of history the transfers are spread over",
+        )
+        parser.add_argument(
+            "--end",
+            help="Day the history ends, YYYY-MM-DD, defaults to today",
+        )
+        parser.add_argument(
+            "--keep-indexes",
+            action="store_true",
+            help="Keep the transfer and ledger indexes up to date while "
+            "loading instead of building them at the end, which locks the "
+            "tables, on PostgreSQL",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.random = random.Random(options["seed"])
+        if options["end"]:
+            end_day = parse_date(options["end"])
+            if end_day is None:
+                raise CommandError("Enter --end as YYYY-MM-DD")
+        else:
+            end_day = timezone.localdate()
+        end = timezone.make_aware(datetime.combine(end_day, time.min))
+        start = end - timedelta(days=options["days"])
+        self.start, self.end = start, end
+
+        if is_partitioned():
+            month = month_start(start)
+            while month < end:
+                create_partition(month)
+                month = add_months(month, 1)
+
+        load = nullcontext()
+        if connection.vendor == "postgresql" and not options["keep_indexes"]:
+            load = deferred_indexes(
+                [Transfer, LedgerEntry, InterBankTransfer]
+            )
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # check the foreign keys per chunk instead of queueing
+                # millions of checks for the commit
+                with connection.cursor() as cursor:
+                    cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            banks = self.create_banks(options["banks"])
+            accounts = self.create_accounts(banks, options["accounts"])
+            with load:
+                created = self.create_transfers(
+                    accounts, options["transfers"], options["batch_size"]
+                )
+                queued = self.queue_transfers(
+                    options["queued"], options["batch_size"]
+                )
+            self.save_balances(accounts)
+            scheduled = self.create_scheduled(options["scheduled"])
+        # bulk_create skips the signals that drop the cached bank list
+        bump_generation(BANKS_SCOPE)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(banks)} banks, {len(accounts)} accounts and "
+                f"{created} transfers, {queued} queued for settlement, "
+                f"{scheduled} scheduled"
+            )
+        )
+
+    def make_uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.random.getrandbits(128), version=4)
+
+    def create_banks(self, count: int) -> list:
+        banks = [
+            Bank(uuid=self.make_uuid(), name=f"Seed Bank {index}")
+            for index in range(count)
+        ]
+        Bank.objects.bulk_create(banks)
+        return self.with_pks(Bank, banks)
+
+    def create_accounts(self, banks: list, count: int) -> list:
+        """Create the accounts with their opening balance snapshots"""
+        accounts = []
+        for start in range(0, count, 10000):
+            chunk = [
+                Account(
+                    uuid=self.make_uuid(),
+                    name=f"Seed Account {index}",
+                    bank=banks[index % len(banks)],
+                    balance=OPENING_BALANCE,
+                )
+                for index in range(start, min(start + 10000, count))
+            ]
+            Account.objects.bulk_create(chunk)
+            chunk = self.with_pks(Account, chunk)
+            # bulk_create skips the signal recording opening balances
+            BalanceSnapshot.objects.bulk_create(
+                BalanceSnapshot(
+                    account=account,
+                    balance=OPENING_BALANCE,
+                    last_entry_id=0,
+                    taken_at=self.start,
+                )
+                for account in chunk
+            )
+            accounts.extend(chunk)
+        return accounts
+
+    def create_transfers(
+        self, accounts: list, count: int, batch_size: int
+    ) -> int:
+        """Write count random transfers and their ledger entries in chunks
+
+        The running balances and bank totals are only kept in memory. An
+        intra bank transfer or fund removal the source can not cover is
+        made a fund addition instead.
+        """
+        rng = self.random
+        opening = int(OPENING_BALANCE * 100)
+        self.balances = {account.pk: opening for account in accounts}
+        balances = self.balances
+        self.by_bank = by_bank = defaultdict(list)
+        for account in accounts:
+            by_bank[account.bank_id].append(account.pk)
+        bank_ids = sorted(by_bank)
+        self.totals = {
+            bank_id: defaultdict(int, transfer_count=0) for bank_id in bank_ids
+        }
+        if not count:
+            return 0
+        transfers = RowWriter(Transfer, TRANSFER_COLUMNS)
+        entries = RowWriter(LedgerEntry, LEDGER_COLUMNS)
+        next_transfer_id = transfers.reserve_ids(count)
+        next_entry_id = entries.reserve_ids(2 * count)
+
+        span = (self.end - self.start) / max(count, 1)
+        adapt = connection.ops.adapt_datetimefield_value
+        written = 0
+        while written < count:
+            chunk = min(batch_size, count - written)
+            transfer_rows, entry_rows = [], []
+            for index in range(written, written + chunk):
+                bank_id = rng.choice(bank_ids)
+                bank_accounts = by_bank[bank_id]
+                totals = self.totals[bank_id]
+                cents = rng.randint(1, 10000)
+                amount = format_cents(cents)
+                created = self.start + span * (index + rng.random())
+                created = str(adapt(created))
+                kind = rng.random()
+
+                source = destination = src_bank = dst_bank = None
+                if kind < 0.6 and len(bank_accounts) > 1:
+                    source, destination = rng.sample(bank_accounts, 2)
+                    transfer_type = Transfer.INTRA_BANK_TRANSFER
+                    info = "seed transfer"
+                elif kind >= 0.8:
+                    source = rng.choice(bank_accounts)
+                    dst_bank = bank_id
+                    transfer_type = Transfer.REMOVE_FUND
+                    info = "seed retire"
+                if source is not None and balances[source] < cents:
+                    source = dst_bank = None
+                if source is None:
+                    destination = destination or rng.choice(bank_accounts)
+                    src_bank = bank_id
+                    transfer_type = Transfer.ADD_FUND
+                    info = "seed fund"
+
+                transfer_id = next_transfer_id + index
+                transfer_rows.append(
+                    (
+                        transfer_id,
+                        amount,
+                        info,
+                        transfer_type,
+                        created,
+                        source,
+                        destination,
+                        src_bank,
+                        dst_bank,
+                    )
+                )
+                # money leaves the source, or the bank it enters from
+                entry_id = next_entry_id + 2 * index
+                entry_rows.append(
+                    (
+                        entry_id,
+                        transfer_id,
+                        source,
+                        src_bank,
+                        format_cents(-cents),
+                        created,
+                    )
+                )
+                entry_rows.append(
+                    (
+                        entry_id + 1,
+                        transfer_id,
+                        destination,
+                        dst_bank,
+                        amount,
+                        created,
+                    )
+                )
+
+                if source is not None:
+                    balances[source] -= cents
+                if destination is not None:
+                    balances[destination] += cents
+                if transfer_type == Transfer.INTRA_BANK_TRANSFER:
+                    totals["transferred"] += cents
+                elif transfer_type == Transfer.ADD_FUND:
+                    totals["balance"] += cents
+                    totals["funds_added"] += cents
+                else:
+                    totals["balance"] -= cents
+                    totals["funds_removed"] += cents
+                totals["transfer_count"] += 1
+
+            transfers.write(transfer_rows)
+            entries.write(entry_rows)
+            written += chunk
+            self.stdout.write(f"{written} transfers")
+        return written
+
+    def queue_transfers(self, count: int, batch_size: int) -> int:
+        """Write count inter-bank transfers waiting for settlement in chunks
+
+        They are made over the last hour of the history, with the source
+        debited and the money booked to the destination bank as the API
+        does. A transfer the source can not cover is left out.
+        """
+        rng = self.random
+        balances = self.balances
+        bank_ids = sorted(self.by_bank)
+        if not count:
+            return 0
+        if len(bank_ids) < 2:
+            raise CommandError("Queued transfers need two banks or more")
+        transfers = RowWriter(Transfer, TRANSFER_COLUMNS)
+        entries = RowWriter(LedgerEntry, LEDGER_COLUMNS)
+        queue = RowWriter(InterBankTransfer, QUEUE_COLUMNS)
+        next_transfer_id = transfers.reserve_ids(count)
+        next_entry_id = entries.reserve_ids(2 * count)
+
+        start = self.end - timedelta(hours=1)
+        span = timedelta(hours=1) / max(count, 1)
+        adapt = connection.ops.adapt_datetimefield_value
+        written = queued = 0
+        while written < count:
+            chunk = min(batch_size, count - written)
+            transfer_rows, entry_rows, queue_rows = [], [], []
+            for index in range(written, written + chunk):
+                src_bank, dst_bank = rng.sample(bank_ids, 2)
+                source = rng.choice(self.by_bank[src_bank])
+                destination = rng.choice(self.by_bank[dst_bank])
+                cents = rng.randint(1, 10000)
+                if balances[source] < cents:
+                    continue
+                amount = format_cents(cents)
+                created = str(adapt(start + span * (index + rng.random())))
+
+                transfer_id = next_transfer_id + index
+                transfer_rows.append(
+                    (
+                        transfer_id,
+                        amount,
+                        "seed inter-bank transfer",
+                        Transfer.INTER_BANK_TRANSFER,
+                        created,
+                        source,
+                        None,
+                        src_bank,
+                        dst_bank,
+                    )
+                )
+                entry_id = next_entry_id + 2 * index
+                entry_rows.append(
+                    (
+                        entry_id,
+                        transfer_id,
+                        source,
+                        None,
+                        format_cents(-cents),
+                        created,
+                    )
+                )
+                # booked to the destination bank until it is settled
+                entry_rows.append(
+                    (
+                        entry_id + 1,
+                        transfer_id,
+                        None,
+                        dst_bank,
+                        amount,
+                        created,
+                    )
+                )
+                queue_rows.append(
+                    (
+                        transfer_id,
+                        created,
+                        destination,
+                        src_bank,
+                        dst_bank,
+                        amount,
+                    )
+                )
+
+                balances[source] -= cents
+                totals = self.totals[src_bank]
+                totals["balance"] -= cents
+                totals["transferred"] += cents
+                totals["transfer_count"] += 1
+
+            transfers.write(transfer_rows)
+            entries.write(entry_rows)
+            queue.write(queue_rows)
+            written += chunk
+            queued += len(queue_rows)
+            self.stdout.write(f"{written} queued transfers")
+        return queued
+
+    def create_scheduled(self, count: int) -> int:
+        """Create count monthly transfers within a bank, first due at the
+        end of the history"""
+        rng = self.random
+        bank_ids = [
+            bank_id
+            for bank_id, pks in sorted(self.by_bank.items())
+            if len(pks) > 1
+        ]
+        if count and not bank_ids:
+            raise CommandError(
+                "Scheduled transfers need a bank with two accounts or more"
+            )
+        for start in range(0, count, 10000):
+            chunk = []
+            for index in range(start, min(start + 10000, count)):
+                source, destination = rng.sample(
+                    self.by_bank[rng.choice(bank_ids)], 2
+                )
+                chunk.append(
+                    ScheduledTransfer(
+                        uuid=self.make_uuid(),
+                        name=f"Seed standing order {index}",
+                        source_id=source,
+                        destination_id=destination,
+                        amount=Decimal(format_cents(rng.randint(1, 10000))),
+                        info="seed standing order",
+                        frequency=ScheduledTransfer.MONTHLY,
+                        starts_at=self.end,
+                        next_run_at=self.end,
+                    )
+                )
+            ScheduledTransfer.objects.bulk_create(chunk)
+        return count
+
+    def save_balances(self, accounts: list) -> None:
+        """Set every account to its final balance and add the bank totals
+
+        On PostgreSQL the balances are copied to a temporary table and set
+        by one joined UPDATE.
+        """
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE seed_balance "
+                    "(id bigint PRIMARY KEY, balance numeric) ON COMMIT DROP"
+                )
+                cursor.copy_expert(
+                    "COPY seed_balance FROM STDIN WITH (FORMAT csv)",
+                    to_csv(
+                        (pk, format_cents(cents))
+                        for pk, cents in self.balances.items()
+                    ),
+                )
+                cursor.execute(
+                    f"UPDATE {Account._meta.db_table} account "
+                    "SET balance = seed_balance.balance FROM seed_balance "
+                    "WHERE account.id = seed_balance.id"
+                )
+        else:
+            Account.objects.apply_deltas(
+                {
+                    pk: Decimal(format_cents(cents)) - OPENING_BALANCE
+                    for pk, cents in self.balances.items()
+                }
+            )
+
+        opening = int(OPENING_BALANCE * 100)
+        opened = defaultdict(int)
+        for account in accounts:
+            opened[account.bank_id] += opening
+        for bank_id, totals in sorted(self.totals.items()):
+            BankTotal.objects.record(
+                bank_id,
+                balance=Decimal(
+                    format_cents(opened[bank_id] + totals["balance"])
+                ),
+                funds_added=Decimal(format_cents(totals["funds_added"])),
+                funds_removed=Decimal(format_cents(totals["funds_removed"])),
+                transferred=Decimal(format_cents(totals["transferred"])),
+                transfer_count=totals["transfer_count"],
+            )
+
+    def with_pks(self, model, objs: list) -> list:
+        """Return objs with primary keys, reading them back by uuid where
+        the database can not return them from a bulk insert"""
+        if not objs or objs[0].pk is not None:
+            return objs
+        pks = dict(
+            model.objects.filter(
+                uuid__in=[obj.uuid for obj in objs]
+            ).values_list("uuid", "pk")
+        )
+        for obj in objs:
+            obj.pk = pks[obj.uuid]
+        return objs
@@ -0,0 +1,57 @@
+"""
+Django command to serve the app with gunicorn.
+"""
+import os
+import sys
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Django command to replace itself with a gunicorn master process running
+    the app with the settings of app.gunicorn_config: pre-forked workers
+    sized to the CPUs, recycled after a number of requests, with the app
+    preloaded before the fork. The master takes gunicorn's signals, HUP
+    replaces the workers gracefully and TERM stops them after their
+    running requests.
+    """
+
+    help = "Serve the app with gunicorn"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--asgi",
+            action="store_true",
+            help="Serve app.asgi with uvicorn workers instead of app.wsgi",
+        )
+        parser.add_argument(
+            "--bind", help="Address to listen on, default 0.0.0.0:8000"
+        )
+        parser.add_argument(
+            "--workers", type=int, help="Number of worker processes"
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        env = dict(os.environ)
+        env["GUNICORN_ASGI"] = str(options["asgi"])
+        if options["bind"]:
+            env["GUNICORN_BIND"] = options["bind"]
+        if options["workers"]:
+            env["GUNICORN_WORKERS"] = str(options["workers"])
+        application = "app.wsgi:application"
+        if options["asgi"]:
+            application = "app.asgi:application"
+        argv = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--config",
+            "python:app.gunicorn_config",
+            application,
+        ]
+        self.stdout.write(self.style.SUCCESS(f"Starting {' '.join(argv)}"))
+        self.stdout.flush()
+        # the master takes this pid, so signals reach it directly
+        os.execve(sys.executable, argv, env)
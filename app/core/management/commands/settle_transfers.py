@@ -0,0 +1,108 @@
+"""
+Django command to settle the queued inter-bank transfers in netting cycles.
+"""
+import logging
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.metrics import percentile
+from core.settlement import settle_cycle
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Django command to run the settlement cycles: every --interval seconds
+    the queued inter-bank transfers are netted per pair of banks and their
+    destinations credited in one transaction. A cycle reaching
+    --max-transfers is followed by the next one at once. Runs until
+    stopped, or until the queue is drained with --once, then reports the
+    throughput and the latency between a transfer being queued and
+    settled. A failed cycle leaves its transfers queued for the next one.
+    """
+
+    help = "Settle the queued inter-bank transfers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-transfers",
+            type=int,
+            default=settings.SETTLEMENT_MAX_TRANSFERS,
+            help="Transfers settled per cycle at most",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=settings.SETTLEMENT_INTERVAL,
+            help="Seconds between the start of two cycles",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop once no transfer is queued",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.stopping = False
+        # finish the running cycle on a stop from the process manager
+        signal.signal(signal.SIGTERM, self.stop)
+
+        settled = cycles = 0
+        durations, latencies = [], []
+        start = time.perf_counter()
+        try:
+            while not self.stopping:
+                started = time.perf_counter()
+                try:
+                    cycle = settle_cycle(options["max_transfers"])
+                except Exception:
+                    if options["once"]:
+                        raise
+                    logger.exception("A settlement cycle failed")
+                    cycle = None
+                if cycle is not None:
+                    cycles += 1
+                    settled += cycle.transfer_count
+                    durations.append(time.perf_counter() - started)
+                    # the oldest transfer of a cycle waited the longest
+                    latencies.append(
+                        (timezone.now() - cycle.oldest_queued_at)
+                        .total_seconds()
+                    )
+                    self.stdout.write(
+                        f"Cycle {cycle.pk}: {cycle.transfer_count} "
+                        f"transfers, gross {cycle.gross_amount}, net "
+                        f"{cycle.net_amount}, in {durations[-1]:.1f} s"
+                    )
+                    if cycle.transfer_count >= options["max_transfers"]:
+                        continue
+                elif options["once"]:
+                    break
+                time.sleep(
+                    max(options["interval"] - time.perf_counter() + started, 0)
+                )
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - start
+
+        durations.sort()
+        latencies.sort()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Settled {settled} transfers in {cycles} cycles in "
+                f"{elapsed:.1f} s ({settled / elapsed:.0f}/s), cycle p50 "
+                f"{percentile(durations, 50):.1f} s, max latency p50 "
+                f"{percentile(latencies, 50):.1f} s, p99 "
+                f"{percentile(latencies, 99):.1f} s"
+            )
+        )
+
+    def stop(self, signum, frame) -> None:
+        self.stopping = True
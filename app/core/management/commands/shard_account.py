@@ -0,0 +1,36 @@
+"""
+Django command to set the number of balance shards of an account.
+"""
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Account
+
+
+class Command(BaseCommand):
+    """
+    Django command to spread the credits of a high contention account over
+    balance shards. A count below two turns sharding off.
+    """
+
+    help = "Set the number of balance shards of an account"
+
+    def add_arguments(self, parser):
+        parser.add_argument("account_id", help="uuid of the account")
+        parser.add_argument("count", type=int, help="number of shards")
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            account = Account.objects.get(uuid=options["account_id"])
+        except (Account.DoesNotExist, ValidationError):
+            raise CommandError(f"Account {options['account_id']} not found")
+
+        Account.objects.reshard(account.pk, options["count"])
+        account.refresh_from_db()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Account {account.uuid} has {account.shard_count} shards"
+            )
+        )
@@ -0,0 +1,105 @@
+"""
+Django command to roll account balance snapshots forward.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Account, BalanceSnapshot, LedgerEntry
+
+
+class Command(BaseCommand):
+    """
+    Django command to take a new balance snapshot for every account with
+    ledger entries after its latest snapshot. Only the new entries are read.
+    """
+
+    help = "Roll account balance snapshots forward over new ledger entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of accounts snapshotted per transaction",
+        )
+        parser.add_argument(
+            "--lag",
+            type=int,
+            default=60,
+            help="Skip entries newer than this many seconds, so entries of "
+            "transactions still running are not passed over",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        cutoff = timezone.now() - timedelta(seconds=options["lag"])
+        last_entry_id = LedgerEntry.objects.filter(
+            created__lt=cutoff
+        ).aggregate(last=Max("id"))["last"]
+        if last_entry_id is None:
+            self.stdout.write(self.style.SUCCESS("No ledger entries"))
+            return
+
+        latest = BalanceSnapshot.objects.filter(
+            account_id=OuterRef("account_id")
+        ).order_by("-last_entry_id")
+
+        account_ids = Account.objects.order_by("pk").values_list(
+            "pk", flat=True
+        )
+        taken = 0
+        start = 0
+        while True:
+            chunk = list(
+                account_ids.filter(pk__gt=start)[: options["batch_size"]]
+            )
+            if not chunk:
+                break
+            start = chunk[-1]
+
+            with transaction.atomic():
+                totals = (
+                    LedgerEntry.objects.filter(
+                        account_id__in=chunk, id__lte=last_entry_id
+                    )
+                    .filter(
+                        id__gt=Coalesce(
+                            Subquery(latest.values("last_entry_id")[:1]), 0
+                        )
+                    )
+                    .values("account_id")
+                    .annotate(
+                        total=Sum("amount"),
+                        last=Max("id"),
+                        taken_at=Max("created"),
+                    )
+                    .order_by()
+                )
+                totals = {row["account_id"]: row for row in totals}
+                previous = dict(
+                    BalanceSnapshot.objects.filter(
+                        account_id__in=totals,
+                        last_entry_id=Subquery(
+                            latest.values("last_entry_id")[:1]
+                        ),
+                    ).values_list("account_id", "balance")
+                )
+                BalanceSnapshot.objects.bulk_create(
+                    BalanceSnapshot(
+                        account_id=account_id,
+                        balance=previous.get(account_id, 0) + row["total"],
+                        last_entry_id=row["last"],
+                        taken_at=row["taken_at"],
+                    )
+                    for account_id, row in totals.items()
+                )
+            taken += len(totals)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Took {taken} balance snapshots")
+        )
@@ -0,0 +1,319 @@
+import asyncio
+import bisect
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+from rest_framework.serializers import (
+    LIST_SERIALIZER_KWARGS,
+    ListSerializer,
+)
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+def percentile(values: list, percent: float) -> float:
+    """Return the nearest rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Histogram:
+    """
+    Cumulative Prometheus histogram with one series per label set
+    """
+
+    def __init__(self, name: str, help_text: str, buckets: tuple) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                ]
+            series[0][index] += 1
+            series[1] += value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.series.clear()
+
+    def render(self, label_names: tuple) -> list:
+        """Return the exposition lines of the histogram"""
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            series = [
+                (labels, list(counts), total)
+                for labels, (counts, total) in sorted(self.series.items())
+            ]
+        for labels, counts, total in series:
+            label_text = ",".join(
+                f'{name}="{value}"' for name, value in zip(label_names, labels)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+LABEL_NAMES = ("view", "method")
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Wall time of the request",
+    LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "db_queries_per_request",
+    "Database queries run by the request",
+    QUERY_COUNT_BUCKETS,
+)
+DB_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database time of the request",
+    LATENCY_BUCKETS,
+)
+SERIALIZER_DURATION = Histogram(
+    "serializer_duration_seconds",
+    "Serializer validation and representation time of the request",
+    LATENCY_BUCKETS,
+)
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZER_DURATION)
+
+
+class RequestStats:
+    """
+    Query and serializer time of the request being handled
+    """
+
+    def __init__(self, slow_queries: int) -> None:
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.slow_queries = slow_queries
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if self.slow_queries:
+                if len(self.slowest) < self.slow_queries:
+                    heapq.heappush(self.slowest, (elapsed, sql))
+                elif elapsed > self.slowest[0][0]:
+                    heapq.heapreplace(self.slowest, (elapsed, sql))
+
+
+def timed_serializer(method):
+    """Add the time of the outermost serializer call to the request"""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = current_request.get()
+        if stats is None or stats.serializer_depth:
+            return method(self, *args, **kwargs)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            stats.serializer_time += time.perf_counter() - start
+            stats.serializer_depth -= 1
+
+    return wrapper
+
+
+class TimedSerializerMixin:
+    """
+    Serializer mixin adding its validation and representation time to the
+    metrics of the request, for one instance or a list of them
+    Nested serializers are counted once, in their outermost serializer.
+    """
+
+    @timed_serializer
+    def is_valid(self, *args, **kwargs):
+        return super().is_valid(*args, **kwargs)
+
+    @property
+    @timed_serializer
+    def data(self):
+        return super().data
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        """Return a timed list serializer of cls, as BaseSerializer does"""
+        allow_empty = kwargs.pop("allow_empty", None)
+        list_kwargs = {
+            key: value
+            for key, value in kwargs.items()
+            if key in LIST_SERIALIZER_KWARGS
+        }
+        if allow_empty is not None:
+            list_kwargs["allow_empty"] = allow_empty
+        return TimedListSerializer(
+            *args, child=cls(*args, **kwargs), **list_kwargs
+        )
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    """List serializer of a TimedSerializerMixin serializer"""
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, database queries and time and serializer time per
+    URL name, and log requests slower than METRICS_SLOW_REQUEST_MS with
+    the SQL of their slowest queries
+    Under ASGI the middleware is async, async views add the queries they
+    run in worker threads through core.db.database_sync_to_async
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # make the handler await this middleware instead of wrapping it
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        stats = RequestStats(settings.METRICS_SLOW_QUERY_COUNT)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, start, stats)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        stats = RequestStats(settings.METRICS_SLOW_QUERY_COUNT)
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, start, stats)
+
+    def finish(self, request, response, start: float, stats: RequestStats):
+        """Record the request, after its body for a streamed response"""
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response.streaming_content, start, stats
+            )
+        else:
+            self.observe(request, time.perf_counter() - start, stats)
+        return response
+
+    def stream(self, request, content, start: float, stats: RequestStats):
+        """Yield the streamed body, counting the queries run to produce it,
+        then record the request"""
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                yield from content
+        finally:
+            self.observe(request, time.perf_counter() - start, stats)
+
+    def observe(self, request, elapsed: float, stats: "RequestStats") -> None:
+        match = request.resolver_match
+        labels = (match.view_name if match else "unmatched", request.method)
+        REQUEST_DURATION.observe(labels, elapsed)
+        DB_QUERIES.observe(labels, stats.queries)
+        DB_DURATION.observe(labels, stats.db_time)
+        SERIALIZER_DURATION.observe(labels, stats.serializer_time)
+
+        slow_ms = settings.METRICS_SLOW_REQUEST_MS
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            self.log_slow_request(request, labels, elapsed, stats)
+
+    def log_slow_request(
+        self, request, labels: tuple, elapsed: float, stats: RequestStats
+    ) -> None:
+        slowest = "".join(
+            f"\n  {query_time * 1000:.1f} ms: {sql}"
+            for query_time, sql in sorted(stats.slowest, reverse=True)
+        )
+        logger.warning(
+            "Slow request %s %s (%s) %.1f ms, %d queries in %.1f ms, "
+            "serializers %.1f ms%s",
+            request.method,
+            request.path,
+            labels[0],
+            elapsed * 1000,
+            stats.queries,
+            stats.db_time * 1000,
+            stats.serializer_time * 1000,
+            slowest,
+        )
+
+
+def metrics_view(request):
+    """Return the request histograms in Prometheus text format"""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render(LABEL_NAMES))
+    # the pools record their metrics with this module, import them late
+    from core.db import pool_metrics
+    from core.outbox import outbox_metrics
+
+    lines.extend(pool_metrics())
+    lines.extend(outbox_metrics())
+    return HttpResponse(
+        "\n".join(lines) + "\n",
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
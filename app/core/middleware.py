@@ -0,0 +1,82 @@
+from asgiref.sync import sync_to_async
+from corsheaders import middleware as cors
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from django.middleware import clickjacking, common, security
+
+
+class InlineHooksMixin:
+    """
+    Run the hooks of a MiddlewareMixin middleware on the event loop
+    Under ASGI Django 3.2 moves every process_request and process_response
+    call to the one thread it shares between requests, two thread hops per
+    middleware and request. The stock hooks only read headers and set up
+    lazy objects, so they run inline. A hook that will touch the database,
+    like saving a modified session, is told apart by uses_database before
+    it runs and runs once on the shared thread instead.
+    Under WSGI the middleware is unchanged.
+    """
+
+    async def __acall__(self, request):
+        response = None
+        if hasattr(self, "process_request"):
+            response = await self.run_hook(self.process_request, request)
+        response = response or await self.get_response(request)
+        if hasattr(self, "process_response"):
+            response = await self.run_hook(
+                self.process_response, request, response
+            )
+        return response
+
+    async def run_hook(self, hook, *args):
+        if self.uses_database(hook, *args):
+            return await sync_to_async(hook, thread_sensitive=True)(*args)
+        return hook(*args)
+
+    def uses_database(self, hook, request, response=None) -> bool:
+        """Return whether the hook will read or write the database"""
+        return False
+
+
+class SecurityMiddleware(InlineHooksMixin, security.SecurityMiddleware):
+    pass
+
+
+class SessionMiddleware(InlineHooksMixin, sessions.SessionMiddleware):
+    def uses_database(self, hook, request, response=None) -> bool:
+        # the response hook saves a modified session
+        return hook == self.process_response and (
+            request.session.modified or settings.SESSION_SAVE_EVERY_REQUEST
+        )
+
+
+class CorsMiddleware(InlineHooksMixin, cors.CorsMiddleware):
+    pass
+
+
+class CommonMiddleware(InlineHooksMixin, common.CommonMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(
+    InlineHooksMixin, auth.AuthenticationMiddleware
+):
+    pass
+
+
+class MessageMiddleware(InlineHooksMixin, messages.MessageMiddleware):
+    def uses_database(self, hook, request, response=None) -> bool:
+        # the response hook stores read or new messages, in the session
+        # when they overflow the cookie
+        storage = getattr(request, "_messages", None)
+        return hook == self.process_response and bool(
+            storage is not None and (storage.used or storage.added_new)
+        )
+
+
+class XFrameOptionsMiddleware(
+    InlineHooksMixin, clickjacking.XFrameOptionsMiddleware
+):
+    pass
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['source', 'created', 'id'], name='transfer_source_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['destination', 'created', 'id'], name='transfer_dest_created_idx'),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_opening_snapshots(apps, schema_editor):
+    """Write the ledger entries of the existing transfers, and record the
+    balance of existing accounts before them as their opening balance"""
+    Account = apps.get_model("core", "Account")
+    BalanceSnapshot = apps.get_model("core", "BalanceSnapshot")
+    LedgerEntry = apps.get_model("core", "LedgerEntry")
+    Transfer = apps.get_model("core", "Transfer")
+    now = django.utils.timezone.now()
+
+    net = {}
+    for field, sign in (("destination_id", 1), ("source_id", -1)):
+        for account_id, total in (
+            Transfer.objects.filter(**{f"{field}__isnull": False})
+            .values_list(field)
+            .annotate(total=models.Sum("amount"))
+            .order_by()
+        ):
+            net[account_id] = net.get(account_id, 0) + sign * total
+    opened_at = (
+        Transfer.objects.aggregate(first=models.Min("created"))["first"]
+        or now
+    )
+
+    # as Transfer.get_ledger_entries, a side without an account is booked
+    # to its bank
+    transfers = (
+        Transfer.objects.order_by("id")
+        .values_list(
+            "id",
+            "source_id",
+            "destination_id",
+            "src_bank_id",
+            "dst_bank_id",
+            "amount",
+            "created",
+            named=True,
+        )
+        .iterator()
+    )
+    entries = (
+        LedgerEntry(
+            transfer_id=transfer.id,
+            account_id=account_id,
+            bank_id=None if account_id else bank_id,
+            amount=sign * transfer.amount,
+            created=transfer.created,
+        )
+        for transfer in transfers
+        for account_id, bank_id, sign in (
+            (transfer.source_id, transfer.src_bank_id, -1),
+            (transfer.destination_id, transfer.dst_bank_id, 1),
+        )
+    )
+    while True:
+        batch = [entry for _, entry in zip(range(1000), entries)]
+        if not batch:
+            break
+        LedgerEntry.objects.bulk_create(batch)
+
+    accounts = Account.objects.values_list("id", "balance").iterator()
+    snapshots = (
+        BalanceSnapshot(
+            account_id=account_id,
+            balance=balance - net.get(account_id, 0),
+            last_entry_id=0,
+            taken_at=opened_at,
+        )
+        for account_id, balance in accounts
+    )
+    while True:
+        batch = [snapshot for _, snapshot in zip(range(1000), snapshots)]
+        if not batch:
+            break
+        BalanceSnapshot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.account')),
+                ('bank', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.bank')),
+                ('transfer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.transfer')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('last_entry_id', models.BigIntegerField()),
+                ('taken_at', models.DateTimeField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='core.account')),
+            ],
+            options={
+                'ordering': ['-last_entry_id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['account', 'id'], name='ledger_account_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='balancesnapshot',
+            constraint=models.UniqueConstraint(fields=('account', 'last_entry_id'), name='snapshot_account_entry_unique'),
+        ),
+        migrations.RunPython(
+            create_opening_snapshots, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-17 07:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AccountBalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=18)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_shards', to='core.account')),
+            ],
+            options={
+                'ordering': ['account', 'index'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='accountbalanceshard',
+            constraint=models.UniqueConstraint(fields=('account', 'index'), name='shard_account_index_unique'),
+        ),
+    ]
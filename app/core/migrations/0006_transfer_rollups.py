@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_account_balance_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('reached_at', models.DateTimeField(blank=True, null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyTransferRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('transfer_type', models.CharField(choices=[('add_fund', 'Add Fund'), ('remove_fund', 'Remove Fund'), ('intra_bank_transfer', 'Intra_bank_transfer')], max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='core.account')),
+            ],
+            options={
+                'ordering': ['day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailytransferrollup',
+            constraint=models.UniqueConstraint(fields=('account', 'day', 'transfer_type'), name='rollup_account_day_type_unique'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_bank_totals(apps, schema_editor):
+    """Sum the balances and transfers of existing banks into slot 0 of
+    their totals"""
+    Account = apps.get_model("core", "Account")
+    AccountBalanceShard = apps.get_model("core", "AccountBalanceShard")
+    Bank = apps.get_model("core", "Bank")
+    BankTotal = apps.get_model("core", "BankTotal")
+    Transfer = apps.get_model("core", "Transfer")
+    Sum = models.Sum
+
+    totals = {
+        bank_id: BankTotal(bank_id=bank_id, slot=0)
+        for bank_id in Bank.objects.values_list("id", flat=True).iterator()
+    }
+    for model in (Account, AccountBalanceShard):
+        bank_field = "bank_id" if model is Account else "account__bank_id"
+        for bank_id, balance in (
+            model.objects.values_list(bank_field)
+            .annotate(total=Sum("balance"))
+            .order_by()
+        ):
+            totals[bank_id].balance += balance
+    for transfer_type, bank_field, field in (
+        ("intra_bank_transfer", "source__bank_id", "transferred"),
+        ("add_fund", "destination__bank_id", "funds_added"),
+        ("remove_fund", "source__bank_id", "funds_removed"),
+    ):
+        for bank_id, amount, count in (
+            Transfer.objects.filter(transfer_type=transfer_type)
+            .values_list(bank_field)
+            .annotate(total=Sum("amount"), count=models.Count("id"))
+            .order_by()
+        ):
+            if bank_id is None:
+                continue
+            setattr(totals[bank_id], field, amount)
+            totals[bank_id].transfer_count += count
+    BankTotal.objects.bulk_create(totals.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_transfer_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('funds_added', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('funds_removed', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('transferred', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('transfer_count', models.BigIntegerField(default=0)),
+                ('bank', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='totals', to='core.bank')),
+            ],
+            options={
+                'ordering': ['bank', 'slot'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='banktotal',
+            constraint=models.UniqueConstraint(fields=('bank', 'slot'), name='bank_total_slot_unique'),
+        ),
+        migrations.RunPython(create_bank_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,150 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:35
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+# months of partitions created ahead of the current one
+MONTHS_AHEAD = 3
+
+
+def get_table_definition(cursor, table):
+    """Return the index and foreign key definitions of a table, without its
+    primary key"""
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes "
+        "WHERE tablename = %s AND indexname <> %s",
+        [table, f"{table}_pkey"],
+    )
+    # the indexes of a partitioned table are defined ON ONLY the parent
+    indexes = [
+        row[0].replace(" ON ONLY ", " ON ", 1) for row in cursor.fetchall()
+    ]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def replace_transfer_table(cursor, partitions):
+    """Copy the transfers to a new table and swap it in for the old one
+
+    With partitions, a list of (name, start, end), the new table is
+    partitioned by created, otherwise it is a plain table. The indexes and
+    foreign keys are created again under their names once the rows are in.
+    """
+    indexes, foreign_keys = get_table_definition(cursor, "core_transfer")
+    cursor.execute("ALTER TABLE core_transfer RENAME TO core_transfer_old")
+    partition_by = " PARTITION BY RANGE (created)" if partitions else ""
+    cursor.execute(
+        "CREATE TABLE core_transfer "
+        f"(LIKE core_transfer_old INCLUDING DEFAULTS){partition_by}"
+    )
+    for name, start, end in partitions:
+        cursor.execute(
+            f"CREATE TABLE {name} PARTITION OF core_transfer "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+    if partitions:
+        cursor.execute(
+            "CREATE TABLE core_transfer_default PARTITION OF core_transfer "
+            "DEFAULT"
+        )
+    # the id sequence is dropped with the table owning it
+    cursor.execute("ALTER SEQUENCE core_transfer_id_seq OWNED BY NONE")
+    cursor.execute(
+        "INSERT INTO core_transfer SELECT * FROM core_transfer_old"
+    )
+    cursor.execute("DROP TABLE core_transfer_old")
+    cursor.execute(
+        "ALTER SEQUENCE core_transfer_id_seq OWNED BY core_transfer.id"
+    )
+
+    # a primary key of a partitioned table includes the partition key
+    primary_key = "id, created" if partitions else "id"
+    cursor.execute(
+        "ALTER TABLE core_transfer "
+        f"ADD CONSTRAINT core_transfer_pkey PRIMARY KEY ({primary_key})"
+    )
+    for name, definition in foreign_keys:
+        cursor.execute(
+            f"ALTER TABLE core_transfer ADD CONSTRAINT {name} {definition}"
+        )
+    for definition in indexes:
+        cursor.execute(definition)
+
+
+def add_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def partition_transfers(apps, schema_editor):
+    """Partition the transfer table by month of created
+
+    One partition per month from the oldest transfer to MONTHS_AHEAD
+    months ahead, and a default partition for the rows outside of them.
+    """
+    connection = schema_editor.connection
+    # partitioned tables get primary keys and foreign keys in PostgreSQL 11
+    if connection.vendor != "postgresql" or connection.pg_version < 110000:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT min(created) FROM core_transfer")
+        oldest = cursor.fetchone()[0] or timezone.now()
+        now = timezone.localtime()
+        oldest = timezone.localtime(oldest)
+        month = timezone.make_aware(datetime(oldest.year, oldest.month, 1))
+        last = timezone.make_aware(datetime(now.year, now.month, 1))
+        for _ in range(MONTHS_AHEAD):
+            last = add_month(last)
+
+        partitions = []
+        while month <= last:
+            end = add_month(month)
+            partitions.append(
+                (
+                    f"core_transfer_p{month.year:04d}_{month.month:02d}",
+                    month,
+                    end,
+                )
+            )
+            month = end
+        replace_transfer_table(cursor, partitions)
+
+
+def merge_transfers(apps, schema_editor):
+    """Copy the partitioned transfers back into a plain table"""
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = 'core_transfer'::regclass"
+        )
+        if cursor.fetchone() is not None:
+            replace_transfer_table(cursor, [])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_bank_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='transfer',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.transfer'),
+        ),
+        migrations.RunPython(partition_transfers, merge_transfers),
+    ]
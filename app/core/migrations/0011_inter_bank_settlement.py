@@ -0,0 +1,74 @@
+# Generated by Django 3.2.25 on 2026-10-17 11:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_transfer_import'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('transfer_count', models.PositiveIntegerField(default=0)),
+                ('gross_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('net_amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('oldest_queued_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='dailytransferrollup',
+            name='transfer_type',
+            field=models.CharField(choices=[('add_fund', 'Add Fund'), ('remove_fund', 'Remove Fund'), ('intra_bank_transfer', 'Intra_bank_transfer'), ('inter_bank_transfer', 'Inter_bank_transfer')], max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='transfer_type',
+            field=models.CharField(choices=[('add_fund', 'Add Fund'), ('remove_fund', 'Remove Fund'), ('intra_bank_transfer', 'Intra_bank_transfer'), ('inter_bank_transfer', 'Inter_bank_transfer')], max_length=255),
+        ),
+        migrations.CreateModel(
+            name='SettlementPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('transfer_count', models.PositiveIntegerField()),
+                ('cycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='positions', to='core.settlementcycle')),
+                ('payee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlement_credits', to='core.bank')),
+                ('payer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlement_debits', to='core.bank')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InterBankTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('cycle', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transfers', to='core.settlementcycle')),
+                ('destination', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='inter_bank_credits', to='core.account')),
+                ('dst_bank', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.bank')),
+                ('src_bank', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='inter_bank_debits', to='core.bank')),
+                ('transfer', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='settlement', to='core.transfer')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='interbanktransfer',
+            index=models.Index(condition=models.Q(('cycle__isnull', True)), fields=['id'], name='interbank_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-17 12:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_inter_bank_settlement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150)),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=18)),
+                ('info', models.CharField(max_length=255)),
+                ('frequency', models.CharField(choices=[('once', 'Once'), ('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=20)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('next_run_at', models.DateTimeField(blank=True, null=True)),
+                ('occurrences', models.PositiveIntegerField(default=0)),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, max_length=255)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_credits', to='core.account')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scheduled_debits', to='core.account')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='scheduledtransfer',
+            index=models.Index(condition=models.Q(('next_run_at__isnull', False)), fields=['next_run_at'], name='scheduled_due_idx'),
+        ),
+    ]
@@ -1,7 +1,20 @@
+import calendar
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
 from decimal import Decimal
 import uuid
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, connections, router
+from django.db.models import F, Case, When, Value, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class InsufficientFunds(Exception):
+    """Raised when an account balance is not enough for a debit"""
 
 
 class BaseModel(models.Model):
@@ -30,6 +43,187 @@ class Bank(BaseModel):
     """Bank model"""
 
 
+class AccountQuerySet(models.QuerySet):
+    """Account queryset with atomic balance updates"""
+
+    def lock(self, *pks: int) -> list:
+        """Locks the accounts in primary key order
+
+        Every writer that touches more than one account takes its row locks
+        in the same order, so concurrent transfers can not deadlock. Where
+        the database has it, the lock is FOR NO KEY UPDATE, which does not
+        block the foreign key checks of rows inserted against the account.
+
+        Args:
+            pks (int): primary keys of the accounts to lock
+
+        Returns:
+            list: the locked primary keys
+        """
+        features = connections[self.db].features
+        return list(
+            self.select_for_update(
+                no_key=features.has_select_for_no_key_update
+            )
+            .filter(pk__in=pks)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+
+    def credit(self, pk: int, amount: Decimal, sharded: bool = False) -> None:
+        """Adds amount to the account balance in a single statement
+
+        Credits to a sharded account go to a random balance shard that no
+        other transaction holds, so they do not queue on one row.
+
+        Args:
+            pk (int): primary key of the account
+            amount (Decimal): amount to add
+            sharded (bool): if the account has balance shards
+        """
+        if sharded:
+            shard = (
+                AccountBalanceShard.objects.using(self.db)
+                .select_for_update(skip_locked=True)
+                .filter(account_id=pk)
+                .order_by("?")
+                .values_list("pk", flat=True)
+                .first()
+            )
+            if shard is not None:
+                AccountBalanceShard.objects.using(self.db).filter(
+                    pk=shard
+                ).update(balance=F("balance") + amount)
+                return
+        self.filter(pk=pk).update(balance=F("balance") + amount)
+
+    def debit(self, pk: int, amount: Decimal) -> None:
+        """Removes amount from the account balance in a single statement
+
+        The update only matches when the balance covers the amount, so the
+        check and the change can not be interleaved with another writer.
+        When the balance is short, the balance shards are consolidated into
+        it and the debit is tried again.
+
+        Raises:
+            InsufficientFunds: if the balance is not enough
+        """
+        covered = self.filter(pk=pk, balance__gte=amount)
+        updated = covered.update(balance=F("balance") - amount)
+        if not updated and self.consolidate(pk):
+            updated = covered.update(balance=F("balance") - amount)
+        if not updated:
+            raise InsufficientFunds(f"Account {pk} does not have enough fund")
+
+    def consolidate(self, pk: int) -> Decimal:
+        """Moves the balance shards of an account into its balance
+
+        Args:
+            pk (int): primary key of the account
+
+        Returns:
+            Decimal: the amount moved
+        """
+        with transaction.atomic(using=self.db):
+            # account row before shards, the order every writer uses
+            self.lock(pk)
+            shards = dict(
+                AccountBalanceShard.objects.using(self.db)
+                .select_for_update()
+                .filter(account_id=pk)
+                .exclude(balance=0)
+                .order_by("index")
+                .values_list("pk", "balance")
+            )
+            total = sum(shards.values(), Decimal(0))
+            if shards:
+                AccountBalanceShard.objects.using(self.db).filter(
+                    pk__in=shards
+                ).update(balance=0)
+                self.filter(pk=pk).update(balance=F("balance") + total)
+        return total
+
+    def reshard(self, pk: int, count: int) -> None:
+        """Sets the number of balance shards of an account
+
+        The existing shards are consolidated first, so no balance is lost
+        when the count goes down. A count below two turns sharding off.
+
+        Args:
+            pk (int): primary key of the account
+            count (int): number of balance shards
+        """
+        count = count if count > 1 else 0
+        with transaction.atomic(using=self.db):
+            self.lock(pk)
+            self.consolidate(pk)
+            shards = AccountBalanceShard.objects.using(self.db)
+            shards.filter(account_id=pk, index__gte=count).delete()
+            existing = set(
+                shards.filter(account_id=pk).values_list("index", flat=True)
+            )
+            shards.bulk_create(
+                AccountBalanceShard(account_id=pk, index=index)
+                for index in range(count)
+                if index not in existing
+            )
+            self.filter(pk=pk).update(shard_count=count)
+
+    def with_shard_balance(self) -> "AccountQuerySet":
+        """Annotates the summed balance shards, see Account.total_balance"""
+        shard_balance = (
+            AccountBalanceShard.objects.filter(account_id=OuterRef("pk"))
+            .values("account_id")
+            .annotate(total=Sum("balance"))
+            .values("total")
+        )
+        return self.annotate(
+            shard_balance=Coalesce(
+                Subquery(shard_balance),
+                Value(Decimal(0)),
+                output_field=models.DecimalField(
+                    decimal_places=2, max_digits=18
+                ),
+            )
+        )
+
+    def apply_deltas(self, deltas: dict, chunk_size: int = 500) -> None:
+        """Adds a signed amount to many account balances
+
+        Each chunk of accounts is changed by one grouped ``UPDATE``; callers
+        must hold the row locks and have checked the resulting balances.
+        On PostgreSQL all of them are changed by one ``UPDATE`` joined to
+        the arrays of keys and amounts, whatever their number.
+
+        Args:
+            deltas (dict): account primary key to signed amount
+            chunk_size (int): accounts changed per statement
+        """
+        pks = [pk for pk, delta in deltas.items() if delta]
+        connection = connections[
+            self._db or router.db_for_write(self.model)
+        ]
+        if pks and connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {self.model._meta.db_table} account "
+                    "SET balance = account.balance + change.delta "
+                    "FROM unnest(%s::bigint[], %s::numeric[]) "
+                    "AS change (id, delta) WHERE account.id = change.id",
+                    [pks, [deltas[pk] for pk in pks]],
+                )
+            return
+        for start in range(0, len(pks), chunk_size):
+            chunk = pks[start:start + chunk_size]
+            change = Case(
+                *[When(pk=pk, then=Value(deltas[pk])) for pk in chunk],
+                output_field=models.DecimalField(
+                    decimal_places=2, max_digits=18
+                ),
+            )
+            self.filter(pk__in=chunk).update(balance=F("balance") + change)
+
+
 class Account(BaseModel):
     """Account model"""
 
@@ -40,6 +234,23 @@ class Account(BaseModel):
         decimal_places=2, max_digits=18, default=0.00
     )
 
+    # credits are spread over this many balance shards, 0 when not sharded
+    shard_count = models.PositiveSmallIntegerField(default=0)
+
+    objects = AccountQuerySet.as_manager()
+
+    @property
+    def total_balance(self) -> Decimal:
+        """Balance including the balance shards of a sharded account"""
+        if not self.shard_count:
+            return self.balance
+        shard_balance = getattr(self, "shard_balance", None)
+        if shard_balance is None:
+            shard_balance = self.balance_shards.aggregate(
+                total=Sum("balance")
+            )["total"]
+        return self.balance + (shard_balance or 0)
+
     def is_intra_bank_account(self, destination: "Account") -> bool:
         """Check if account bank is same as destination bank
 
@@ -60,7 +271,342 @@ class Account(BaseModel):
         Returns:
             bool: _description_
         """
-        return self.balance - amount > 0
+        if self.balance >= amount:
+            return True
+        return bool(self.shard_count) and self.total_balance >= amount
+
+    def balance_as_of(self, at=None) -> Decimal:
+        """Derive the balance at a point in time from the ledger
+
+        Starts from the latest balance snapshot taken at or before the time
+        and adds the ledger entries after it, so the cost grows with the
+        entries since the snapshot instead of the whole history.
+
+        Args:
+            at (datetime, optional): point in time, defaults to now
+
+        Returns:
+            Decimal: the balance
+        """
+        at = at or timezone.now()
+        snapshot = (
+            self.balance_snapshots.filter(taken_at__lte=at)
+            .order_by("-last_entry_id")
+            .first()
+        )
+        entries = self.ledger_entries.filter(created__lte=at)
+        balance = Decimal(0)
+        if snapshot is not None:
+            entries = entries.filter(id__gt=snapshot.last_entry_id)
+            balance = snapshot.balance
+        return balance + (entries.aggregate(total=Sum("amount"))["total"] or 0)
+
+
+class AccountBalanceShard(models.Model):
+    """
+    Sub balance of a high contention account
+    The account balance is its own balance plus the sum of its shards
+    """
+
+    account = models.ForeignKey(
+        Account, on_delete=models.CASCADE, related_name="balance_shards"
+    )
+    index = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(
+        decimal_places=2, max_digits=18, default=0.00
+    )
+
+    class Meta:
+        ordering = ["account", "index"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "index"], name="shard_account_index_unique"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Shard {self.index} of account {self.account_id}"
+
+
+class BankTotalQuerySet(models.QuerySet):
+    """Bank total queryset with transactional running totals"""
+
+    def record(self, bank_id: int, **changes) -> None:
+        """Adds the changes to a running total slot of the bank
+
+        The totals of a bank are spread over BANK_TOTAL_SLOTS rows and
+        each change goes to a random one, so concurrent transfers of a
+        bank do not queue on one row lock. Call it inside the transaction
+        of the transfer, after the account locks.
+
+        Args:
+            bank_id (int): primary key of the bank
+            changes: signed amounts to add, by BankTotal field
+        """
+        values = {
+            field: F(field) + change
+            for field, change in changes.items()
+            if change
+        }
+        if not values:
+            return
+        slot = random.randrange(settings.BANK_TOTAL_SLOTS)
+        row = self.filter(bank_id=bank_id, slot=slot)
+        if not row.update(**values):
+            self.create_slots(bank_id)
+            row.update(**values)
+
+    def create_slots(self, bank_id: int) -> None:
+        """Creates the missing running total slots of the bank"""
+        self.bulk_create(
+            [
+                self.model(bank_id=bank_id, slot=slot)
+                for slot in range(settings.BANK_TOTAL_SLOTS)
+            ],
+            ignore_conflicts=True,
+        )
+
+    def per_bank(self) -> "BankTotalQuerySet":
+        """Sums the slots of each bank"""
+        return (
+            self.values("bank_id")
+            .annotate(
+                **{
+                    field: Sum(field)
+                    for field in BankTotal.TOTAL_FIELDS
+                }
+            )
+            .order_by("bank_id")
+        )
+
+
+class BankTotal(models.Model):
+    """
+    One slot of the running totals of a bank
+    The totals of a bank are the sums over its slots; balance is the sum
+    of its account balances, the rest the volume and number of transfers
+    """
+
+    bank = models.ForeignKey(
+        Bank, on_delete=models.CASCADE, related_name="totals"
+    )
+    slot = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(
+        decimal_places=2, max_digits=20, default=0
+    )
+    funds_added = models.DecimalField(
+        decimal_places=2, max_digits=20, default=0
+    )
+    funds_removed = models.DecimalField(
+        decimal_places=2, max_digits=20, default=0
+    )
+    transferred = models.DecimalField(
+        decimal_places=2, max_digits=20, default=0
+    )
+    transfer_count = models.BigIntegerField(default=0)
+
+    TOTAL_FIELDS = (
+        "balance",
+        "funds_added",
+        "funds_removed",
+        "transferred",
+        "transfer_count",
+    )
+
+    objects = BankTotalQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["bank", "slot"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bank", "slot"], name="bank_total_slot_unique"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Totals slot {self.slot} of bank {self.bank_id}"
+
+
+class TransferQuerySet(models.QuerySet):
+    """Transfer queryset with bulk transfer creation"""
+
+    def create_intra_bank_batch(self, items: list) -> list:
+        """Creates many intra-bank transfers in one transaction
+
+        Every account is resolved and locked by one query, the items are
+        validated in order against the running balances in memory, then
+        the transfers are written with ``bulk_create`` and the balances
+        with grouped updates. Invalid items are skipped.
+
+        Args:
+            items (list): dicts with source and destination account uuids,
+                amount and info
+
+        Returns:
+            list: the created Transfer or a dict of errors, for each item
+        """
+        uuids = {item["source"] for item in items}
+        uuids.update(item["destination"] for item in items)
+
+        results = []
+        transfers = []
+        deltas = defaultdict(Decimal)
+        moved = defaultdict(lambda: [Decimal(0), 0])
+
+        features = connections[self.db].features
+        with transaction.atomic(using=self.db):
+            # FOR NO KEY UPDATE like Account.objects.lock, a plain FOR
+            # UPDATE would block the foreign key check of a concurrent
+            # shard credit while this batch waits on its shard lock
+            accounts = {
+                account.uuid: account
+                for account in Account.objects.using(self.db)
+                .select_for_update(
+                    no_key=features.has_select_for_no_key_update
+                )
+                .filter(uuid__in=uuids)
+                .order_by("pk")
+                .only("id", "uuid", "bank_id", "balance", "shard_count")
+            }
+            sources = {item["source"] for item in items}
+            for account in accounts.values():
+                if account.shard_count and account.uuid in sources:
+                    account.balance += Account.objects.using(
+                        self.db
+                    ).consolidate(account.pk)
+
+            for item in items:
+                source = accounts.get(item["source"])
+                destination = accounts.get(item["destination"])
+                amount = item["amount"]
+
+                errors = {}
+                for field, account in (
+                    ("source", source),
+                    ("destination", destination),
+                ):
+                    if account is None:
+                        errors[field] = (
+                            f"Object with uuid={item[field]} does not exist."
+                        )
+                if errors:
+                    results.append(errors)
+                elif source.bank_id != destination.bank_id:
+                    results.append(
+                        {
+                            "source": "Source bank does not match with "
+                            "destination bank"
+                        }
+                    )
+                elif not source.is_balance_sufficient(amount):
+                    results.append(
+                        {"source": "Account does not have enough fund"}
+                    )
+                else:
+                    source.balance -= amount
+                    destination.balance += amount
+                    deltas[source.pk] -= amount
+                    deltas[destination.pk] += amount
+                    moved[source.bank_id][0] += amount
+                    moved[source.bank_id][1] += 1
+
+                    transfer = self.model(
+                        source=source,
+                        destination=destination,
+                        amount=amount,
+                        info=item["info"],
+                        transfer_type=self.model.INTRA_BANK_TRANSFER,
+                    )
+                    transfers.append(transfer)
+                    results.append(transfer)
+
+            self.bulk_create(transfers)
+            if transfers and transfers[0].pk is None:
+                self._set_bulk_created_pks(transfers)
+            Account.objects.using(self.db).apply_deltas(deltas)
+            LedgerEntry.objects.using(self.db).create_intra_bank(transfers)
+            OutboxEvent.objects.using(self.db).bulk_create(
+                transfer.get_outbox_event() for transfer in transfers
+            )
+            for bank_id in sorted(moved):
+                BankTotal.objects.using(self.db).record(
+                    bank_id,
+                    transferred=moved[bank_id][0],
+                    transfer_count=moved[bank_id][1],
+                )
+
+        return results
+
+    def with_shard_balances(self) -> "TransferQuerySet":
+        """Annotates the summed balance shards of the source and of the
+        destination, see Account.total_balance
+
+        The shards are only summed for sharded accounts, others read 0.
+        """
+        annotations = {}
+        for field in ("source", "destination"):
+            shard_balance = (
+                AccountBalanceShard.objects.filter(
+                    account_id=OuterRef(f"{field}_id")
+                )
+                .values("account_id")
+                .annotate(total=Sum("balance"))
+                .values("total")
+            )
+            annotations[f"{field}_shard_balance"] = Case(
+                When(
+                    **{f"{field}__shard_count__gt": 0},
+                    then=Coalesce(Subquery(shard_balance), Value(0)),
+                ),
+                default=Value(0),
+                output_field=models.DecimalField(
+                    decimal_places=2, max_digits=18
+                ),
+            )
+        return self.annotate(**annotations)
+
+    def create_inter_bank(
+        self, source: "Account", destination: "Account", amount, info: str
+    ) -> "Transfer":
+        """Creates an inter-bank transfer and queues it for settlement
+
+        The source is debited at once. The transfer has no destination
+        until the settlement cycle netting it credits the destination, see
+        core.settlement.
+
+        Raises:
+            InsufficientFunds: if the source balance is not enough
+        """
+        with transaction.atomic(using=self.db):
+            transfer = self.create(
+                source=source,
+                src_bank_id=source.bank_id,
+                dst_bank_id=destination.bank_id,
+                amount=amount,
+                info=info,
+                transfer_type=self.model.INTER_BANK_TRANSFER,
+            )
+            InterBankTransfer.objects.using(self.db).create(
+                transfer=transfer,
+                created=transfer.created,
+                destination=destination,
+                src_bank_id=source.bank_id,
+                dst_bank_id=destination.bank_id,
+                amount=amount,
+            )
+        return transfer
+
+    def _set_bulk_created_pks(self, objs: list) -> None:
+        """Sets the primary keys of objects just bulk created on SQLite
+
+        SQLite can not return ids from a bulk insert, but it holds the
+        database write lock from the insert until commit and its ids only
+        grow, so the rows are the newest ones.
+        """
+        assert connections[self.db].vendor == "sqlite"
+        pks = self.order_by("-pk").values_list("pk", flat=True)[: len(objs)]
+        for obj, pk in zip(objs, reversed(pks)):
+            obj.pk = pk
 
 
 class Transfer(models.Model):
@@ -72,11 +618,13 @@ class Transfer(models.Model):
     ADD_FUND = "add_fund"
     REMOVE_FUND = "remove_fund"
     INTRA_BANK_TRANSFER = "intra_bank_transfer"
+    INTER_BANK_TRANSFER = "inter_bank_transfer"
 
     TRANSFER_CHOICES = (
         (ADD_FUND, "Add Fund"),
         (REMOVE_FUND, "Remove Fund"),
         (INTRA_BANK_TRANSFER, "Intra_bank_transfer"),
+        (INTER_BANK_TRANSFER, "Inter_bank_transfer"),
     )
 
     source = models.ForeignKey(
@@ -114,26 +662,585 @@ class Transfer(models.Model):
     transfer_type = models.CharField(max_length=255, choices=TRANSFER_CHOICES)
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = TransferQuerySet.as_manager()
+
     def __str__(self) -> str:
         return f"Transfer of {self.amount}"
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            models.Index(
+                fields=["source", "created", "id"],
+                name="transfer_source_created_idx",
+            ),
+            models.Index(
+                fields=["destination", "created", "id"],
+                name="transfer_dest_created_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs) -> None:
+        """Saves the transfer and its balance updates in one transaction"""
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
 
     def update_accounts(self) -> None:
-        """Updates the connected accounts"""
+        """Updates the connected accounts and the totals of their bank
+
+        Balances are changed with conditional ``F()`` updates inside one
+        transaction, so a failed debit rolls back the whole transfer. A
+        sharded destination is credited through a free balance shard
+        instead of under its row lock.
+
+        Raises:
+            InsufficientFunds: if the source balance is not enough
+        """
+        with transaction.atomic():
+            if self.transfer_type == self.INTRA_BANK_TRANSFER:
+                sharded = bool(self.destination.shard_count)
+                locked = [self.source_id]
+                if not sharded:
+                    locked.append(self.destination_id)
+                Account.objects.lock(*locked)
+                Account.objects.debit(self.source_id, self.amount)
+                Account.objects.credit(
+                    self.destination_id, self.amount, sharded=sharded
+                )
+                BankTotal.objects.record(
+                    self.source.bank_id,
+                    transferred=self.amount,
+                    transfer_count=1,
+                )
+
+            elif self.transfer_type == self.INTER_BANK_TRANSFER:
+                # the destination is credited when the transfer is settled
+                Account.objects.lock(self.source_id)
+                Account.objects.debit(self.source_id, self.amount)
+                BankTotal.objects.record(
+                    self.src_bank_id,
+                    balance=-self.amount,
+                    transferred=self.amount,
+                    transfer_count=1,
+                )
+
+            elif self.transfer_type == self.ADD_FUND:
+                Account.objects.credit(
+                    self.destination_id,
+                    self.amount,
+                    sharded=bool(self.destination.shard_count),
+                )
+                BankTotal.objects.record(
+                    self.destination.bank_id,
+                    balance=self.amount,
+                    funds_added=self.amount,
+                    transfer_count=1,
+                )
+
+            elif self.transfer_type == self.REMOVE_FUND:
+                Account.objects.debit(self.source_id, self.amount)
+                BankTotal.objects.record(
+                    self.source.bank_id,
+                    balance=-self.amount,
+                    funds_removed=self.amount,
+                    transfer_count=1,
+                )
+
+            LedgerEntry.objects.bulk_create(self.get_ledger_entries())
+            self.get_outbox_event().save()
+
+    def get_ledger_entries(self) -> list:
+        """Returns the unsaved ledger entries of the transfer
+
+        Money is taken from the source and given to the destination. When
+        either is not an account, the money enters or leaves the app and
+        that side is booked to the bank instead, so the entries always sum
+        to zero.
+        """
+        return [
+            LedgerEntry(
+                transfer=self,
+                account_id=self.source_id,
+                bank_id=None if self.source_id else self.src_bank_id,
+                amount=-self.amount,
+                created=self.created,
+            ),
+            LedgerEntry(
+                transfer=self,
+                account_id=self.destination_id,
+                bank_id=None if self.destination_id else self.dst_bank_id,
+                amount=self.amount,
+                created=self.created,
+            ),
+        ]
+
+    def get_outbox_event(self) -> "OutboxEvent":
+        """Returns the unsaved event announcing the transfer
+
+        Accounts and banks are given by uuid, as in the API.
+        """
+        related = {}
+        for field in ("source", "destination", "src_bank", "dst_bank"):
+            if getattr(self, f"{field}_id") is None:
+                related[field] = None
+            else:
+                related[field] = getattr(self, field).uuid
+        return OutboxEvent(
+            topic=OutboxEvent.TRANSFER_CREATED,
+            payload={
+                "id": self.pk,
+                "transfer_type": self.transfer_type,
+                "amount": f"{Decimal(self.amount):.2f}",
+                "info": self.info,
+                "created": self.created,
+                **related,
+            },
+            created=self.created,
+        )
+
+
+class LedgerEntryQuerySet(models.QuerySet):
+    """Ledger entry queryset writing the entries of transfer batches"""
+
+    def create_intra_bank(self, transfers: list) -> None:
+        """Writes the entries of saved intra-bank transfers in one statement
+
+        The debit of the source and the credit of the destination are
+        copied from the transfer rows by an ``INSERT ... SELECT``, so the
+        statement takes a fixed number of parameters whatever the number of
+        transfers, where a ``bulk_create`` is split on SQLite.
+        """
+        if not transfers:
+            return
+        connection = connections[self._db or router.db_for_write(self.model)]
+        pks = [transfer.pk for transfer in transfers]
+        if connection.vendor == "postgresql":
+            # the created bounds prune the months the batch is not in
+            condition = (
+                "transfer.id = ANY(%s) AND transfer.created BETWEEN %s AND %s"
+            )
+            created = [transfer.created for transfer in transfers]
+            params = [pks, min(created), max(created)]
+        else:
+            # bulk created under the write lock, see _set_bulk_created_pks
+            condition = "transfer.id BETWEEN %s AND %s"
+            params = [min(pks), max(pks)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.model._meta.db_table} "
+                "(transfer_id, account_id, amount, created) "
+                "SELECT transfer.id, CASE side.sign WHEN -1 "
+                "THEN transfer.source_id ELSE transfer.destination_id END, "
+                "side.sign * transfer.amount, transfer.created "
+                f"FROM {Transfer._meta.db_table} transfer "
+                "CROSS JOIN (SELECT -1 AS sign UNION ALL SELECT 1) side "
+                f"WHERE {condition} ORDER BY transfer.id, side.sign",
+                params,
+            )
+
+
+class LedgerEntry(models.Model):
+    """
+    Append only double entry ledger line
+    Rows are only ever inserted; the entries of a transfer sum to zero
+    """
+
+    # the transfer table is partitioned by created on PostgreSQL, its
+    # primary key is (id, created) and can not be referenced by id alone
+    transfer = models.ForeignKey(
+        Transfer,
+        on_delete=models.CASCADE,
+        related_name="ledger_entries",
+        db_constraint=False,
+    )
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        related_name="ledger_entries",
+        null=True,
+        blank=True,
+    )
+    bank = models.ForeignKey(
+        Bank,
+        on_delete=models.CASCADE,
+        related_name="ledger_entries",
+        null=True,
+        blank=True,
+    )
+    amount = models.DecimalField(decimal_places=2, max_digits=18)
+    created = models.DateTimeField(default=timezone.now)
+
+    objects = LedgerEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["account", "id"], name="ledger_account_id_idx"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Ledger entry of {self.amount}"
+
+    def save(self, *args, **kwargs) -> None:
+        if not self._state.adding:
+            raise ValueError("Ledger entries can not be updated")
+        super().save(*args, **kwargs)
+
+
+class BalanceSnapshot(models.Model):
+    """
+    Account balance after every ledger entry up to last_entry_id
+    taken_at is the time of the newest entry included, or the time the
+    opening balance was recorded
+    """
+
+    account = models.ForeignKey(
+        Account, on_delete=models.CASCADE, related_name="balance_snapshots"
+    )
+    balance = models.DecimalField(decimal_places=2, max_digits=18)
+    last_entry_id = models.BigIntegerField()
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-last_entry_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "last_entry_id"],
+                name="snapshot_account_entry_unique",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Balance of {self.balance} at {self.taken_at}"
+
+
+class DailyTransferRollup(models.Model):
+    """
+    Transfers of an account on one day and of one type
+    credit and debit are the money received and sent, count is the number
+    of ledger entries of the account
+    """
+
+    account = models.ForeignKey(
+        Account, on_delete=models.CASCADE, related_name="daily_rollups"
+    )
+    day = models.DateField()
+    transfer_type = models.CharField(
+        max_length=255, choices=Transfer.TRANSFER_CHOICES
+    )
+    count = models.PositiveIntegerField(default=0)
+    credit = models.DecimalField(decimal_places=2, max_digits=18, default=0)
+    debit = models.DecimalField(decimal_places=2, max_digits=18, default=0)
+
+    # name of the checkpoint of the rollup job
+    CHECKPOINT = "daily_transfer_rollup"
+    # name of the last ledger entry id seen by the job, with its time
+    WATERMARK = "daily_transfer_rollup_watermark"
+
+    class Meta:
+        ordering = ["day"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "day", "transfer_type"],
+                name="rollup_account_day_type_unique",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Rollup of {self.transfer_type} on {self.day}"
+
+
+class Checkpoint(models.Model):
+    """
+    Progress of an incremental job
+    position is the last row or offset processed, reached_at the time up
+    to which the job is complete
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    reached_at = models.DateTimeField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Checkpoint {self.name} at {self.position}"
+
+
+class SettlementCycle(models.Model):
+    """
+    Netting cycle of the queued inter-bank transfers
+    gross_amount is the money the transfers move, net_amount what the banks
+    owing money pay after netting
+    """
+
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    transfer_count = models.PositiveIntegerField(default=0)
+    gross_amount = models.DecimalField(
+        decimal_places=2, max_digits=18, default=0
+    )
+    net_amount = models.DecimalField(
+        decimal_places=2, max_digits=18, default=0
+    )
+    oldest_queued_at = models.DateTimeField(null=True, blank=True)
+
+    # name of the checkpoint locked by the running cycle
+    CHECKPOINT = "inter_bank_settlement"
+
+    class Meta:
+        ordering = ["-id"]
+
+    def __str__(self) -> str:
+        return f"Settlement cycle {self.pk}"
+
+
+class InterBankTransfer(models.Model):
+    """
+    Inter-bank transfer queued for settlement
+    cycle is set by the settlement cycle that credits the destination
+    """
+
+    # the transfer table is partitioned by created on PostgreSQL, created
+    # completes the key of the transfer
+    transfer = models.OneToOneField(
+        Transfer,
+        on_delete=models.CASCADE,
+        related_name="settlement",
+        db_constraint=False,
+    )
+    created = models.DateTimeField()
+    # rows are only read by cycle, indexes on the other keys would be
+    # written for every claimed row
+    destination = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        related_name="inter_bank_credits",
+        db_index=False,
+    )
+    src_bank = models.ForeignKey(
+        Bank,
+        on_delete=models.CASCADE,
+        related_name="inter_bank_debits",
+        db_index=False,
+    )
+    dst_bank = models.ForeignKey(
+        Bank, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    amount = models.DecimalField(decimal_places=2, max_digits=18)
+    cycle = models.ForeignKey(
+        SettlementCycle,
+        on_delete=models.PROTECT,
+        related_name="transfers",
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["id"],
+                name="interbank_pending_idx",
+                condition=models.Q(cycle__isnull=True),
+            ),
+        ]
 
-        if self.transfer_type == self.INTRA_BANK_TRANSFER:
-            self.source.balance -= self.amount
-            self.source.save()
+    def __str__(self) -> str:
+        return f"Inter-bank transfer of {self.amount}"
 
-            self.destination.balance += self.amount
-            self.destination.save()
 
-        elif self.transfer_type == self.ADD_FUND:
-            self.destination.balance += self.amount
-            self.destination.save()
+class SettlementPosition(models.Model):
+    """
+    Net amount one bank pays another in a settlement cycle
+    transfer_count is the number of transfers between the two banks, in
+    both directions
+    """
 
-        elif self.transfer_type == self.REMOVE_FUND:
-            self.source.balance -= self.amount
-            self.source.save()
+    cycle = models.ForeignKey(
+        SettlementCycle, on_delete=models.CASCADE, related_name="positions"
+    )
+    payer = models.ForeignKey(
+        Bank, on_delete=models.CASCADE, related_name="settlement_debits"
+    )
+    payee = models.ForeignKey(
+        Bank, on_delete=models.CASCADE, related_name="settlement_credits"
+    )
+    amount = models.DecimalField(decimal_places=2, max_digits=18)
+    transfer_count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self) -> str:
+        return f"Settlement of {self.amount}"
+
+
+class ScheduledTransfer(BaseModel):
+    """
+    Standing order moving amount from source to destination on a schedule
+    next_run_at is the time of the next occurrence, null once the schedule
+    is over; occurrences counts the runs, failed ones included
+    """
+
+    ONCE = "once"
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+    FREQUENCY_CHOICES = (
+        (ONCE, "Once"),
+        (DAILY, "Daily"),
+        (WEEKLY, "Weekly"),
+        (MONTHLY, "Monthly"),
+    )
+
+    source = models.ForeignKey(
+        Account, on_delete=models.CASCADE, related_name="scheduled_debits"
+    )
+    destination = models.ForeignKey(
+        Account, on_delete=models.CASCADE, related_name="scheduled_credits"
+    )
+    amount = models.DecimalField(decimal_places=2, max_digits=18)
+    info = models.CharField(max_length=255)
+    frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField(null=True, blank=True)
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    occurrences = models.PositiveIntegerField(default=0)
+    failures = models.PositiveIntegerField(default=0)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [
+            models.Index(
+                fields=["next_run_at"],
+                name="scheduled_due_idx",
+                condition=models.Q(next_run_at__isnull=False),
+            ),
+        ]
+
+    def get_run_at(self, occurrence: int) -> datetime:
+        """Returns the time of an occurrence, the first one is 0
+
+        Occurrences are counted from starts_at in local time, so they keep
+        its time of day. A monthly occurrence falls on the day of
+        starts_at, or on the last day of a shorter month.
+        """
+        start = timezone.localtime(self.starts_at).replace(tzinfo=None)
+        if self.frequency == self.MONTHLY:
+            index = start.year * 12 + start.month - 1 + occurrence
+            year, month = divmod(index, 12)
+            day = min(start.day, calendar.monthrange(year, month + 1)[1])
+            run_at = start.replace(year=year, month=month + 1, day=day)
+        else:
+            days = {self.DAILY: 1, self.WEEKLY: 7}.get(self.frequency, 0)
+            run_at = start + timedelta(days=days * occurrence)
+        return timezone.make_aware(run_at)
+
+    def record_run(self, result, ran_at: datetime) -> None:
+        """Counts the run of the due occurrence and moves to the next one
+
+        A failed occurrence is not tried again, the schedule goes on.
+
+        Args:
+            result: the created Transfer or a dict of errors
+            ran_at (datetime): time of the run
+        """
+        self.last_run_at = ran_at
+        if isinstance(result, dict):
+            self.failures += 1
+            self.last_error = "; ".join(
+                f"{field}: {message}" for field, message in result.items()
+            )[:255]
+        else:
+            self.last_error = ""
+        self.occurrences += 1
+        self.next_run_at = None
+        if self.frequency != self.ONCE:
+            run_at = self.get_run_at(self.occurrences)
+            if self.ends_at is None or run_at <= self.ends_at:
+                self.next_run_at = run_at
+
+
+class TransferImport(models.Model):
+    """
+    Uploaded file of historical transfers
+    Imported by the admin action with core.imports.TransferImporter, the
+    counts add up over runs and errors keeps the first rejected records
+    """
+
+    file = models.FileField(upload_to="imports/")
+    imported = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    # rejected records kept in errors
+    MAX_ERRORS = 100
+
+    class Meta:
+        ordering = ["-id"]
+
+    def __str__(self) -> str:
+        return f"Transfer import {self.file.name}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Event written in the transaction of the change it records
+    The relay_outbox command publishes the pending events to the sinks and
+    sets published_at
+    """
+
+    TRANSFER_CREATED = "transfer.created"
+    SETTLEMENT_COMPLETED = "settlement.completed"
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(default=timezone.now)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["id"],
+                name="outbox_pending_idx",
+                condition=models.Q(published_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Outbox event {self.topic} {self.pk}"
+
+    def get_message(self) -> dict:
+        """Return the event as published to the sinks"""
+        return {
+            "id": self.pk,
+            "topic": self.topic,
+            "created": self.created,
+            "payload": self.payload,
+        }
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response of a request made with an Idempotency-Key header
+    The key is a digest of the client key scoped by user, method and path
+    """
+
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"Idempotency key {self.key}"
@@ -0,0 +1,195 @@
+import json
+import os
+import queue
+import threading
+import urllib.request
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import OutboxEvent
+
+
+class Sink:
+    """
+    Destination of the published outbox events
+    A batch is published before its events are marked published, a sink
+    can see a batch again after a failure
+    """
+
+    def publish(self, messages: list) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class FileSink(Sink):
+    """Append the messages as NDJSON lines to OUTBOX_FILE_PATH"""
+
+    def __init__(self, path: str = "") -> None:
+        self.file = open(path or settings.OUTBOX_FILE_PATH, "a")
+
+    def publish(self, messages: list) -> None:
+        self.file.write(
+            "".join(
+                json.dumps(message, cls=DjangoJSONEncoder) + "\n"
+                for message in messages
+            )
+        )
+        # the batch is on disk before it is marked published
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+QUEUES = {}
+queues_lock = threading.Lock()
+
+
+def get_queue(name: str) -> queue.Queue:
+    """Return the in process queue of a name, created on first use"""
+    with queues_lock:
+        if name not in QUEUES:
+            QUEUES[name] = queue.Queue()
+        return QUEUES[name]
+
+
+class QueueSink(Sink):
+    """
+    Put the messages on an in process queue, for consumers running as
+    threads of the relay process
+    """
+
+    def __init__(self, name: str = "outbox") -> None:
+        self.queue = get_queue(name)
+
+    def publish(self, messages: list) -> None:
+        for message in messages:
+            self.queue.put(message)
+
+
+class WebhookSink(Sink):
+    """
+    POST each batch as a JSON array to OUTBOX_WEBHOOK_URL
+    A response other than 2xx fails the batch
+    """
+
+    def __init__(self, url: str = "", timeout: float = None) -> None:
+        self.url = url or settings.OUTBOX_WEBHOOK_URL
+        if not self.url:
+            raise ImproperlyConfigured("Set OUTBOX_WEBHOOK_URL")
+        self.timeout = timeout or settings.OUTBOX_WEBHOOK_TIMEOUT
+
+    def publish(self, messages: list) -> None:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(messages, cls=DjangoJSONEncoder).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        # urlopen raises HTTPError on a 4xx or 5xx status
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+SINKS = {
+    "file": FileSink,
+    "queue": QueueSink,
+    "webhook": WebhookSink,
+}
+
+
+def get_sinks(names: list) -> list:
+    """Return a sink for each name of a built in sink or Sink dotted path"""
+    sinks = []
+    for name in names:
+        name = name.strip()
+        if name in SINKS:
+            sinks.append(SINKS[name]())
+        elif "." in name:
+            sinks.append(import_string(name)())
+        else:
+            raise ImproperlyConfigured(f"Unknown outbox sink {name}")
+    return sinks
+
+
+def relay_batch(sinks: list, batch_size: int) -> list:
+    """Publish the oldest pending events to every sink
+
+    The events are locked with SKIP LOCKED, so relays running side by side
+    publish different batches. They are marked published in the same
+    transaction, a failing sink leaves the whole batch pending.
+
+    Args:
+        sinks (list): the sinks to publish to
+        batch_size (int): events published at most
+
+    Returns:
+        list: the published events
+    """
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.filter(published_at__isnull=True)
+            .select_for_update(skip_locked=True)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return []
+        messages = [event.get_message() for event in events]
+        for sink in sinks:
+            sink.publish(messages)
+        published_at = timezone.now()
+        OutboxEvent.objects.filter(
+            pk__in=[event.pk for event in events]
+        ).update(published_at=published_at)
+    for event in events:
+        event.published_at = published_at
+    return events
+
+
+def purge_published(before, batch_size: int = 10000) -> int:
+    """Delete the events published before a time, in batches"""
+    deleted = 0
+    while True:
+        pks = list(
+            OutboxEvent.objects.filter(published_at__lt=before).values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not pks:
+            return deleted
+        deleted += OutboxEvent.objects.filter(pk__in=pks).delete()[0]
+
+
+def outbox_metrics() -> list:
+    """Return the exposition lines of the pending events
+
+    One scan of the pending events index, which only holds the events the
+    relay did not publish yet.
+    """
+    try:
+        pending = OutboxEvent.objects.filter(
+            published_at__isnull=True
+        ).aggregate(count=Count("id"), oldest=Min("created"))
+    except DatabaseError:
+        # the request metrics are still served while the database is down
+        return []
+    oldest = pending["oldest"]
+    age = (timezone.now() - oldest).total_seconds() if oldest else 0
+    return [
+        "# HELP outbox_pending_events Events not published yet",
+        "# TYPE outbox_pending_events gauge",
+        f"outbox_pending_events {pending['count']}",
+        "# HELP outbox_oldest_pending_seconds Age of the oldest pending "
+        "event",
+        "# TYPE outbox_oldest_pending_seconds gauge",
+        f"outbox_oldest_pending_seconds {age}",
+    ]
@@ -0,0 +1,186 @@
+import gzip
+import os
+import re
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Checkpoint
+
+
+PARENT = "core_transfer"
+DEFAULT_PARTITION = "core_transfer_default"
+PARTITION_NAME = re.compile(r"^core_transfer_p(\d{4})_(\d{2})$")
+ARCHIVE_SCHEMA = "archive"
+ARCHIVE_CHECKPOINT = "transfer_archive"
+
+
+def get_archived_before():
+    """Return the time before which the transfers were archived, or None"""
+    return (
+        Checkpoint.objects.filter(name=ARCHIVE_CHECKPOINT)
+        .values_list("reached_at", flat=True)
+        .first()
+    )
+
+
+def month_start(value: datetime) -> datetime:
+    """Return the start of the month of value in the current time zone"""
+    value = timezone.localtime(value)
+    return timezone.make_aware(datetime(value.year, value.month, 1))
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return timezone.make_aware(datetime(index // 12, index % 12 + 1, 1))
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned() -> bool:
+    """Check if the transfer table is partitioned, never on SQLite"""
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = %s::regclass",
+            [PARENT],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions() -> dict:
+    """Return the month start of each monthly partition by name, oldest
+    first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [PARENT],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in sorted(names):
+        match = PARTITION_NAME.match(name)
+        if match:
+            year, month = map(int, match.groups())
+            partitions[name] = timezone.make_aware(datetime(year, month, 1))
+    return partitions
+
+
+def create_partition(month: datetime) -> bool:
+    """Create the partition of a month if missing
+
+    Rows of the month that landed in the default partition are moved into
+    the new table before it is attached.
+
+    Returns:
+        bool: whether the partition was created
+    """
+    name = partition_name(month)
+    if name in get_partitions():
+        return False
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {name} "
+            f"(LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE created >= %s AND created < %s RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved",
+            bounds,
+        )
+        cursor.execute(
+            f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+    return True
+
+
+def ensure_partitions(months_ahead: int) -> list:
+    """Create the partitions from the current month to months_ahead
+
+    Returns:
+        list: names of the created partitions
+    """
+    month = month_start(timezone.now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month_ahead = add_months(month, offset)
+        if create_partition(month_ahead):
+            created.append(partition_name(month_ahead))
+    return created
+
+
+def archive_partition(name: str, to: str, directory: str = "") -> str:
+    """Detach a monthly partition and keep it out of the transfer table
+
+    With to="table" the detached table moves to the archive schema, from
+    where it can be attached again. With to="file" its rows are written
+    to a gzip compressed CSV file and the table is dropped. The rows are
+    copied and the partition dropped in one transaction, so a failed run
+    leaves the partition in place. The archive checkpoint moves to the end
+    of the month in the same transaction, partitions are archived oldest
+    first.
+
+    Args:
+        name (str): name of the partition
+        to (str): "table" or "file"
+        directory (str): directory of the archive files
+
+    Returns:
+        str: the archive table or file
+
+    Raises:
+        ValueError: if an older partition is still attached
+    """
+    partitions = get_partitions()
+    month = partitions[name]
+    if min(partitions.values()) < month:
+        raise ValueError(f"Archive the partitions older than {name} first")
+    end = add_months(month, 1)
+
+    def detach(cursor) -> None:
+        cursor.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+        Checkpoint.objects.update_or_create(
+            name=ARCHIVE_CHECKPOINT, defaults={"reached_at": end}
+        )
+
+    if to == "table":
+        with transaction.atomic(), connection.cursor() as cursor:
+            detach(cursor)
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+            cursor.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+        return f"{ARCHIVE_SCHEMA}.{name}"
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    partial = f"{path}.partial"
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            detach(cursor)
+            with open(partial, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+                    cursor.copy_expert(
+                        f"COPY (SELECT * FROM {name} ORDER BY created, id) "
+                        "TO STDOUT WITH (FORMAT csv, HEADER)",
+                        archive,
+                    )
+                # the file is on disk before the rows are dropped
+                raw.flush()
+                os.fsync(raw.fileno())
+            cursor.execute(f"DROP TABLE {name}")
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return path
@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import hashlib
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+current_routing = contextvars.ContextVar("current_routing", default=None)
+
+
+def replica_reads(view):
+    """Mark a view whose reads can lag behind the primary
+
+    Args:
+        view (callable): a view, decorated with api_view for DRF views
+
+    Returns:
+        callable: the same view
+    """
+    getattr(view, "cls", view).replica_reads = True
+    return view
+
+
+def reads_from_replica(view) -> bool:
+    """Check if a resolved view was marked with replica_reads"""
+    return getattr(getattr(view, "cls", view), "replica_reads", False)
+
+
+def get_client_key(request):
+    """Return the cache key of the client sending request
+
+    A client is known by its credentials, the Authorization header or the
+    session cookie, so all its workers and connections share one key.
+    """
+    credentials = request.META.get("HTTP_AUTHORIZATION") or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    digest = hashlib.sha256(credentials.encode()).hexdigest()
+    return f"replica:pin:{digest}"
+
+
+class Routing:
+    """
+    Replica chosen for the reads of the request being handled, and whether
+    it wrote
+    """
+
+    def __init__(self, request) -> None:
+        self.request = request
+        self.wrote = False
+        self.decided = False
+        self.replica = None
+
+    def get_replica(self):
+        """Return the replica alias of the request, None for the primary
+
+        Decided on the first read after the URL was resolved: a replica
+        when the view reads from replicas and the client did not write
+        within REPLICA_PIN_SECONDS, the primary otherwise.
+        """
+        if self.wrote:
+            return None
+        if not self.decided:
+            match = getattr(self.request, "resolver_match", None)
+            if match is None:
+                return None
+            self.decided = True
+            if reads_from_replica(match.func) and not self.is_pinned():
+                self.replica = random.choice(settings.DATABASE_REPLICAS)
+        return self.replica
+
+    def is_pinned(self) -> bool:
+        key = get_client_key(self.request)
+        return key is not None and bool(caches["default"].get(key))
+
+    def pin(self) -> None:
+        """Keep the reads of the client on the primary for a while"""
+        key = get_client_key(self.request)
+        if key is not None:
+            caches["default"].set(key, True, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaRouter:
+    """
+    Send the reads of replica_reads views to a replica in
+    DATABASE_REPLICAS and everything else to the primary
+    Reads inside a transaction of the primary, after a write of the same
+    request and after a recent write of the same client stay on the
+    primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None or not settings.DATABASE_REPLICAS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return routing.get_replica()
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        # an instance read from a replica is saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def route_stream(routing: Routing, content):
+    """Iterate a streaming response with the routing of its request
+
+    A streamed body is read after the view returned, each chunk is read
+    with the routing set again.
+    """
+    iterator = iter(content)
+    while True:
+        token = current_routing.set(routing)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            current_routing.reset(token)
+        yield chunk
+
+
+class ReplicaMiddleware:
+    """
+    Route the reads of each request with ReplicaRouter, and pin the client
+    to the primary for REPLICA_PIN_SECONDS after a request that wrote, so
+    it reads its own writes
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # make the handler await this middleware instead of wrapping it
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        routing = Routing(request)
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(routing, response)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        routing = Routing(request)
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(routing, response)
+
+    def finish(self, routing: Routing, response):
+        if routing.wrote:
+            routing.pin()
+        elif routing.replica and response.streaming:
+            response.streaming_content = route_stream(
+                routing, response.streaming_content
+            )
+        return response
@@ -0,0 +1,131 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import (
+    Account,
+    InsufficientFunds,
+    ScheduledTransfer,
+    Transfer,
+)
+
+
+def claim_due(batch_size: int, now) -> list:
+    """Lock the scheduled transfers due at now, oldest first
+
+    The rows are read through the partial index on next_run_at and locked
+    with SKIP LOCKED, so workers running side by side claim different
+    batches instead of waiting on each other. Only the scheduled rows are
+    locked, the accounts are locked later in primary key order.
+    """
+    features = connection.features
+    return list(
+        ScheduledTransfer.objects.filter(next_run_at__lte=now)
+        .select_related("source", "destination")
+        .select_for_update(
+            skip_locked=True,
+            of=("self",) if features.has_select_for_update_of else (),
+        )
+        .order_by("next_run_at")[:batch_size]
+    )
+
+
+def run_due(batch_size: int, now=None) -> list:
+    """Run a batch of due scheduled transfers in one transaction
+
+    The accounts of every claimed transfer are locked first, in one call
+    and primary key order, so workers and the transfer endpoints can not
+    deadlock on them. Transfers within a bank are then made together by
+    ``Transfer.objects.create_intra_bank_batch``, which moves the balances
+    with grouped updates. Transfers to another bank are queued for
+    settlement one by one. Each scheduled
+    transfer then moves to its next occurrence, all of them in one bulk
+    update.
+
+    Args:
+        batch_size (int): scheduled transfers run at most
+        now (datetime, optional): time the transfers are due by, defaults
+            to now
+
+    Returns:
+        list: the scheduled transfers run, with the time of the occurrence
+        run as due_at
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = claim_due(batch_size, now)
+        if not due:
+            return []
+        Account.objects.lock(
+            *{
+                pk
+                for scheduled in due
+                for pk in (scheduled.source_id, scheduled.destination_id)
+            }
+        )
+        intra = [
+            scheduled
+            for scheduled in due
+            if scheduled.source.bank_id == scheduled.destination.bank_id
+        ]
+        results = {}
+        if intra:
+            created = Transfer.objects.create_intra_bank_batch(
+                [
+                    {
+                        "source": scheduled.source.uuid,
+                        "destination": scheduled.destination.uuid,
+                        "amount": scheduled.amount,
+                        "info": scheduled.info,
+                    }
+                    for scheduled in intra
+                ]
+            )
+            for scheduled, result in zip(intra, created):
+                results[scheduled.pk] = result
+        for scheduled in due:
+            if scheduled.pk in results:
+                continue
+            try:
+                with transaction.atomic():
+                    result = Transfer.objects.create_inter_bank(
+                        scheduled.source,
+                        scheduled.destination,
+                        scheduled.amount,
+                        scheduled.info,
+                    )
+            except InsufficientFunds:
+                result = {"source": "Account does not have enough fund"}
+            results[scheduled.pk] = result
+
+        ran_at = timezone.now()
+        for scheduled in due:
+            scheduled.due_at = scheduled.next_run_at
+            scheduled.record_run(results[scheduled.pk], ran_at)
+        save_runs(due)
+    return due
+
+
+def save_runs(due: list) -> None:
+    """Save the run fields of the scheduled transfers in one statement
+
+    On PostgreSQL the rows are changed by one ``UPDATE`` joined to the
+    arrays of their new values, as ``bulk_update`` spends longer building
+    its ``CASE`` per field than the database spends running it.
+    """
+    fields = ["next_run_at", "occurrences", "failures", "last_error"]
+    if connection.vendor != "postgresql":
+        ScheduledTransfer.objects.bulk_update(due, fields + ["last_run_at"])
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {ScheduledTransfer._meta.db_table} scheduled "
+            "SET next_run_at = run.next_run_at, "
+            "occurrences = run.occurrences, failures = run.failures, "
+            "last_error = run.last_error, last_run_at = %s "
+            "FROM unnest(%s::bigint[], %s::timestamptz[], %s::integer[], "
+            "%s::integer[], %s::varchar[]) AS run (id, next_run_at, "
+            "occurrences, failures, last_error) WHERE scheduled.id = run.id",
+            [due[0].last_run_at, [scheduled.pk for scheduled in due]]
+            + [[getattr(scheduled, field) for scheduled in due]
+               for field in fields],
+        )
@@ -0,0 +1,220 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from core.models import (
+    Account,
+    Bank,
+    BankTotal,
+    Checkpoint,
+    InterBankTransfer,
+    LedgerEntry,
+    OutboxEvent,
+    SettlementCycle,
+    SettlementPosition,
+    Transfer,
+)
+
+
+def net_positions(pairs: dict) -> tuple:
+    """Net the gross amounts sent between banks
+
+    Args:
+        pairs (dict): (payer, payee) bank keys to the amount and count of
+            the transfers sent
+
+    Returns:
+        tuple: the bilateral positions as (payer, payee) to the net amount
+        and count of transfers in both directions, and the multilateral
+        position of each bank, positive when it receives money
+    """
+    positions = {}
+    banks = defaultdict(Decimal)
+    for (payer, payee), (amount, count) in pairs.items():
+        banks[payer] -= amount
+        banks[payee] += amount
+        if (payee, payer) in positions:
+            continue
+        back, back_count = pairs.get((payee, payer), (Decimal(0), 0))
+        if amount < back:
+            payer, payee, amount, back = payee, payer, back, amount
+        positions[payer, payee] = (amount - back, count + back_count)
+    return positions, dict(banks)
+
+
+def credit_destinations(cycle: SettlementCycle) -> int:
+    """Credit the destination accounts of the transfers of a cycle
+
+    Each account gets the sum of its transfers in one grouped update,
+    under row locks taken in primary key order like any other writer.
+
+    Returns:
+        int: the number of accounts credited
+    """
+    credits = dict(
+        InterBankTransfer.objects.filter(cycle=cycle)
+        .values("destination_id")
+        .annotate(total=Sum("amount"))
+        .order_by()
+        .values_list("destination_id", "total")
+    )
+    Account.objects.lock(*credits)
+    Account.objects.apply_deltas(credits)
+    return len(credits)
+
+
+def book_transfers(cycle: SettlementCycle, settled_at) -> None:
+    """Set the destination of the settled transfers and add the ledger
+    entries moving the money from the destination bank to the account
+
+    Both are single set based statements over the transfers of the cycle,
+    the transfer rows are matched on their (id, created) key so each
+    update stays in the partition of the transfer.
+    """
+    queue = InterBankTransfer._meta.db_table
+    settled_at = connection.ops.adapt_datetimefield_value(settled_at)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {Transfer._meta.db_table} "
+            "SET destination_id = queue.destination_id "
+            f"FROM {queue} queue WHERE queue.cycle_id = %s "
+            f"AND {Transfer._meta.db_table}.id = queue.transfer_id "
+            f"AND {Transfer._meta.db_table}.created = queue.created",
+            [cycle.pk],
+        )
+        cursor.execute(
+            f"INSERT INTO {LedgerEntry._meta.db_table} "
+            "(transfer_id, account_id, bank_id, amount, created) "
+            "SELECT transfer_id, NULL, dst_bank_id, -amount, %s "
+            f"FROM {queue} WHERE cycle_id = %s UNION ALL "
+            "SELECT transfer_id, destination_id, NULL, amount, %s "
+            f"FROM {queue} WHERE cycle_id = %s",
+            [settled_at, cycle.pk, settled_at, cycle.pk],
+        )
+
+
+def settle_cycle(max_transfers: int) -> SettlementCycle:
+    """Settle the queued inter-bank transfers in one netting cycle
+
+    The oldest queued transfers, at most max_transfers, are claimed by the
+    cycle and netted into one position per pair of banks. The destination
+    accounts are then credited and the transfers booked with grouped and
+    set based statements, so the cost of a cycle does not grow with a
+    query per transfer. Everything happens in one transaction, a failed
+    cycle leaves the transfers queued. Cycles run one at a time, the
+    checkpoint row is locked while a cycle runs.
+
+    Args:
+        max_transfers (int): transfers settled at most
+
+    Returns:
+        SettlementCycle: the finished cycle, None when no transfer is
+        queued
+    """
+    Checkpoint.objects.get_or_create(name=SettlementCycle.CHECKPOINT)
+    with transaction.atomic():
+        checkpoint = Checkpoint.objects.select_for_update().get(
+            name=SettlementCycle.CHECKPOINT
+        )
+        queued = InterBankTransfer.objects.filter(cycle__isnull=True)
+        last = (
+            queued.order_by("id")
+            .values_list("id", flat=True)[max_transfers - 1:max_transfers]
+            .first()
+        )
+        if last is None:
+            # fewer transfers queued than a cycle takes
+            last = (
+                queued.order_by("-id").values_list("id", flat=True).first()
+            )
+        if last is None:
+            return None
+
+        cycle = SettlementCycle.objects.create()
+        queued.filter(id__lte=last).update(cycle=cycle)
+        claimed = InterBankTransfer.objects.filter(cycle=cycle)
+        pairs = {
+            (row["src_bank_id"], row["dst_bank_id"]): (
+                row["amount"],
+                row["count"],
+            )
+            for row in claimed.values("src_bank_id", "dst_bank_id")
+            .annotate(amount=Sum("amount"), count=Count("id"))
+            .order_by()
+        }
+        positions, banks = net_positions(pairs)
+
+        credit_destinations(cycle)
+        settled_at = timezone.now()
+        book_transfers(cycle, settled_at)
+        received = defaultdict(Decimal)
+        for (payer, payee), (amount, count) in pairs.items():
+            received[payee] += amount
+        for bank_id in sorted(received):
+            BankTotal.objects.record(bank_id, balance=received[bank_id])
+
+        SettlementPosition.objects.bulk_create(
+            SettlementPosition(
+                cycle=cycle,
+                payer_id=payer,
+                payee_id=payee,
+                amount=amount,
+                transfer_count=count,
+            )
+            for (payer, payee), (amount, count) in positions.items()
+            if amount
+        )
+        cycle.transfer_count = sum(count for _, count in pairs.values())
+        cycle.gross_amount = sum(
+            (amount for amount, _ in pairs.values()), Decimal(0)
+        )
+        cycle.net_amount = sum(
+            (-net for net in banks.values() if net < 0), Decimal(0)
+        )
+        cycle.oldest_queued_at = claimed.aggregate(oldest=Min("created"))[
+            "oldest"
+        ]
+        cycle.finished_at = timezone.now()
+        cycle.save()
+        OutboxEvent.objects.create(
+            topic=OutboxEvent.SETTLEMENT_COMPLETED,
+            payload=get_cycle_payload(cycle, positions, banks),
+            created=cycle.finished_at,
+        )
+        checkpoint.position = last
+        checkpoint.reached_at = cycle.finished_at
+        checkpoint.save()
+    return cycle
+
+
+def get_cycle_payload(
+    cycle: SettlementCycle, positions: dict, banks: dict
+) -> dict:
+    """Return the payload of the event announcing a settled cycle
+
+    Banks are given by uuid, as in the API.
+    """
+    uuids = dict(Bank.objects.filter(pk__in=banks).values_list("pk", "uuid"))
+    return {
+        "cycle": cycle.pk,
+        "transfer_count": cycle.transfer_count,
+        "gross_amount": f"{cycle.gross_amount:.2f}",
+        "net_amount": f"{cycle.net_amount:.2f}",
+        "positions": [
+            {
+                "payer": uuids[payer],
+                "payee": uuids[payee],
+                "amount": f"{amount:.2f}",
+                "transfer_count": count,
+            }
+            for (payer, payee), (amount, count) in positions.items()
+            if amount
+        ],
+        "banks": {
+            str(uuids[bank_id]): f"{net:.2f}"
+            for bank_id, net in banks.items()
+        },
+    }
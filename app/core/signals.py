@@ -1,7 +1,8 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
-from core.models import Transfer
+from core.models import Account, BalanceSnapshot, Bank, BankTotal, Transfer
 
 
 @receiver(post_save, sender=Transfer)
@@ -13,3 +14,31 @@ def post_save_transfer_created_receiver(
     """
     if created:
         instance.update_accounts()
+
+
+@receiver(post_save, sender=Account)
+def post_save_account_created_receiver(
+    sender, instance: Account, created, **kwargs
+) -> None:
+    """
+    Record the opening balance for the ledger and the bank totals
+    """
+    if created:
+        BalanceSnapshot.objects.create(
+            account=instance,
+            balance=instance.balance,
+            last_entry_id=0,
+            taken_at=timezone.now(),
+        )
+        BankTotal.objects.record(instance.bank_id, balance=instance.balance)
+
+
+@receiver(post_save, sender=Bank)
+def post_save_bank_created_receiver(
+    sender, instance: Bank, created, **kwargs
+) -> None:
+    """
+    Create the running total slots of the bank
+    """
+    if created:
+        BankTotal.objects.create_slots(instance.pk)
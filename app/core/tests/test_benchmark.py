@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase
+
+from core.models import (
+    Account,
+    Bank,
+    InterBankTransfer,
+    LedgerEntry,
+    ScheduledTransfer,
+    Transfer,
+)
+from core.management.commands.seed_data import OPENING_BALANCE
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    """Test the seed and load test commands"""
+
+    def get_constraints(self) -> dict:
+        with connection.cursor() as cursor:
+            return {
+                model: connection.introspection.get_constraints(
+                    cursor, model._meta.db_table
+                )
+                for model in (Transfer, LedgerEntry, InterBankTransfer)
+            }
+
+    def test_seed_data(self):
+        """Test seeded balances match the seeded ledger entries and the
+        indexes dropped for the load are back"""
+        constraints = self.get_constraints()
+        call_command(
+            "seed_data",
+            "--banks=2",
+            "--accounts=10",
+            "--transfers=200",
+            "--queued=20",
+            "--scheduled=5",
+            "--batch-size=50",
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(Bank.objects.count(), 2)
+        self.assertEqual(Account.objects.count(), 10)
+        self.assertEqual(Transfer.objects.count(), 220)
+        self.assertEqual(InterBankTransfer.objects.count(), 20)
+        self.assertEqual(ScheduledTransfer.objects.count(), 5)
+        for account in Account.objects.all():
+            amounts = LedgerEntry.objects.filter(account=account).values_list(
+                "amount", flat=True
+            )
+            self.assertEqual(account.balance, OPENING_BALANCE + sum(amounts))
+        self.assertEqual(self.get_constraints(), constraints)
+
+    def test_seed_data_deterministic(self):
+        """Test the same seed and end date give the same data, which
+        reconciles"""
+        args = ["--banks=2", "--accounts=6", "--transfers=100", "--seed=7"]
+        args.extend(["--queued=10", "--end=2026-03-01"])
+
+        def seed() -> list:
+            call_command("seed_data", *args, stdout=StringIO())
+            return list(
+                Transfer.objects.order_by("created").values_list(
+                    "created",
+                    "amount",
+                    "transfer_type",
+                    "source__uuid",
+                    "destination__uuid",
+                    "src_bank__uuid",
+                    "dst_bank__uuid",
+                )
+            )
+
+        first = seed()
+        out = StringIO()
+        call_command("reconcile", "--workers=1", stdout=out)
+        call_command("flush", interactive=False)
+        second = seed()
+
+        self.assertIn("no drift", out.getvalue())
+        self.assertEqual(first, second)
+        self.assertEqual(len(first), 110)
+        self.assertLess(first[-1][0].date().isoformat(), "2026-03-01")
+
+    def test_benchmark_api(self):
+        """Test the load test runs the mix and writes the results file"""
+        call_command(
+            "seed_data",
+            "--banks=1",
+            "--accounts=4",
+            "--transfers=10",
+            stdout=StringIO(),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_api",
+                "--clients=2",
+                "--requests=20",
+                "--warmup=0",
+                f"--output={output}",
+                stdout=StringIO(),
+            )
+            with open(output) as results_file:
+                results = json.load(results_file)
+
+        self.assertEqual(results["total"]["requests"], 20)
+        self.assertEqual(results["total"]["errors"], 0)
+        self.assertGreater(results["total"]["queries_per_request"], 0)
+        self.assertIn("p99_ms", results["total"])
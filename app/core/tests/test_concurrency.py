@@ -0,0 +1,126 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+
+from core.models import Account, Transfer, InsufficientFunds
+from core.utils import sample_bank, sample_account, sample_transfer
+
+
+# kept under the default postgres max_connections of 100
+WRITERS = 64
+OPERATIONS = 400
+
+
+def run_in_parallel(task, count: int) -> list:
+    """Run task count times from WRITERS threads and return the results"""
+
+    def worker(index):
+        try:
+            return task(index)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=WRITERS) as executor:
+        return list(executor.map(worker, range(count)))
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class TransferConcurrencyTests(TransactionTestCase):
+    """Stress the balance updates with many parallel writers"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+
+    def test_parallel_add_fund_no_lost_updates(self):
+        """Test parallel credits to one account are all applied"""
+        account = sample_account(bank=self.bank, balance=0)
+
+        def add_fund(index):
+            sample_transfer(
+                destination=account,
+                amount=1,
+                transfer_type=Transfer.ADD_FUND,
+            )
+
+        run_in_parallel(add_fund, OPERATIONS)
+
+        account.refresh_from_db()
+        self.assertEqual(account.balance, OPERATIONS)
+
+    def test_parallel_remove_fund_never_overdraws(self):
+        """Test parallel debits stop exactly when the balance runs out"""
+        account = sample_account(bank=self.bank, balance=100)
+
+        def remove_fund(index):
+            try:
+                sample_transfer(
+                    source=account,
+                    amount=1,
+                    transfer_type=Transfer.REMOVE_FUND,
+                )
+            except InsufficientFunds:
+                return False
+            return True
+
+        results = run_in_parallel(remove_fund, OPERATIONS)
+
+        account.refresh_from_db()
+        self.assertEqual(results.count(True), 100)
+        self.assertEqual(account.balance, 0)
+        self.assertEqual(
+            Transfer.objects.filter(source=account).count(), 100
+        )
+
+    def test_parallel_crossed_transfers_no_deadlock(self):
+        """Test transfers in both directions keep the total and never
+        deadlock"""
+        accounts = [
+            sample_account(bank=self.bank, balance=OPERATIONS)
+            for _ in range(4)
+        ]
+
+        def transfer(index):
+            sample_transfer(
+                source=accounts[index % 4],
+                destination=accounts[(index + 1 + (index // 4) % 3) % 4],
+                amount=Decimal("1.50"),
+                transfer_type=Transfer.INTRA_BANK_TRANSFER,
+            )
+
+        run_in_parallel(transfer, OPERATIONS)
+
+        balances = Account.objects.filter(
+            pk__in=[account.pk for account in accounts]
+        ).values_list("balance", flat=True)
+        self.assertEqual(sum(balances), OPERATIONS * 4)
+        self.assertEqual(Transfer.objects.count(), OPERATIONS)
+
+    def test_parallel_sharded_credits_and_debits(self):
+        """Test parallel credits and debits on a sharded account keep the
+        total"""
+        account = sample_account(bank=self.bank, balance=0)
+        Account.objects.reshard(account.pk, 8)
+        account.refresh_from_db()
+
+        def move(index):
+            try:
+                sample_transfer(
+                    source=None if index % 2 else account,
+                    destination=account if index % 2 else None,
+                    amount=1,
+                    transfer_type=Transfer.ADD_FUND
+                    if index % 2
+                    else Transfer.REMOVE_FUND,
+                )
+            except InsufficientFunds:
+                return False
+            return True
+
+        results = run_in_parallel(move, OPERATIONS)
+
+        debits = results[::2].count(True)
+        account = Account.objects.with_shard_balance().get(pk=account.pk)
+        self.assertEqual(account.total_balance, OPERATIONS // 2 - debits)
+        self.assertGreaterEqual(account.balance, 0)
@@ -0,0 +1,257 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.imports import IMPORT_COLUMNS, TransferImporter
+from core.models import (
+    Account,
+    BankTotal,
+    LedgerEntry,
+    OutboxEvent,
+    Transfer,
+    TransferImport,
+)
+from core.utils import sample_account, sample_bank, sample_user
+
+
+class TransferImportTests(TestCase):
+    """Test the import of transfer files"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.other_bank = sample_bank(name="other")
+        self.account_1 = sample_account(bank=self.bank, balance=100)
+        self.account_2 = sample_account(bank=self.bank, name="second")
+        self.foreign = sample_account(bank=self.other_bank, name="foreign")
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.day = timezone.now() - timedelta(days=1)
+
+    def record(self, transfer_type: str, amount, **fields) -> dict:
+        record = {
+            "created": self.day.isoformat(),
+            "transfer_type": transfer_type,
+            "amount": str(amount),
+            "info": "history",
+        }
+        for field, value in fields.items():
+            record[field] = str(getattr(value, "uuid", value))
+        return record
+
+    def write_csv(self, records: list, name: str = "transfers.csv") -> str:
+        path = os.path.join(self.directory, name)
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=IMPORT_COLUMNS)
+            writer.writeheader()
+            writer.writerows(records)
+        return path
+
+    def import_file(self, path: str, *args) -> tuple:
+        """Run the command and return its output and error output"""
+        out, err = StringIO(), StringIO()
+        call_command("import_transfers", path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_transfers(self):
+        """Test imported transfers move the balances and totals, with their
+        ledger entries and events, and reconcile"""
+        path = self.write_csv(
+            [
+                self.record(
+                    Transfer.ADD_FUND,
+                    50,
+                    destination=self.account_2,
+                    src_bank=self.other_bank,
+                ),
+                self.record(
+                    Transfer.INTRA_BANK_TRANSFER,
+                    "30.25",
+                    source=self.account_1,
+                    destination=self.account_2,
+                ),
+                self.record(
+                    Transfer.REMOVE_FUND,
+                    10,
+                    source=self.account_2,
+                ),
+            ]
+        )
+
+        out, err = self.import_file(path)
+
+        self.assertIn("Imported 3 transfers, rejected 0", out)
+        self.account_1.refresh_from_db()
+        self.account_2.refresh_from_db()
+        self.assertEqual(self.account_1.balance, Decimal("69.75"))
+        self.assertEqual(self.account_2.balance, Decimal("70.25"))
+        transfer = Transfer.objects.get(transfer_type=Transfer.ADD_FUND)
+        self.assertEqual(transfer.src_bank, self.other_bank)
+        self.assertEqual(
+            transfer.created.replace(microsecond=0),
+            self.day.replace(microsecond=0),
+        )
+        self.assertEqual(LedgerEntry.objects.count(), 6)
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+        event = OutboxEvent.objects.get(payload__id=transfer.pk)
+        self.assertEqual(event.payload["amount"], "50.00")
+        self.assertEqual(
+            event.payload["destination"], str(self.account_2.uuid)
+        )
+        totals = BankTotal.objects.filter(bank=self.bank).per_bank().get()
+        self.assertEqual(totals["balance"], Decimal("140.00"))
+        self.assertEqual(totals["transferred"], Decimal("30.25"))
+        self.assertEqual(totals["transfer_count"], 3)
+        reconcile = StringIO()
+        call_command("reconcile", "--workers=1", stdout=reconcile)
+        self.assertIn("no drift", reconcile.getvalue())
+
+    def test_invalid_records_rejected(self):
+        """Test records breaking the rules of the endpoints are skipped and
+        reported"""
+        path = self.write_csv(
+            [
+                # the fund arrives after the removal in file order
+                self.record(Transfer.REMOVE_FUND, 20, source=self.account_2),
+                self.record(
+                    Transfer.ADD_FUND, 20, destination=self.account_2
+                ),
+                self.record(
+                    Transfer.INTRA_BANK_TRANSFER,
+                    5,
+                    source=self.account_1,
+                    destination=self.foreign,
+                ),
+                self.record(
+                    Transfer.ADD_FUND,
+                    5,
+                    source=self.account_1,
+                    destination=self.account_2,
+                ),
+                self.record(
+                    Transfer.ADD_FUND,
+                    "0.50",
+                    destination="8c2b5c3e-0c2d-4a4e-9c1e-2f5b1d8e7a61",
+                ),
+                {
+                    **self.record(
+                        Transfer.ADD_FUND, 5, destination=self.account_1
+                    ),
+                    "created": (self.day + timedelta(days=2)).isoformat(),
+                },
+            ]
+        )
+        rejects = os.path.join(self.directory, "rejects.ndjson")
+
+        out, err = self.import_file(path, f"--rejects={rejects}")
+
+        self.assertIn("Imported 1 transfers, rejected 5", out)
+        with open(rejects) as file:
+            lines = [json.loads(line) for line in file]
+        errors = {line["record"]: line["errors"] for line in lines}
+        self.assertEqual(
+            errors[1], {"source": "Account does not have enough fund"}
+        )
+        self.assertIn("destination bank", errors[3]["source"])
+        self.assertIn("Not used", errors[4]["source"])
+        self.assertIn("amount", errors[5])
+        self.assertIn("does not exist", errors[5]["destination"])
+        self.assertIn("future", errors[6]["created"])
+        self.account_2.refresh_from_db()
+        self.assertEqual(self.account_2.balance, Decimal("20.00"))
+
+    def test_resume_after_crash(self):
+        """Test a run failing midway carries on after the last committed
+        chunk and a finished file is not imported again"""
+        records = [
+            self.record(Transfer.ADD_FUND, amount, destination=self.account_2)
+            for amount in range(1, 8)
+        ]
+        path = self.write_csv(records)
+        write = TransferImporter.write
+        calls = []
+
+        def crash(importer, rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise OSError("disk gone")
+            write(importer, rows)
+
+        with patch.object(TransferImporter, "write", crash):
+            with self.assertRaises(CommandError):
+                self.import_file(path, "--chunk-size=3")
+        self.assertEqual(Transfer.objects.count(), 3)
+
+        out, err = self.import_file(path, "--chunk-size=3")
+        again, err = self.import_file(path)
+
+        self.assertIn("Imported 4 transfers, rejected 0, skipped 3", out)
+        self.assertIn("Imported 0 transfers, rejected 0, skipped 7", again)
+        self.account_2.refresh_from_db()
+        self.assertEqual(self.account_2.balance, Decimal(sum(range(1, 8))))
+        self.assertEqual(Transfer.objects.count(), 7)
+
+    def test_import_gzipped_ndjson(self):
+        """Test NDJSON files, gzipped or not, in the shape of the transfer
+        events"""
+        path = os.path.join(self.directory, "transfers.ndjson.gz")
+        with gzip.open(path, "wt") as file:
+            file.write(
+                json.dumps(
+                    self.record(
+                        Transfer.ADD_FUND, 12, destination=self.account_1
+                    )
+                )
+                + "\n\nnot json\n"
+            )
+
+        out, err = self.import_file(path)
+
+        self.assertIn("Imported 1 transfers, rejected 1", out)
+        self.assertIn("Record 2: record: Not a JSON object", err)
+        self.assertEqual(
+            Account.objects.get(pk=self.account_1.pk).balance, Decimal(112)
+        )
+
+    def test_admin_action(self):
+        """Test the admin action imports the uploaded files"""
+        admin = sample_user()
+        admin.is_staff = admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+        records = [
+            self.record(Transfer.ADD_FUND, 5, destination=self.account_1),
+            self.record(Transfer.REMOVE_FUND, 500, source=self.account_2),
+        ]
+        with open(self.write_csv(records), "rb") as file:
+            content = file.read()
+
+        with override_settings(MEDIA_ROOT=self.directory):
+            upload = TransferImport.objects.create(
+                file=SimpleUploadedFile("history.csv", content)
+            )
+            res = self.client.post(
+                reverse("admin:core_transferimport_changelist"),
+                {"action": "run_import", "_selected_action": [upload.pk]},
+                follow=True,
+            )
+
+        self.assertContains(res, "imported 1 transfers, rejected 1")
+        upload.refresh_from_db()
+        self.assertEqual(upload.imported, 1)
+        self.assertEqual(upload.rejected, 1)
+        self.assertEqual(upload.errors[0]["record"], 2)
+        self.assertIsNotNone(upload.finished_at)
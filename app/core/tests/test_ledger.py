@@ -0,0 +1,204 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core.models import Account, BalanceSnapshot, LedgerEntry, Transfer
+from core.utils import (
+    migrate_with_history,
+    sample_bank,
+    sample_account,
+    sample_transfer,
+)
+
+
+def snapshot_balances():
+    """Run the snapshot command without a lag"""
+    call_command("snapshot_balances", "--lag=0", stdout=StringIO())
+
+
+class LedgerTests(TestCase):
+    """Test the ledger entries and balance snapshots"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=50)
+        self.account_2 = sample_account(bank=self.bank)
+
+    def test_transfer_entries_sum_to_zero(self):
+        """Test every transfer type writes balanced entries"""
+        sample_transfer(
+            destination=self.account_2,
+            src_bank=self.bank,
+            amount=5,
+            transfer_type=Transfer.ADD_FUND,
+        )
+        sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=10,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        sample_transfer(
+            source=self.account_2,
+            amount=3,
+            transfer_type=Transfer.REMOVE_FUND,
+        )
+
+        for transfer in Transfer.objects.all():
+            entries = transfer.ledger_entries.all()
+            self.assertEqual(len(entries), 2)
+            self.assertEqual(sum(entry.amount for entry in entries), 0)
+
+        fund = Transfer.objects.get(transfer_type=Transfer.ADD_FUND)
+        external = fund.ledger_entries.get(account__isnull=True)
+        self.assertEqual(external.bank, self.bank)
+        self.assertEqual(external.amount, -5)
+
+    def test_entries_are_append_only(self):
+        """Test a saved ledger entry can not be updated"""
+        sample_transfer(
+            destination=self.account_1,
+            amount=5,
+            transfer_type=Transfer.ADD_FUND,
+        )
+        entry = LedgerEntry.objects.first()
+        entry.amount = 500
+
+        with self.assertRaises(ValueError):
+            entry.save()
+
+    def test_opening_snapshot(self):
+        """Test a new account records its opening balance"""
+        snapshot = self.account_1.balance_snapshots.get()
+
+        self.assertEqual(snapshot.balance, 50)
+        self.assertEqual(snapshot.last_entry_id, 0)
+
+    def test_balance_as_of(self):
+        """Test the ledger balance matches the account balance over time"""
+        sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=10,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        middle = timezone.now()
+        sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=15,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        self.account_1.refresh_from_db()
+
+        self.assertEqual(self.account_1.balance_as_of(), 25)
+        self.assertEqual(
+            self.account_1.balance_as_of(), self.account_1.balance
+        )
+        self.assertEqual(self.account_1.balance_as_of(middle), 40)
+        self.assertEqual(
+            self.account_1.balance_as_of(middle - timedelta(days=1)), 0
+        )
+
+    def test_snapshot_rolls_forward(self):
+        """Test snapshots only add the entries after the previous one"""
+        sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=10,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        snapshot_balances()
+        sample_transfer(
+            source=self.account_2,
+            destination=self.account_1,
+            amount=4,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        snapshot_balances()
+        snapshot_balances()
+
+        latest = self.account_1.balance_snapshots.first()
+        last_entry = self.account_1.ledger_entries.last()
+
+        self.assertEqual(self.account_1.balance_snapshots.count(), 3)
+        self.assertEqual(latest.balance, 44)
+        self.assertEqual(latest.last_entry_id, last_entry.id)
+        self.assertEqual(self.account_2.balance_snapshots.first().balance, 6)
+        self.assertEqual(self.account_1.balance_as_of(), 44)
+
+    def test_batch_transfer_writes_entries(self):
+        """Test batch transfers write the same entries as single ones"""
+        items = [
+            {
+                "source": self.account_1.uuid,
+                "destination": self.account_2.uuid,
+                "amount": amount,
+                "info": "test info",
+            }
+            for amount in (5, 7)
+        ]
+        Transfer.objects.create_intra_bank_batch(items)
+
+        self.assertEqual(LedgerEntry.objects.count(), 4)
+        self.assertEqual(
+            self.account_2.ledger_entries.aggregate(total=Sum("amount")),
+            {"total": 12},
+        )
+        self.assertEqual(
+            BalanceSnapshot.objects.filter(account=self.account_2).count(), 1
+        )
+        self.assertEqual(self.account_2.balance_as_of(), 12)
+
+
+class LedgerMigrationTests(TransactionTestCase):
+    """Test the ledger migration of a database with transfers"""
+
+    def create_history(self, apps) -> None:
+        """Write an account funded with 100 which sent 30 to another one"""
+        Bank = apps.get_model("core", "Bank")
+        Account = apps.get_model("core", "Account")
+        Transfer = apps.get_model("core", "Transfer")
+        bank = Bank.objects.create(name="old")
+        source = Account.objects.create(name="source", bank=bank, balance=70)
+        destination = Account.objects.create(
+            name="destination", bank=bank, balance=35
+        )
+        Transfer.objects.create(
+            destination=source,
+            src_bank=bank,
+            amount=100,
+            info="fund",
+            transfer_type="add_fund",
+        )
+        Transfer.objects.create(
+            source=source,
+            destination=destination,
+            amount=30,
+            info="transfer",
+            transfer_type="intra_bank_transfer",
+        )
+
+    def test_existing_transfers(self):
+        """Test the transfers before the ledger get their entries and the
+        opening balance is the balance before them"""
+        migrate_with_history("0003_idempotencykey", self.create_history)
+
+        destination = Account.objects.get(name="destination")
+        source = Account.objects.get(name="source")
+        self.assertEqual(
+            source.balance_snapshots.get(last_entry_id=0).balance, 0
+        )
+        self.assertEqual(
+            destination.balance_snapshots.get(last_entry_id=0).balance, 5
+        )
+        self.assertEqual(LedgerEntry.objects.count(), 4)
+        self.assertEqual(source.balance_as_of(), 70)
+        self.assertEqual(destination.balance_as_of(), 35)
+        fund = Transfer.objects.get(transfer_type=Transfer.ADD_FUND)
+        external = fund.ledger_entries.get(account__isnull=True)
+        self.assertEqual(external.bank_id, source.bank_id)
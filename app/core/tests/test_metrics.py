@@ -0,0 +1,132 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.serializers import BaseSerializer
+from rest_framework.test import APIClient
+
+from core.metrics import HISTOGRAMS
+from core.models import Transfer
+from core.utils import sample_account, sample_bank, sample_user
+
+
+BANK_LIST_URL = reverse("bank:bank-list")
+METRICS_URL = reverse("metrics")
+
+
+class MetricsMiddlewareTests(TestCase):
+    """Test the request metrics middleware and endpoint"""
+
+    def setUp(self) -> None:
+        cache.clear()
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+        self.client = APIClient()
+        self.user = sample_user()
+        self.client.force_authenticate(user=self.user)
+        self.bank = sample_bank()
+
+    def get_metrics(self) -> str:
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("text/plain"))
+        return res.content.decode()
+
+    def get_sums(self, name: str) -> dict:
+        """Return the sums of a histogram by labels"""
+        return {
+            labels: float(total)
+            for labels, total in (
+                line[len(f"{name}_sum"):].rsplit(" ", 1)
+                for line in self.get_metrics().splitlines()
+                if line.startswith(f"{name}_sum")
+            )
+        }
+
+    def test_request_recorded_by_url_name(self):
+        """Test a request is recorded under its URL name"""
+        self.client.get(BANK_LIST_URL)
+
+        metrics = self.get_metrics()
+
+        labels = 'view="bank:bank-list",method="GET"'
+        self.assertIn(
+            f"http_request_duration_seconds_count{{{labels}}} 1", metrics
+        )
+        self.assertIn(
+            f'db_queries_per_request_bucket{{{labels},le="0"}} 0', metrics
+        )
+        self.assertIn(
+            f'db_queries_per_request_bucket{{{labels},le="1"}} 1', metrics
+        )
+        self.assertIn(f"serializer_duration_seconds_sum{{{labels}}}", metrics)
+
+    def test_serializer_time(self):
+        """Test the serializer time of a request is measured"""
+        self.client.get(BANK_LIST_URL)
+
+        total = dict(
+            line.rsplit(" ", 1)
+            for line in self.get_metrics().splitlines()
+            if line.startswith("serializer_duration_seconds_sum")
+        )
+
+        self.assertGreater(
+            float(
+                total[
+                    'serializer_duration_seconds_sum{view="bank:bank-list",'
+                    'method="GET"}'
+                ]
+            ),
+            0,
+        )
+
+    def test_serializers_not_patched(self):
+        """Test DRF serializers are left as they are, only the serializers
+        of the app are timed"""
+        self.assertFalse(hasattr(BaseSerializer.is_valid, "__wrapped__"))
+        self.assertFalse(hasattr(BaseSerializer.data.fget, "__wrapped__"))
+
+    def test_streamed_queries(self):
+        """Test the queries run while a streamed body is read are counted"""
+        account = sample_account(bank=self.bank, balance=10)
+        for _ in range(3):
+            Transfer.objects.create(
+                destination=account,
+                src_bank=self.bank,
+                amount=1,
+                info="fund",
+                transfer_type=Transfer.ADD_FUND,
+            )
+        url = reverse("bank:account-statement", args=[account.uuid])
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+            b"".join(res.streaming_content)
+
+        count = len(queries)
+
+        sums = self.get_sums("db_queries_per_request")
+        self.assertEqual(
+            sums['{view="bank:account-statement",method="GET"}'], count
+        )
+        self.assertGreater(count, 2)
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0.001)
+    def test_slow_request_logged(self):
+        """Test a slow request is logged with its slowest SQL"""
+        with self.assertLogs("core.metrics", level="WARNING") as logs:
+            self.client.get(BANK_LIST_URL)
+
+        self.assertIn("bank:bank-list", logs.output[0])
+        self.assertIn('FROM "core_bank"', logs.output[0])
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        """Test nothing is recorded when metrics are turned off"""
+        self.client.get(BANK_LIST_URL)
+
+        self.assertNotIn("bank:bank-list", self.get_metrics())
@@ -1,7 +1,7 @@
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 
-from core.models import Account, Transfer
+from core.models import Account, Transfer, InsufficientFunds
 from core.utils import sample_bank, sample_account
 
 
@@ -75,7 +75,9 @@ class ModelTests(TestCase):
         """Test the transfer string representation"""
         transfer = Transfer.objects.create(
             source=sample_account(
-                name="testaccount1", bank=sample_bank("testtransfer1")
+                name="testaccount1",
+                bank=sample_bank("testtransfer1"),
+                balance=100,
             ),
             destination=sample_account(
                 name="testaccount1", bank=sample_bank("testtransfer2")
@@ -86,3 +88,43 @@ class ModelTests(TestCase):
         )
 
         self.assertEqual(str(transfer), f"Transfer of {transfer.amount}")
+
+    def test_transfer_updates_balances(self):
+        """Test creating a transfer moves the amount between accounts"""
+        bank = sample_bank("test_bank")
+        source = sample_account(name="source", bank=bank, balance=20)
+        destination = sample_account(name="destination", bank=bank)
+
+        Transfer.objects.create(
+            source=source,
+            destination=destination,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+            amount=20,
+            info="test info",
+        )
+        source.refresh_from_db()
+        destination.refresh_from_db()
+
+        self.assertEqual(source.balance, 0)
+        self.assertEqual(destination.balance, 20)
+
+    def test_transfer_insufficient_funds_rolls_back(self):
+        """Test a failed debit leaves no transfer and no balance change"""
+        bank = sample_bank("test_bank")
+        source = sample_account(name="source", bank=bank, balance=5)
+        destination = sample_account(name="destination", bank=bank)
+
+        with self.assertRaises(InsufficientFunds):
+            Transfer.objects.create(
+                source=source,
+                destination=destination,
+                transfer_type=Transfer.INTRA_BANK_TRANSFER,
+                amount=10,
+                info="test info",
+            )
+        source.refresh_from_db()
+        destination.refresh_from_db()
+
+        self.assertEqual(source.balance, 5)
+        self.assertEqual(destination.balance, 0)
+        self.assertFalse(Transfer.objects.exists())
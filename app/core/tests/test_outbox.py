@@ -0,0 +1,178 @@
+import json
+import os
+import tempfile
+import threading
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import InsufficientFunds, OutboxEvent, Transfer
+from core.outbox import QUEUES, Sink, WebhookSink, get_queue
+from core.utils import sample_account, sample_bank, sample_transfer
+
+
+class FailingSink(Sink):
+    """Sink whose every publish fails"""
+
+    def publish(self, messages: list) -> None:
+        raise ConnectionError("sink is down")
+
+
+def relay(*args) -> str:
+    """Run the relay until the outbox is drained and return its output"""
+    out = StringIO()
+    call_command("relay_outbox", "--once", *args, stdout=out)
+    return out.getvalue()
+
+
+class OutboxTests(TestCase):
+    """Test the transfer events of the outbox and their relay"""
+
+    def setUp(self) -> None:
+        QUEUES.clear()
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=100)
+        self.account_2 = sample_account(bank=self.bank, name="second")
+
+    def test_transfer_writes_event(self):
+        """Test a transfer writes its event and a failed one does not"""
+        transfer = sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=30,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        with self.assertRaises(InsufficientFunds):
+            sample_transfer(
+                source=self.account_2,
+                dst_bank=self.bank,
+                amount=500,
+                transfer_type=Transfer.REMOVE_FUND,
+            )
+
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.topic, OutboxEvent.TRANSFER_CREATED)
+        self.assertIsNone(event.published_at)
+        self.assertEqual(event.payload["id"], transfer.pk)
+        self.assertEqual(event.payload["source"], str(self.account_1.uuid))
+        self.assertEqual(
+            event.payload["destination"], str(self.account_2.uuid)
+        )
+        self.assertEqual(event.payload["amount"], "30.00")
+        self.assertIsNone(event.payload["src_bank"])
+
+    def test_batch_writes_events(self):
+        """Test a batch writes one event per created transfer"""
+        results = Transfer.objects.create_intra_bank_batch(
+            [
+                {
+                    "source": self.account_1.uuid,
+                    "destination": self.account_2.uuid,
+                    "amount": Decimal(amount),
+                    "info": "batch",
+                }
+                for amount in (10, 1000, 20)
+            ]
+        )
+
+        self.assertEqual(
+            sorted(
+                OutboxEvent.objects.values_list("payload__id", flat=True)
+            ),
+            [result.pk for result in results if isinstance(result, Transfer)],
+        )
+
+    def test_relay_to_file_and_queue(self):
+        """Test the relay publishes the pending events to every sink in
+        order and marks them published"""
+        for amount in (1, 2, 3):
+            sample_transfer(
+                destination=self.account_1,
+                src_bank=self.bank,
+                amount=amount,
+                transfer_type=Transfer.ADD_FUND,
+            )
+        queue = get_queue("outbox")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "outbox.ndjson")
+            with override_settings(OUTBOX_FILE_PATH=path):
+                output = relay("--sinks=file,queue", "--batch-size=2")
+            with open(path) as outbox:
+                lines = [json.loads(line) for line in outbox]
+        queued = [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertIn("Published 3 events", output)
+        self.assertEqual(
+            [line["payload"]["amount"] for line in lines],
+            ["1.00", "2.00", "3.00"],
+        )
+        self.assertEqual(
+            [message["id"] for message in queued],
+            [line["id"] for line in lines],
+        )
+        self.assertFalse(
+            OutboxEvent.objects.filter(published_at__isnull=True).exists()
+        )
+
+    def test_failed_sink_keeps_events_pending(self):
+        """Test a batch a sink failed to publish stays pending"""
+        sample_transfer(
+            destination=self.account_1,
+            src_bank=self.bank,
+            amount=5,
+            transfer_type=Transfer.ADD_FUND,
+        )
+
+        with self.assertRaises(ConnectionError):
+            relay("--sinks=queue,core.tests.test_outbox.FailingSink")
+
+        self.assertTrue(
+            OutboxEvent.objects.filter(published_at__isnull=True).exists()
+        )
+
+    def test_webhook_sink(self):
+        """Test the webhook sink posts a batch as a JSON array"""
+        received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                received.append(json.loads(self.rfile.read(length)))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        try:
+            WebhookSink(
+                f"http://127.0.0.1:{server.server_port}/events"
+            ).publish([{"id": 1, "topic": "transfer.created"}])
+        finally:
+            thread.join()
+            server.server_close()
+
+        self.assertEqual(received, [[{"id": 1, "topic": "transfer.created"}]])
+
+    def test_pending_events_metrics(self):
+        """Test the metrics endpoint reports the pending events"""
+        sample_transfer(
+            destination=self.account_1,
+            src_bank=self.bank,
+            amount=5,
+            transfer_type=Transfer.ADD_FUND,
+        )
+
+        res = APIClient().get(reverse("metrics"))
+
+        self.assertIn("outbox_pending_events 1", res.content.decode())
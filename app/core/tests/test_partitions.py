@@ -0,0 +1,181 @@
+import csv
+import gzip
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from core.models import BalanceSnapshot, Checkpoint, LedgerEntry, Transfer
+from core.partitions import (
+    ARCHIVE_CHECKPOINT,
+    ARCHIVE_SCHEMA,
+    add_months,
+    create_partition,
+    get_partitions,
+    is_partitioned,
+    month_start,
+    partition_name,
+)
+from core.utils import sample_account, sample_bank, sample_user
+
+
+OLD_MONTH = timezone.make_aware(datetime(2001, 1, 1))
+
+
+def archive_transfers(*args) -> str:
+    """Run the archive command and return its output"""
+    out = StringIO()
+    call_command("archive_transfers", *args, stdout=out)
+    return out.getvalue()
+
+
+@skipUnless(connection.vendor == "postgresql", "PostgreSQL backend")
+class TransferPartitionTests(TestCase):
+    """Test the monthly partitions of the transfer table"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.account = sample_account(bank=self.bank, balance=100)
+
+    def add_fund(self, amount: int, created=None) -> Transfer:
+        """Add a fund to the account, moved back to created"""
+        transfer = Transfer.objects.create(
+            destination=self.account,
+            src_bank=self.bank,
+            amount=amount,
+            info="deposit",
+            transfer_type=Transfer.ADD_FUND,
+        )
+        if created is not None:
+            Transfer.objects.filter(pk=transfer.pk).update(created=created)
+            LedgerEntry.objects.filter(transfer=transfer).update(
+                created=created
+            )
+        return transfer
+
+    def partition_of(self, transfer: Transfer) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM core_transfer "
+                "WHERE id = %s",
+                [transfer.pk],
+            )
+            return cursor.fetchone()[0]
+
+    def roll_up(self) -> None:
+        call_command("rollup_transfers", "--lag=0", stdout=StringIO())
+
+    def test_transfer_in_month_partition(self):
+        """Test a new transfer is stored in the partition of its month"""
+        transfer = self.add_fund(10)
+
+        self.assertTrue(is_partitioned())
+        self.assertEqual(
+            self.partition_of(transfer),
+            partition_name(month_start(transfer.created)),
+        )
+
+    def test_create_partition_moves_default_rows(self):
+        """Test a new partition takes the rows of its month out of the
+        default partition"""
+        transfer = self.add_fund(10, created=OLD_MONTH)
+        self.assertEqual(self.partition_of(transfer), "core_transfer_default")
+
+        self.assertTrue(create_partition(OLD_MONTH))
+
+        self.assertEqual(self.partition_of(transfer), "core_transfer_p2001_01")
+        self.assertFalse(create_partition(OLD_MONTH))
+
+    def test_archive_to_file(self):
+        """Test an old month is written to a compressed file and left out
+        of the transfers, statements and reconciliation"""
+        BalanceSnapshot.objects.update(taken_at=OLD_MONTH)
+        old = self.add_fund(50, created=OLD_MONTH)
+        create_partition(OLD_MONTH)
+        self.add_fund(20)
+        self.roll_up()
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = archive_transfers(
+                "--before=2001-02-01", "--to=file", f"--directory={directory}"
+            )
+            path = os.path.join(directory, "core_transfer_p2001_01.csv.gz")
+            with gzip.open(path, "rt") as archive:
+                rows = list(csv.DictReader(archive))
+
+        self.assertIn("Archived 1 transfer partitions", output)
+        self.assertEqual([row["id"] for row in rows], [str(old.pk)])
+        self.assertNotIn("core_transfer_p2001_01", get_partitions())
+        self.assertFalse(Transfer.objects.filter(pk=old.pk).exists())
+        self.assertEqual(
+            Checkpoint.objects.get(name=ARCHIVE_CHECKPOINT).reached_at,
+            timezone.make_aware(datetime(2001, 2, 1)),
+        )
+        # the archived fund is counted from the rollups
+        out = StringIO()
+        call_command("reconcile", "--workers=1", stdout=out)
+        self.assertIn("no drift", out.getvalue())
+
+        client = APIClient()
+        client.force_authenticate(user=sample_user())
+        res = client.get(
+            reverse("bank:account-statement", args=[self.account.uuid])
+        )
+        content = b"".join(res.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(
+            [(row["amount"], row["balance"]) for row in rows],
+            [("20.00", "170.00")],
+        )
+
+    def test_archive_to_table(self):
+        """Test an old month is moved to the archive schema"""
+        old = self.add_fund(50, created=OLD_MONTH)
+        create_partition(OLD_MONTH)
+        self.roll_up()
+
+        archive_transfers("--before=2001-02-01")
+
+        self.assertFalse(Transfer.objects.filter(pk=old.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id FROM {ARCHIVE_SCHEMA}.core_transfer_p2001_01"
+            )
+            self.assertEqual(cursor.fetchall(), [(old.pk,)])
+
+    def test_archive_waits_for_rollups(self):
+        """Test a month not rolled up yet is kept"""
+        old = self.add_fund(50, created=OLD_MONTH)
+        create_partition(OLD_MONTH)
+
+        output = archive_transfers("--before=2001-02-01")
+
+        self.assertIn("Kept core_transfer_p2001_01", output)
+        self.assertTrue(Transfer.objects.filter(pk=old.pk).exists())
+
+    def test_creates_months_ahead(self):
+        """Test the command creates the partitions of the coming months"""
+        archive_transfers("--months-ahead=6")
+
+        month = add_months(month_start(timezone.now()), 6)
+        self.assertIn(partition_name(month), get_partitions())
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite backend")
+class UnpartitionedTests(TestCase):
+    """Test the archive command on a backend without partitions"""
+
+    def test_archive_command_refused(self):
+        """Test the command fails when the table is not partitioned"""
+        with self.assertRaises(CommandError):
+            archive_transfers()
@@ -0,0 +1,147 @@
+import threading
+import time
+from unittest import skipUnless
+
+from django.db import OperationalError, connection
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.backends.postgresql.base import DatabaseWrapper
+from core.db import POOLS, ConnectionPool
+
+
+class FakeConnection:
+    """Stand in for a database connection"""
+
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+    """Test the connection pool shared by the threads of a process"""
+
+    def test_reuses_released_connection(self):
+        """Test a given back connection is lent again instead of a new
+        one being opened"""
+        pool = ConnectionPool("test", max_size=2, timeout=1)
+
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        second = pool.acquire(FakeConnection)
+
+        self.assertIs(second, first)
+        self.assertEqual(pool.stats()["opened"], 1)
+        self.assertEqual(pool.stats()["in_use"], 1)
+
+    def test_waits_for_a_connection(self):
+        """Test a thread waits for a connection when all are borrowed"""
+        pool = ConnectionPool("test", max_size=1, timeout=5)
+        borrowed = pool.acquire(FakeConnection)
+        result = []
+
+        waiter = threading.Thread(
+            target=lambda: result.append(pool.acquire(FakeConnection))
+        )
+        waiter.start()
+        while not pool.stats()["waiting"]:
+            time.sleep(0.01)
+        pool.release(borrowed)
+        waiter.join()
+
+        self.assertEqual(result, [borrowed])
+        self.assertEqual(pool.stats()["opened"], 1)
+        self.assertEqual(pool.stats()["waiting"], 0)
+
+    def test_timeout(self):
+        """Test waiting longer than the timeout raises an error"""
+        pool = ConnectionPool("test", max_size=1, timeout=0.05)
+        pool.acquire(FakeConnection)
+
+        with self.assertRaises(OperationalError):
+            pool.acquire(FakeConnection)
+
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+    def test_broken_connection_replaced(self):
+        """Test an idle connection failing its check is closed and a new
+        one opened"""
+        pool = ConnectionPool(
+            "test", max_size=1, timeout=1, check=lambda conn: False
+        )
+        broken = pool.acquire(FakeConnection)
+        pool.release(broken)
+
+        replacement = pool.acquire(FakeConnection)
+
+        self.assertTrue(broken.closed)
+        self.assertIsNot(replacement, broken)
+        self.assertEqual(pool.stats()["in_use"], 1)
+
+    def test_failed_reset_frees_its_place(self):
+        """Test a connection that cannot be reset is closed on release"""
+        pool = ConnectionPool(
+            "test", max_size=1, timeout=0.05, reset=lambda conn: False
+        )
+        broken = pool.acquire(FakeConnection)
+        pool.release(broken)
+
+        replacement = pool.acquire(FakeConnection)
+
+        self.assertTrue(broken.closed)
+        self.assertIsNot(replacement, broken)
+
+
+@skipUnless(connection.vendor == "postgresql", "PostgreSQL backend")
+class PostgresBackendTests(TestCase):
+    """Test the health checks and pool of the PostgreSQL backend"""
+
+    def tearDown(self) -> None:
+        for key in [key for key in POOLS if key[0] == "pooled"]:
+            POOLS.pop(key).close_idle()
+
+    def wrapper(self, alias: str, **settings) -> DatabaseWrapper:
+        return DatabaseWrapper({**connection.settings_dict, **settings}, alias)
+
+    def backend_pid(self, wrapper: DatabaseWrapper) -> int:
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT pg_backend_pid()")
+            return cursor.fetchone()[0]
+
+    def test_pooled_connection_reused_by_other_thread(self):
+        """Test a closed connection goes back to the pool and the next
+        connect of another wrapper borrows it"""
+        settings = {"CONN_MAX_AGE": 0, "POOL": {"MAX_SIZE": 1, "TIMEOUT": 1}}
+        first = self.wrapper("pooled", **settings)
+        pid = self.backend_pid(first)
+        first.close()
+
+        second = self.wrapper("pooled", **settings)
+
+        self.assertEqual(self.backend_pid(second), pid)
+        second.close()
+        res = APIClient().get(reverse("metrics"))
+        self.assertIn(
+            'db_pool_connections{alias="pooled",state="idle"} 1',
+            res.content.decode(),
+        )
+
+    def test_health_check_replaces_dropped_connection(self):
+        """Test a persistent connection closed by the server is replaced
+        before the next request queries it"""
+        kept = self.wrapper(
+            "kept", CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True, POOL={}
+        )
+        pid = self.backend_pid(kept)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", [pid])
+
+        # the end of the request keeps the connection
+        kept.close_if_unusable_or_obsolete()
+
+        self.assertNotEqual(self.backend_pid(kept), pid)
+        kept.close()
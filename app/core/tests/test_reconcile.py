@@ -0,0 +1,207 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from core.models import Account, BankTotal, Transfer
+from core.utils import (
+    migrate_with_history,
+    sample_bank,
+    sample_account,
+    sample_transfer,
+)
+
+
+def reconcile(*args) -> str:
+    """Run the reconcile command in this process and return its output"""
+    out = StringIO()
+    call_command("reconcile", "--workers=1", *args, stdout=out)
+    return out.getvalue()
+
+
+class BankTotalTests(TestCase):
+    """Test the running totals of the banks"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=50)
+        self.account_2 = sample_account(bank=self.bank, balance=25)
+
+    def totals(self) -> dict:
+        return BankTotal.objects.filter(bank=self.bank).per_bank().get()
+
+    def test_totals_follow_transfers(self):
+        """Test opening balances and every transfer type are recorded"""
+        sample_transfer(
+            destination=self.account_1,
+            src_bank=self.bank,
+            amount=10,
+            transfer_type=Transfer.ADD_FUND,
+        )
+        sample_transfer(
+            source=self.account_2,
+            dst_bank=self.bank,
+            amount=5,
+            transfer_type=Transfer.REMOVE_FUND,
+        )
+        sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=20,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        Transfer.objects.create_intra_bank_batch(
+            [
+                {
+                    "source": self.account_2.uuid,
+                    "destination": self.account_1.uuid,
+                    "amount": Decimal(3),
+                    "info": "batch",
+                }
+            ]
+        )
+
+        totals = self.totals()
+        self.assertEqual(totals["balance"], Decimal("80.00"))
+        self.assertEqual(totals["funds_added"], Decimal("10.00"))
+        self.assertEqual(totals["funds_removed"], Decimal("5.00"))
+        self.assertEqual(totals["transferred"], Decimal("23.00"))
+        self.assertEqual(totals["transfer_count"], 4)
+
+    @override_settings(BANK_TOTAL_SLOTS=4)
+    def test_totals_spread_over_slots(self):
+        """Test the totals of a bank are kept in one row per slot"""
+        bank = sample_bank("slots")
+        account = sample_account(bank=bank, balance=5)
+        for _ in range(20):
+            sample_transfer(
+                destination=account,
+                src_bank=bank,
+                amount=1,
+                transfer_type=Transfer.ADD_FUND,
+            )
+
+        self.assertEqual(
+            list(
+                BankTotal.objects.filter(bank=bank).values_list(
+                    "slot", flat=True
+                )
+            ),
+            [0, 1, 2, 3],
+        )
+        self.assertEqual(
+            BankTotal.objects.filter(bank=bank).per_bank().get()["balance"],
+            Decimal("25.00"),
+        )
+
+    def test_failed_transfer_not_recorded(self):
+        """Test a rolled back transfer leaves the totals as they were"""
+        with self.assertRaises(Exception):
+            sample_transfer(
+                source=self.account_2,
+                dst_bank=self.bank,
+                amount=100,
+                transfer_type=Transfer.REMOVE_FUND,
+            )
+
+        self.assertEqual(self.totals()["transfer_count"], 0)
+
+
+class ReconcileTests(TestCase):
+    """Test the reconcile command"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=50)
+        self.account_2 = sample_account(bank=self.bank)
+        sample_account(bank=sample_bank("other"), balance=7)
+        sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=20,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+
+    def test_no_drift(self):
+        """Test consistent balances and totals pass"""
+        out = reconcile("--chunk-size=1")
+
+        self.assertIn("Checked 3 accounts in 2 banks, no drift", out)
+
+    def test_account_drift_reported(self):
+        """Test a balance that does not match its transfers is reported"""
+        Account.objects.filter(pk=self.account_2.pk).update(balance=21)
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command("reconcile", "--workers=1", stdout=out)
+
+        self.assertIn(
+            f"Account {self.account_2.uuid}: balance 21.00, "
+            "transfers give 20.00, drift 1.00",
+            out.getvalue(),
+        )
+
+    def test_sharded_account(self):
+        """Test the balance shards count towards the balance"""
+        Account.objects.reshard(self.account_2.pk, 2)
+        sample_transfer(
+            destination=self.account_2,
+            src_bank=self.bank,
+            amount=5,
+            transfer_type=Transfer.ADD_FUND,
+        )
+
+        self.assertIn("no drift", reconcile())
+
+    def test_fix_bank_totals(self):
+        """Test drifted bank totals are reported and reset"""
+        BankTotal.objects.filter(bank=self.bank).update(balance=0)
+
+        with self.assertRaises(CommandError):
+            reconcile()
+        reconcile("--fix-totals")
+
+        self.assertEqual(
+            BankTotal.objects.filter(bank=self.bank).aggregate(
+                total=Sum("balance")
+            )["total"],
+            Decimal("50.00"),
+        )
+        self.assertIn("no drift", reconcile())
+
+
+class UpgradedReconcileTests(TransactionTestCase):
+    """Test the reconcile command on a database with transfers from before
+    the ledger"""
+
+    def create_history(self, apps) -> None:
+        """Write an account funded with 100"""
+        Bank = apps.get_model("core", "Bank")
+        Account = apps.get_model("core", "Account")
+        Transfer = apps.get_model("core", "Transfer")
+        bank = Bank.objects.create(name="old")
+        account = Account.objects.create(name="old", bank=bank, balance=100)
+        Transfer.objects.create(
+            destination=account,
+            src_bank=bank,
+            amount=100,
+            info="fund",
+            transfer_type="add_fund",
+        )
+
+    def test_no_drift(self):
+        """Test the transfers before the ledger are not counted twice"""
+        migrate_with_history("0003_idempotencykey", self.create_history)
+        account = Account.objects.get()
+        sample_transfer(
+            source=account,
+            dst_bank=account.bank,
+            amount=30,
+            transfer_type=Transfer.REMOVE_FUND,
+        )
+
+        self.assertIn("Checked 1 accounts in 1 banks, no drift", reconcile())
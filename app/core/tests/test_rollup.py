@@ -0,0 +1,118 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Checkpoint, DailyTransferRollup, LedgerEntry, Transfer
+from core.utils import sample_bank, sample_account, sample_transfer
+
+
+def rollup_transfers(*args):
+    """Run the rollup command without a lag"""
+    call_command("rollup_transfers", "--lag=0", *args, stdout=StringIO())
+
+
+class RollupTests(TestCase):
+    """Test the daily transfer rollups"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=50)
+        self.account_2 = sample_account(bank=self.bank)
+
+    def transfer(
+        self, amount, days: int = 0, entries: bool = True
+    ) -> Transfer:
+        """Create a transfer from account 1 to 2, days back in time, with
+        its ledger entries when entries"""
+        transfer = sample_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            amount=amount,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        created = timezone.now() - timedelta(days=days)
+        Transfer.objects.filter(pk=transfer.pk).update(created=created)
+        if entries:
+            LedgerEntry.objects.filter(transfer=transfer).update(
+                created=created
+            )
+        return transfer
+
+    def test_rollup_per_account_and_day(self):
+        """Test entries are summed per account, day and type"""
+        self.transfer(10, days=2)
+        self.transfer(5, days=2)
+        self.transfer(1, days=1)
+
+        rollup_transfers()
+
+        rollup = DailyTransferRollup.objects.get(
+            account=self.account_1,
+            day=timezone.localdate() - timedelta(days=2),
+        )
+        self.assertEqual(rollup.count, 2)
+        self.assertEqual(rollup.debit, Decimal("15.00"))
+        self.assertEqual(rollup.credit, 0)
+        self.assertEqual(
+            DailyTransferRollup.objects.filter(
+                account=self.account_2
+            ).count(),
+            2,
+        )
+
+    def test_incremental_runs(self):
+        """Test a run only adds the entries after the checkpoint"""
+        self.transfer(10)
+        rollup_transfers("--batch-size=1")
+        checkpoint = Checkpoint.objects.get(
+            name=DailyTransferRollup.CHECKPOINT
+        )
+        self.transfer(5)
+        rollup_transfers()
+        rollup_transfers()
+
+        rollup = DailyTransferRollup.objects.get(account=self.account_2)
+        self.assertEqual(rollup.count, 2)
+        self.assertEqual(rollup.credit, Decimal("15.00"))
+        checkpoint_2 = Checkpoint.objects.get(pk=checkpoint.pk)
+        self.assertGreater(checkpoint_2.position, checkpoint.position)
+        self.assertGreater(checkpoint_2.reached_at, checkpoint.reached_at)
+
+    def test_lag_skips_new_entries(self):
+        """Test entries newer than the lag are left for a later run"""
+        self.transfer(10)
+
+        call_command("rollup_transfers", "--lag=60", stdout=StringIO())
+
+        self.assertFalse(DailyTransferRollup.objects.exists())
+
+    def test_rollup_on_transfer_day(self):
+        """Test entries written later, as settled credits, count on the day
+        of their transfer"""
+        self.transfer(10, days=2, entries=False)
+
+        rollup_transfers()
+
+        rollup = DailyTransferRollup.objects.get(account=self.account_2)
+        self.assertEqual(rollup.day, timezone.localdate() - timedelta(days=2))
+
+    def test_lag_rolls_up_to_watermark(self):
+        """Test a run rolls up to the last entry id seen a lag before, not
+        to the entries created before the lag"""
+        self.transfer(10)
+        call_command("rollup_transfers", "--lag=60", stdout=StringIO())
+        # written after the watermark, with an older time
+        self.transfer(5, days=2)
+        Checkpoint.objects.filter(name=DailyTransferRollup.WATERMARK).update(
+            reached_at=timezone.now() - timedelta(seconds=61)
+        )
+
+        call_command("rollup_transfers", "--lag=60", stdout=StringIO())
+
+        rollup = DailyTransferRollup.objects.get(account=self.account_2)
+        self.assertEqual(rollup.day, timezone.localdate())
+        self.assertEqual(rollup.credit, Decimal("10.00"))
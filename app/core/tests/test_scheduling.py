@@ -0,0 +1,219 @@
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+
+from core.models import (
+    Account,
+    AccountQuerySet,
+    InterBankTransfer,
+    ScheduledTransfer,
+    Transfer,
+)
+from core.scheduling import run_due
+from core.utils import sample_account, sample_bank
+
+
+def sample_scheduled_transfer(**params) -> ScheduledTransfer:
+    """Create a scheduled transfer due now"""
+    now = timezone.now()
+    defaults = {
+        "name": "rent",
+        "amount": Decimal(10),
+        "info": "standing order",
+        "frequency": ScheduledTransfer.MONTHLY,
+        "starts_at": now,
+        "next_run_at": now,
+    }
+    defaults.update(params)
+    return ScheduledTransfer.objects.create(**defaults)
+
+
+class ScheduledTransferTests(TestCase):
+    """Test the scheduled transfers and their runs"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.account_1 = sample_account(bank=self.bank, balance=100)
+        self.account_2 = sample_account(bank=self.bank)
+        self.foreign = sample_account(bank=sample_bank(name="other"))
+
+    def balance(self, account: Account) -> Decimal:
+        return Account.objects.get(pk=account.pk).balance
+
+    def test_monthly_run_times(self):
+        """Test monthly occurrences keep the day of the start, or the last
+        day of shorter months"""
+        scheduled = ScheduledTransfer(
+            frequency=ScheduledTransfer.MONTHLY,
+            starts_at=timezone.make_aware(datetime(2026, 1, 31, 9)),
+        )
+
+        run_times = [scheduled.get_run_at(index) for index in range(3)]
+
+        self.assertEqual(
+            [run_at.date().isoformat() for run_at in run_times],
+            ["2026-01-31", "2026-02-28", "2026-03-31"],
+        )
+        self.assertEqual(run_times[1].hour, 9)
+
+    def test_run_due(self):
+        """Test due transfers are made within and across banks and move to
+        their next occurrence"""
+        start = timezone.now() - timedelta(minutes=1)
+        rent = sample_scheduled_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            starts_at=start,
+            next_run_at=start,
+        )
+        abroad = sample_scheduled_transfer(
+            source=self.account_1,
+            destination=self.foreign,
+            frequency=ScheduledTransfer.ONCE,
+        )
+        later = sample_scheduled_transfer(
+            source=self.account_1,
+            destination=self.account_2,
+            next_run_at=timezone.now() + timedelta(days=1),
+        )
+
+        batch = run_due(10)
+
+        self.assertEqual(
+            {scheduled.pk for scheduled in batch}, {rent.pk, abroad.pk}
+        )
+        self.assertEqual(self.balance(self.account_1), Decimal(80))
+        self.assertEqual(self.balance(self.account_2), Decimal(10))
+        self.assertEqual(
+            Transfer.objects.filter(
+                transfer_type=Transfer.INTRA_BANK_TRANSFER
+            ).count(),
+            1,
+        )
+        self.assertEqual(
+            InterBankTransfer.objects.get().destination, self.foreign
+        )
+        rent.refresh_from_db()
+        abroad.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual(rent.occurrences, 1)
+        self.assertEqual(rent.next_run_at, rent.get_run_at(1))
+        self.assertIsNone(abroad.next_run_at)
+        self.assertEqual(later.occurrences, 0)
+        self.assertEqual(run_due(10), [])
+
+    def test_accounts_locked_first(self):
+        """Test the accounts of the whole batch are locked in one call
+        before any transfer, so a transfer to another bank does not take
+        a lock out of primary key order"""
+        sample_scheduled_transfer(
+            source=self.account_1, destination=self.account_2
+        )
+        sample_scheduled_transfer(
+            source=self.account_2, destination=self.foreign, amount=1
+        )
+        lock = AccountQuerySet.lock
+        locked = []
+
+        def record_lock(queryset, *pks):
+            locked.append(set(pks))
+            return lock(queryset, *pks)
+
+        with patch.object(AccountQuerySet, "lock", record_lock):
+            run_due(10)
+
+        self.assertEqual(
+            locked[0], {self.account_1.pk, self.account_2.pk, self.foreign.pk}
+        )
+        self.assertTrue(all(pks <= locked[0] for pks in locked))
+
+    def test_failed_run_moves_on(self):
+        """Test an occurrence the source can not cover is recorded and the
+        schedule goes on until ends_at"""
+        start = timezone.now() - timedelta(days=1, minutes=1)
+        scheduled = sample_scheduled_transfer(
+            source=self.account_2,
+            destination=self.account_1,
+            frequency=ScheduledTransfer.DAILY,
+            starts_at=start,
+            next_run_at=start,
+            ends_at=start + timedelta(days=1),
+        )
+
+        run_due(10)
+        scheduled.refresh_from_db()
+        self.assertEqual(scheduled.failures, 1)
+        self.assertIn("enough fund", scheduled.last_error)
+        # the missed occurrence of today is due as well
+        self.assertLess(scheduled.next_run_at, timezone.now())
+
+        run_due(10)
+        scheduled.refresh_from_db()
+        self.assertEqual(scheduled.occurrences, 2)
+        self.assertIsNone(scheduled.next_run_at)
+        self.assertFalse(Transfer.objects.exists())
+
+    def test_run_scheduled_transfers_command(self):
+        """Test the command runs the due transfers in batches"""
+        for index in range(5):
+            sample_scheduled_transfer(
+                source=self.account_1, destination=self.account_2
+            )
+        out = StringIO()
+
+        call_command(
+            "run_scheduled_transfers", "--once", "--batch-size=2", stdout=out
+        )
+
+        self.assertIn("Made 5 scheduled transfers, 0 failed", out.getvalue())
+        self.assertEqual(self.balance(self.account_2), Decimal(50))
+
+
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class ScheduledTransferLockingTests(TransactionTestCase):
+    """Test workers running side by side claim different transfers"""
+
+    def test_locked_transfers_skipped(self):
+        """Test a worker skips the transfers another worker holds"""
+        bank = sample_bank()
+        source = sample_account(bank=bank, balance=100)
+        destination = sample_account(bank=bank)
+        first, second = [
+            sample_scheduled_transfer(source=source, destination=destination)
+            for index in range(2)
+        ]
+        claimed = threading.Event()
+        release = threading.Event()
+
+        def hold_first():
+            try:
+                with transaction.atomic():
+                    list(
+                        ScheduledTransfer.objects.select_for_update().filter(
+                            pk=first.pk
+                        )
+                    )
+                    claimed.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold_first)
+        holder.start()
+        claimed.wait(10)
+        try:
+            batch = run_due(10)
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual([scheduled.pk for scheduled in batch], [second.pk])
+        first.refresh_from_db()
+        self.assertEqual(first.occurrences, 0)
@@ -0,0 +1,144 @@
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase
+
+from core.models import (
+    Account,
+    BankTotal,
+    InterBankTransfer,
+    LedgerEntry,
+    OutboxEvent,
+    SettlementCycle,
+    Transfer,
+)
+from core.settlement import settle_cycle
+from core.utils import sample_account, sample_bank
+
+
+class SettlementTests(TestCase):
+    """Test the netting cycles of the inter-bank transfers"""
+
+    def setUp(self) -> None:
+        self.bank_a = sample_bank(name="a")
+        self.bank_b = sample_bank(name="b")
+        self.bank_c = sample_bank(name="c")
+        self.account_a = sample_account(bank=self.bank_a, balance=100)
+        self.account_b = sample_account(bank=self.bank_b, balance=100)
+        self.account_c = sample_account(bank=self.bank_c, balance=100)
+
+    def queue(self, source: Account, destination: Account, amount):
+        return Transfer.objects.create_inter_bank(
+            source, destination, Decimal(amount), "test info"
+        )
+
+    def balance(self, account: Account) -> Decimal:
+        return Account.objects.get(pk=account.pk).balance
+
+    def test_settle_cycle(self):
+        """Test a cycle nets the transfers per pair of banks, credits the
+        destinations and books the transfers"""
+        self.queue(self.account_a, self.account_b, 30)
+        self.queue(self.account_b, self.account_a, 10)
+        self.queue(self.account_a, self.account_c, 5)
+        transfer = self.queue(self.account_c, self.account_b, 5)
+        self.assertEqual(self.balance(self.account_b), Decimal(90))
+
+        cycle = settle_cycle(100)
+
+        self.assertEqual(cycle.transfer_count, 4)
+        self.assertEqual(cycle.gross_amount, Decimal(50))
+        # a pays 25 net, b receives 25 and c is even
+        self.assertEqual(cycle.net_amount, Decimal(25))
+        positions = {
+            (position.payer_id, position.payee_id): (
+                position.amount,
+                position.transfer_count,
+            )
+            for position in cycle.positions.all()
+        }
+        self.assertEqual(
+            positions,
+            {
+                (self.bank_a.pk, self.bank_b.pk): (Decimal(20), 2),
+                (self.bank_a.pk, self.bank_c.pk): (Decimal(5), 1),
+                (self.bank_c.pk, self.bank_b.pk): (Decimal(5), 1),
+            },
+        )
+        self.assertEqual(self.balance(self.account_a), Decimal(75))
+        self.assertEqual(self.balance(self.account_b), Decimal(125))
+        self.assertEqual(self.balance(self.account_c), Decimal(100))
+        transfer.refresh_from_db()
+        self.assertEqual(transfer.destination, self.account_b)
+        self.assertFalse(
+            InterBankTransfer.objects.filter(cycle__isnull=True).exists()
+        )
+        for account in (self.account_a, self.account_b, self.account_c):
+            self.assertEqual(
+                LedgerEntry.objects.filter(account=account).aggregate(
+                    total=Sum("amount")
+                )["total"],
+                self.balance(account) - 100,
+            )
+        self.assertFalse(
+            LedgerEntry.objects.filter(bank__isnull=False)
+            .values("bank_id")
+            .annotate(total=Sum("amount"))
+            .exclude(total=0)
+            .exists()
+        )
+        totals = BankTotal.objects.filter(bank=self.bank_b).per_bank().get()
+        self.assertEqual(totals["balance"], Decimal(125))
+        event = OutboxEvent.objects.get(topic=OutboxEvent.SETTLEMENT_COMPLETED)
+        self.assertEqual(event.payload["net_amount"], "25.00")
+        self.assertEqual(event.payload["banks"][str(self.bank_c.uuid)], "0.00")
+        out = StringIO()
+        call_command("reconcile", "--workers=1", stdout=out)
+        self.assertIn("no drift", out.getvalue())
+
+    def test_max_transfers(self):
+        """Test a cycle settles the oldest transfers up to its limit"""
+        first = self.queue(self.account_a, self.account_b, 1)
+        self.queue(self.account_a, self.account_b, 2)
+        last = self.queue(self.account_a, self.account_b, 3)
+
+        cycle = settle_cycle(2)
+
+        self.assertEqual(cycle.transfer_count, 2)
+        self.assertEqual(
+            InterBankTransfer.objects.get(transfer=first).cycle, cycle
+        )
+        self.assertIsNone(InterBankTransfer.objects.get(transfer=last).cycle)
+        self.assertEqual(settle_cycle(2).transfer_count, 1)
+        self.assertIsNone(settle_cycle(2))
+
+    def test_failed_cycle_rolled_back(self):
+        """Test a cycle failing midway leaves the transfers queued"""
+        self.queue(self.account_a, self.account_b, 10)
+
+        with patch(
+            "core.settlement.book_transfers", side_effect=OSError("down")
+        ):
+            with self.assertRaises(OSError):
+                settle_cycle(100)
+
+        self.assertEqual(self.balance(self.account_b), Decimal(100))
+        self.assertFalse(SettlementCycle.objects.exists())
+        self.assertEqual(settle_cycle(100).transfer_count, 1)
+        self.assertEqual(self.balance(self.account_b), Decimal(110))
+
+    def test_settle_transfers_command(self):
+        """Test the command settles the queue and reports the cycles"""
+        for amount in (1, 2, 3):
+            self.queue(self.account_a, self.account_c, amount)
+        out = StringIO()
+
+        call_command(
+            "settle_transfers", "--once", "--max-transfers=2", stdout=out
+        )
+
+        self.assertIn("Settled 3 transfers in 2 cycles", out.getvalue())
+        self.assertEqual(self.balance(self.account_c), Decimal(106))
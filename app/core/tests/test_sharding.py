@@ -0,0 +1,195 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import serializers
+
+from core.models import Account, AccountBalanceShard, Transfer
+from core.utils import sample_bank, sample_account, sample_transfer
+
+from bank.serializers import AccountSerializer, FundSerializer
+
+
+class AccountShardingTests(TestCase):
+    """Test the balance shards of high contention accounts"""
+
+    def setUp(self) -> None:
+        self.bank = sample_bank()
+        self.account = sample_account(bank=self.bank, balance=10)
+        Account.objects.reshard(self.account.pk, 4)
+        self.account.refresh_from_db()
+
+    def shard_balances(self) -> list:
+        return list(
+            self.account.balance_shards.values_list("balance", flat=True)
+        )
+
+    def test_reshard_creates_shards(self):
+        """Test resharding creates and removes shard rows"""
+        self.assertEqual(self.account.shard_count, 4)
+        self.assertEqual(len(self.shard_balances()), 4)
+
+        sample_transfer(
+            destination=self.account, amount=5, transfer_type=Transfer.ADD_FUND
+        )
+        Account.objects.reshard(self.account.pk, 0)
+        self.account.refresh_from_db()
+
+        self.assertEqual(self.account.shard_count, 0)
+        self.assertEqual(self.shard_balances(), [])
+        self.assertEqual(self.account.balance, 15)
+
+    def test_credits_go_to_shards(self):
+        """Test credits to a sharded account leave its balance row alone"""
+        for _ in range(8):
+            sample_transfer(
+                destination=self.account,
+                amount=5,
+                transfer_type=Transfer.ADD_FUND,
+            )
+        self.account.refresh_from_db()
+
+        self.assertEqual(self.account.balance, 10)
+        self.assertEqual(sum(self.shard_balances()), 40)
+        self.assertEqual(self.account.total_balance, 50)
+
+    def test_debit_consolidates_shards(self):
+        """Test a debit larger than the balance row uses the shards"""
+        sample_transfer(
+            destination=self.account,
+            amount=30,
+            transfer_type=Transfer.ADD_FUND,
+        )
+        self.assertTrue(self.account.is_balance_sufficient(35))
+
+        sample_transfer(
+            source=self.account, amount=35, transfer_type=Transfer.REMOVE_FUND
+        )
+        self.account.refresh_from_db()
+
+        self.assertEqual(self.account.balance, 5)
+        self.assertEqual(sum(self.shard_balances()), 0)
+        self.assertFalse(self.account.is_balance_sufficient(6))
+
+    def test_intra_bank_transfer_to_sharded_account(self):
+        """Test transfers into and out of a sharded account"""
+        other = sample_account(bank=self.bank, balance=20)
+
+        sample_transfer(
+            source=other,
+            destination=self.account,
+            amount=20,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        sample_transfer(
+            source=self.account,
+            destination=other,
+            amount=25,
+            transfer_type=Transfer.INTRA_BANK_TRANSFER,
+        )
+        self.account.refresh_from_db()
+        other.refresh_from_db()
+
+        self.assertEqual(self.account.total_balance, 5)
+        self.assertEqual(other.balance, 25)
+        self.assertEqual(self.account.balance_as_of(), 5)
+
+    def test_batch_transfer_from_sharded_account(self):
+        """Test batch transfers can spend the shard balances"""
+        other = sample_account(bank=self.bank)
+        sample_transfer(
+            destination=self.account,
+            amount=30,
+            transfer_type=Transfer.ADD_FUND,
+        )
+
+        results = Transfer.objects.create_intra_bank_batch(
+            [
+                {
+                    "source": self.account.uuid,
+                    "destination": other.uuid,
+                    "amount": 40,
+                    "info": "test info",
+                }
+            ]
+        )
+        self.account.refresh_from_db()
+
+        self.assertIsInstance(results[0], Transfer)
+        self.assertEqual(self.account.total_balance, 0)
+
+    @skipUnlessDBFeature("has_select_for_no_key_update")
+    def test_batch_transfer_locks_without_key(self):
+        """Test batch transfers lock the accounts FOR NO KEY UPDATE, which
+        does not block the foreign key checks of concurrent shard credits"""
+        other = sample_account(bank=self.bank)
+
+        with CaptureQueriesContext(connection) as queries:
+            Transfer.objects.create_intra_bank_batch(
+                [
+                    {
+                        "source": self.account.uuid,
+                        "destination": other.uuid,
+                        "amount": 5,
+                        "info": "test info",
+                    }
+                ]
+            )
+
+        locks = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('SELECT "core_account"')
+            and "FOR" in query["sql"]
+        ]
+        self.assertTrue(locks)
+        for sql in locks:
+            self.assertIn("FOR NO KEY UPDATE", sql)
+
+    def test_serializer_reports_summed_balance(self):
+        """Test the account serializer sums the balance shards"""
+        sample_transfer(
+            destination=self.account,
+            amount=30,
+            transfer_type=Transfer.ADD_FUND,
+        )
+        account = Account.objects.with_shard_balance().get(pk=self.account.pk)
+
+        with self.assertNumQueries(1):
+            data = AccountSerializer(account).data
+
+        self.assertEqual(data["balance"], "40.00")
+        self.assertNotIn("shard_count", data)
+
+    def test_fund_serializer_checks_shards(self):
+        """Test remove fund validation counts the shard balances"""
+        sample_transfer(
+            destination=self.account,
+            amount=30,
+            transfer_type=Transfer.ADD_FUND,
+        )
+        data = {
+            "source": str(self.account.uuid),
+            "amount": 40,
+            "info": "test info",
+            "transfer_type": Transfer.REMOVE_FUND,
+        }
+
+        self.assertTrue(FundSerializer(data=data).is_valid())
+        data["amount"] = 41
+        with self.assertRaises(serializers.ValidationError):
+            FundSerializer(data=data).is_valid(raise_exception=True)
+
+    def test_shard_account_command(self):
+        """Test the command sets the shard count"""
+        call_command(
+            "shard_account", str(self.account.uuid), "2", stdout=StringIO()
+        )
+
+        self.assertEqual(
+            AccountBalanceShard.objects.filter(account=self.account).count(),
+            2,
+        )
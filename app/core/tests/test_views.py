@@ -0,0 +1,40 @@
+from django.db import OperationalError, connection
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+
+READY_URL = reverse("ready")
+
+
+def refuse_queries(execute, sql, params, many, context):
+    raise OperationalError("could not connect to server")
+
+
+class ReadinessViewTests(TestCase):
+    """Test the readiness endpoint"""
+
+    databases = "__all__"
+
+    def setUp(self) -> None:
+        self.client = APIClient()
+
+    def test_ready(self):
+        """Test the endpoint answers 200 without authentication when the
+        database is reachable"""
+        res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()["status"], "ready")
+        self.assertEqual(res.json()["databases"]["default"], "ok")
+
+    def test_database_unavailable(self):
+        """Test the endpoint answers 503 when the database fails"""
+        with connection.execute_wrapper(refuse_queries):
+            res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.json()["status"], "unavailable")
+        self.assertIn("could not connect", res.json()["databases"]["default"])
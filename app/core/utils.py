@@ -1,6 +1,8 @@
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
 
 from drf_yasg.inspectors import SwaggerAutoSchema
 
@@ -51,3 +53,14 @@ def sample_user(
         email,
         password,
     )
+
+
+def migrate_with_history(migration: str, create_history) -> None:
+    """Migrate core back to migration, let create_history write rows with
+    the models of that state, then migrate every app forward"""
+    target = [("core", migration)]
+    executor = MigrationExecutor(connection)
+    executor.migrate(target)
+    create_history(executor.loader.project_state(target).apps)
+    executor = MigrationExecutor(connection)
+    executor.migrate(executor.loader.graph.leaf_nodes())
@@ -0,0 +1,26 @@
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+
+
+def readiness_view(request):
+    """Return 200 when every database answers a query, 503 otherwise
+
+    Load balancers and orchestrators poll it to send traffic to a worker
+    only once it can serve requests.
+    """
+    databases = {}
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+            databases[alias] = "ok"
+        except DatabaseError as exc:
+            databases[alias] = str(exc) or exc.__class__.__name__
+    ready = all(state == "ok" for state in databases.values())
+    return JsonResponse(
+        {
+            "status": "ready" if ready else "unavailable",
+            "databases": databases,
+        },
+        status=200 if ready else 503,
+    )
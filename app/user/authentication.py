@@ -0,0 +1,215 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header,
+)
+
+
+class LocalTTLCache:
+    """
+    Thread safe in process LRU cache whose entries expire after a TTL
+    version counts the deletes, so a value read before a delete can be kept
+    from being stored after it.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.version = 0
+
+    def get(self, key: str):
+        """Return the live value of key, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(
+        self, key: str, value, ttl: float, max_size: int, version: int = None
+    ) -> None:
+        """Store value for ttl seconds, evicting the least recently used
+
+        Nothing is stored when version is given and an entry was deleted
+        since it was read.
+        """
+        with self.lock:
+            if version is not None and version != self.version:
+                return
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+            self.version += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.version += 1
+
+
+local_token_cache = LocalTTLCache()
+
+
+def get_shared_cache():
+    """Return the shared token cache, or None when it is turned off"""
+    alias = settings.TOKEN_AUTH_SHARED_CACHE
+    return caches[alias] if alias else None
+
+
+def get_cache_key(token_key: str) -> str:
+    return f"auth-token:{token_key}"
+
+
+def get_generation_key(token_key: str) -> str:
+    return f"auth-token:{token_key}:generation"
+
+
+def get_generation(shared_cache, token_key: str) -> int:
+    """Return the generation of a token in the shared cache
+
+    Entries store the generation read before the database, and an entry of
+    an older generation is a miss, so a user read before an invalidation
+    is never served after it.
+    """
+    key = get_generation_key(token_key)
+    generation = shared_cache.get(key)
+    if generation is None:
+        shared_cache.add(key, time.time_ns(), None)
+        generation = shared_cache.get(key, time.time_ns())
+    return generation
+
+
+def to_cached_user(user) -> tuple:
+    """Return the database alias and field values of a user to cache"""
+    return user._state.db, tuple(
+        getattr(user, field.attname) for field in user._meta.concrete_fields
+    )
+
+
+def from_cached_user(cached: tuple):
+    """Return a new user instance built from its cached field values"""
+    db, values = cached
+    model = get_user_model()
+    field_names = [field.attname for field in model._meta.concrete_fields]
+    return model.from_db(db, field_names, values)
+
+
+def invalidate_tokens(*token_keys: str) -> None:
+    """Drop the cached users of the tokens in this process and shared cache
+
+    Other processes keep their local entry until TOKEN_AUTH_CACHE_TTL runs
+    out, so that TTL bounds how long a revoked token still works there.
+
+    Args:
+        token_keys (str): keys of the tokens to drop
+    """
+    cache_keys = [get_cache_key(token_key) for token_key in token_keys]
+    for cache_key in cache_keys:
+        local_token_cache.delete(cache_key)
+    shared_cache = get_shared_cache()
+    if shared_cache is None:
+        return
+    for token_key in token_keys:
+        key = get_generation_key(token_key)
+        try:
+            shared_cache.incr(key)
+        except ValueError:
+            shared_cache.set(key, time.time_ns(), None)
+    shared_cache.delete_many(cache_keys)
+
+
+def get_local_token_user(request) -> tuple:
+    """Return the user and key of the request token from the local cache
+
+    Reads neither the database nor the shared cache, for code running on
+    the event loop.
+
+    Returns:
+        tuple: a new user and the token key, the user is None when the token
+        is not in the local cache
+    """
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b"token":
+        return None, None
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        return None, None
+    cached = local_token_cache.get(get_cache_key(key))
+    if cached is None:
+        return None, key
+    return from_cached_user(cached), key
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication with the token user cached
+    A hit in the local LRU or the shared cache authenticates the request
+    without a database query. Only active users are cached, and the
+    entries are dropped when the token is deleted or the user is saved.
+    The caches hold the field values of the user, and every request gets
+    a new instance built from them.
+    """
+
+    def authenticate_credentials(self, key: str) -> tuple:
+        cache_key = get_cache_key(key)
+        cached = local_token_cache.get(cache_key)
+        if cached is not None:
+            return from_cached_user(cached), key
+        version = local_token_cache.version
+
+        shared_cache = get_shared_cache()
+        if shared_cache is not None:
+            generation_key = get_generation_key(key)
+            entries = shared_cache.get_many([generation_key, cache_key])
+            generation = entries.get(generation_key)
+            entry = entries.get(cache_key)
+            if generation is None:
+                generation = get_generation(shared_cache, key)
+            elif entry is not None and entry[0] == generation:
+                cached = entry[1]
+
+        if cached is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related("user").get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed("Invalid token.")
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(
+                    "User inactive or deleted."
+                )
+            cached = to_cached_user(token.user)
+            if shared_cache is not None:
+                shared_cache.set(
+                    cache_key,
+                    (generation, cached),
+                    settings.TOKEN_AUTH_SHARED_CACHE_TTL,
+                )
+
+        local_token_cache.set(
+            cache_key,
+            cached,
+            settings.TOKEN_AUTH_CACHE_TTL,
+            settings.TOKEN_AUTH_CACHE_SIZE,
+            version=version,
+        )
+        return from_cached_user(cached), key
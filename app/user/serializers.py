@@ -1,8 +1,10 @@
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework import serializers
 
+from core.metrics import TimedSerializerMixin
 
-class UserSerializer(serializers.ModelSerializer):
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the users object"""
 
     class Meta:
@@ -26,7 +28,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class AuthTokenSerializer(serializers.Serializer):
+class AuthTokenSerializer(TimedSerializerMixin, serializers.Serializer):
     """Serializer for the user authentication object"""
 
     username = serializers.CharField()
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from user.authentication import invalidate_tokens
+
+
+@receiver(post_delete, sender=Token)
+def post_delete_token_receiver(sender, instance: Token, **kwargs) -> None:
+    """
+    Drop the cached user of a deleted token
+    """
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def post_save_user_receiver(sender, instance, created, **kwargs) -> None:
+    """
+    Drop the cached users of the tokens of a changed or deactivated user
+    """
+    if not created:
+        invalidate_tokens(
+            *Token.objects.filter(user=instance).values_list("key", flat=True)
+        )
@@ -0,0 +1,183 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.utils import sample_bank, sample_account, sample_user
+from user import authentication
+from user.authentication import (
+    CachedTokenAuthentication,
+    LocalTTLCache,
+    local_token_cache,
+)
+
+
+BANK_LIST_URL = reverse("bank:bank-list")
+
+
+def bank_account_list_url(bank_id: str):
+    """Return the account list URL for a bank"""
+    return reverse("bank:bank-account-list", args=[bank_id])
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test the token to user cache of the token authentication"""
+
+    def setUp(self) -> None:
+        local_token_cache.clear()
+        cache.clear()
+        self.user = sample_user()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_bank_list_queries(self):
+        """Test the token lookup query runs only on the first request"""
+        sample_bank()
+
+        with self.assertNumQueries(2):
+            self.client.get(BANK_LIST_URL)
+        with self.assertNumQueries(0):
+            res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_bank_account_list_queries(self):
+        """Test a cached token saves the token query of the account list"""
+        bank = sample_bank()
+        sample_account(bank=bank)
+        url = bank_account_list_url(str(bank.uuid))
+
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            res = self.client.get(url)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_invalid_token(self):
+        """Test an unknown token is rejected and not cached"""
+        self.client.credentials(HTTP_AUTHORIZATION="Token invalid")
+
+        res_1 = self.client.get(BANK_LIST_URL)
+        res_2 = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res_1.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res_2.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidated(self):
+        """Test a deleted token stops authenticating"""
+        self.client.get(BANK_LIST_URL)
+        self.token.delete()
+
+        res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        """Test the token of a deactivated user stops authenticating"""
+        self.client.get(BANK_LIST_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE="default")
+    def test_shared_cache(self):
+        """Test a token cached by another process runs no token query"""
+        self.client.get(BANK_LIST_URL)
+        local_token_cache.clear()
+
+        with self.assertNumQueries(0):
+            res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE="default")
+    def test_shared_cache_invalidated(self):
+        """Test a deleted token is dropped from the shared cache"""
+        self.client.get(BANK_LIST_URL)
+        self.token.delete()
+        local_token_cache.clear()
+
+        res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE="default")
+    def test_new_user_per_request(self):
+        """Test every request gets its own user instance"""
+        auth = CachedTokenAuthentication()
+        user_1, _ = auth.authenticate_credentials(self.token.key)
+        user_1.first_name = "changed"
+        user_2, _ = auth.authenticate_credentials(self.token.key)
+        local_token_cache.clear()
+        user_3, _ = auth.authenticate_credentials(self.token.key)
+
+        self.assertIsNot(user_1, user_2)
+        self.assertEqual(user_2.pk, self.user.pk)
+        self.assertNotEqual(user_2.first_name, "changed")
+        self.assertNotEqual(user_3.first_name, "changed")
+        self.assertFalse(user_2._state.adding)
+
+    def delete_token_while_caching(self):
+        """Patch the cache write so the token is deleted just before it"""
+        to_cached_user = authentication.to_cached_user
+
+        def delete_then_cache(user):
+            self.token.delete()
+            return to_cached_user(user)
+
+        return patch.object(
+            authentication, "to_cached_user", side_effect=delete_then_cache
+        )
+
+    def test_local_cache_not_stale(self):
+        """Test a user read before its token was deleted is not cached"""
+        with self.delete_token_while_caching():
+            self.client.get(BANK_LIST_URL)
+
+        res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_AUTH_SHARED_CACHE="default")
+    def test_shared_cache_not_stale(self):
+        """Test a shared entry written after its token was deleted is unused"""
+        with self.delete_token_while_caching():
+            self.client.get(BANK_LIST_URL)
+        local_token_cache.clear()
+
+        res = self.client.get(BANK_LIST_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LocalTTLCacheTests(TestCase):
+    """Test the in process LRU cache"""
+
+    def test_least_recently_used_evicted(self):
+        """Test the least recently used entry is evicted when full"""
+        lru = LocalTTLCache()
+        lru.set("a", 1, ttl=60, max_size=2)
+        lru.set("b", 2, ttl=60, max_size=2)
+        lru.get("a")
+        lru.set("c", 3, ttl=60, max_size=2)
+
+        self.assertEqual(lru.get("a"), 1)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("c"), 3)
+
+    def test_expired_entry(self):
+        """Test an entry is gone after its TTL"""
+        lru = LocalTTLCache()
+        lru.set("a", 1, ttl=0, max_size=2)
+
+        self.assertIsNone(lru.get("a"))